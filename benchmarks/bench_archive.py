@@ -0,0 +1,58 @@
+'''
+Benchmark of the sounding archive: reading N soundings from JSON files (load_json_data + extract_data)
+against opening them from an archive (array views), and a location/time query over the index.
+The soundings are copies of the example sounding with shifted locations and reference times.
+
+Usage: python benchmarks/bench_archive.py [n_soundings]
+'''
+
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src import load_json_data, extract_data, build_archive, SoundingArchive
+from src.data_processing import ATTRIBUTES
+from suite import write_soundings
+
+
+def main(n=500):
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'json')
+        os.makedirs(source)
+        write_soundings(load_json_data('data/windy_sounding_example.json'), source, n)
+        filepaths = sorted(os.path.join(source, name) for name in os.listdir(source))
+
+        start = perf_counter()
+        build_archive([source], os.path.join(directory, 'archive'))
+        build_time = perf_counter() - start
+
+        start = perf_counter()
+        for filepath in filepaths:
+            extract_data(load_json_data(filepath), ATTRIBUTES)
+        json_time = perf_counter() - start
+
+        start = perf_counter()
+        archive = SoundingArchive(os.path.join(directory, 'archive'))
+        open_time = perf_counter() - start
+        start = perf_counter()
+        for key in archive.keys():
+            archive.get(key)
+        get_time = perf_counter() - start
+
+        properties = archive.properties(0)
+        start = perf_counter()
+        matches = archive.query(properties['lat'], properties['lon'], 50, start=properties['syn_timestamp'] - 7 * 86400)
+        query_time = perf_counter() - start
+
+    print(f'\n{n} soundings, archive built in {build_time:.2f} s')
+    print(f'JSON load + extract  {json_time / n * 1e6:10.1f} us per sounding')
+    print(f'archive get (views)  {get_time / n * 1e6:10.1f} us per sounding  (open {open_time * 1e3:.2f} ms) '
+          f'-> speedup {json_time / get_time:.0f}x')
+    print(f'query 50 km / 7 days {query_time * 1e3:10.3f} ms  ({len(matches)} matches, data blocks untouched)')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
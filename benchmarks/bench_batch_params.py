@@ -0,0 +1,78 @@
+'''
+Benchmark of the batched parameter calculation: batch_calc_params over N synthetic soundings against
+looping calc_params, per-sounding cost and the maximum deviation of every table column from calc_params.
+The synthetic soundings (warmed and moistened variants of the example sounding) are generated on the levels
+of the batch grid, so both calculations see the same data and the deviations show the numerics only.
+
+Usage: python benchmarks/bench_batch_params.py [n_soundings] [n_reference]
+'''
+
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from src import load_json_data, process_sounding, calc_params, batch_calc_params
+from src.batched import TABLE_COLUMNS, pressure_grid
+from src.units import units
+
+
+def synthetic_soundings(extracted_data, grid, n, seed=0):
+    # example sounding on the grid levels, warmed and moistened near the ground to create CAPE
+    rng = np.random.default_rng(seed)
+    pres = extracted_data['pressure'].m_as('hPa')
+    levels = grid[(grid <= pres[0]) & (grid >= pres[-1])]
+    log_levels, log_pres = np.log(levels), np.log(pres[::-1])
+    temp = np.interp(log_levels, log_pres, extracted_data['temp'].m_as('K')[::-1])
+    dew = np.interp(log_levels, log_pres, extracted_data['dewpoint'].m_as('K')[::-1])
+    weight = np.clip((levels - 500) / (levels[0] - 500), 0, 1) # perturbation decreases to 0 at 500 hPa
+    for _ in range(n):
+        warm = temp + rng.uniform(0, 12) * weight
+        moist = np.minimum(dew + rng.uniform(0, 12) * weight, warm)
+        yield {'pressure': levels * units.hPa, 'temp': warm * units.K, 'dewpoint': moist * units.K}
+
+
+def table_row(params):
+    # calc_params in the units of the batch table
+    points, cape_cin, indices = params['points'], params['cape_cin'], params['indices']
+    values = [points['LCL'][0].m_as('hPa'), points['LCL'][1].m_as('K'), points['LFC'][0].m_as('hPa'),
+              points['EL'][0].m_as('hPa'), cape_cin['CAPE'].m_as('J/kg'), cape_cin['CIN'].m_as('J/kg'),
+              indices['Lifted Index'].m, indices['K Index'].m_as('degC'), indices['Total Totals Index'].m,
+              indices['Showalter Index'].m]
+    return [float(np.squeeze(value)) for value in values]
+
+
+def main(n=10000, n_reference=50):
+    config = load_json_data()
+    extracted_data, _ = process_sounding(load_json_data(config['sounding_file']), config)
+    batch_config = config['batch_params']
+    grid = pressure_grid(batch_config['pressure_range'], batch_config['levels'])
+
+    soundings = list(synthetic_soundings(extracted_data, grid, n))
+    start = perf_counter()
+    table = batch_calc_params(soundings, config)
+    batch_time = perf_counter() - start
+
+    start = perf_counter()
+    reference = np.array([table_row(calc_params(sounding, wet_bulb='vectorized')) for sounding in soundings[:n_reference]])
+    loop_time = (perf_counter() - start) / n_reference
+
+    print(f'\n{n} soundings with {len(soundings[0]["pressure"])} levels, chunks of {batch_config["chunk_size"]}')
+    print(f'batch_calc_params  {batch_time:8.3f} s total  {batch_time / n * 1e6:10.1f} us per sounding')
+    print(f'calc_params loop   {loop_time * n:8.3f} s total  {loop_time * 1e6:10.1f} us per sounding '
+          f'(extrapolated from {n_reference})  -> speedup {loop_time * n / batch_time:.0f}x')
+
+    print(f'\nmax |batch - calc_params| over {n_reference} soundings:')
+    for column, expected in zip(TABLE_COLUMNS, reference.T):
+        result = table[column][:n_reference]
+        if not np.array_equal(np.isnan(result), np.isnan(expected)):
+            print(f'{column:20s} defined/undefined mismatch in {np.count_nonzero(np.isnan(result) != np.isnan(expected))} soundings')
+            continue
+        valid = ~np.isnan(expected)
+        print(f'{column:20s} {np.max(np.abs(result[valid] - expected[valid]), initial=0.0):.3e}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,71 @@
+'''
+Benchmark of the adaptive vertical decimation (decimate_extracted_data) on synthetic high-resolution soundings
+(see suite.py): levels before and after, compression ratio, time of the decimation itself, the largest
+interpolation error of every field against the full sounding, the change of CAPE, CIN and lifted index,
+and the time of calc_params (all params) and rendering with and without decimation.
+
+Usage: python benchmarks/bench_decimation.py [levels ...]
+'''
+
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from src import (load_json_data, extract_data, clean_extracted_data, add_units, calc_params, decimate_extracted_data,
+                 decimation_effect, render_bytes)
+from src.data_processing import ATTRIBUTES
+from suite import synthetic_sounding
+
+
+def max_errors(full, decimated):
+    # largest deviation of the decimated sounding, interpolated linearly in log-pressure, from the full sounding
+    log_full, log_decimated = np.log(full['pressure'][::-1]), np.log(decimated['pressure'][::-1])
+    return {key: float(np.max(np.abs(np.interp(log_full, log_decimated, decimated[key][::-1]) - full[key][::-1])))
+            for key in ['temp', 'dewpoint', 'wind_u', 'wind_v', 'gpheight']}
+
+
+def pipeline_time(data, config):
+    # all params and a rendered image, the template is built before
+    extracted_data = add_units(data)
+    start = perf_counter()
+    params = calc_params(extracted_data, 'vectorized', config['calculation']['backend']).evaluate()
+    calc_time = perf_counter() - start
+    image = render_bytes(extracted_data, params, config)
+    return calc_time, image['render_s']
+
+
+def main(sizes=(1000, 5000, 20000)):
+    config = load_json_data()
+    config['decimation'].update(enabled=True, min_levels=0)
+    render_bytes(*calc_example(config), config) # builds the figure template
+
+    for levels in sizes:
+        data = clean_extracted_data(extract_data(synthetic_sounding(levels), ATTRIBUTES), config)
+        start = perf_counter()
+        decimated, report = decimate_extracted_data(data, config, return_report=True)
+        decimate_time = perf_counter() - start
+
+        print(f'\n{report["levels_before"]} levels -> {report["levels_after"]} levels '
+              f'(compression {report["compression_ratio"]:.1f}x, {report["inversion_levels"]} inversion and '
+              f'{report["hodograph_levels"]} hodograph levels kept) in {decimate_time * 1000:.1f} ms')
+        print('  max error: ' + ', '.join(f'{key} {error:.2f}' for key, error in max_errors(data, decimated).items()))
+        print('  ' + ', '.join(f'{name} {before:.2f} -> {after:.2f}'
+                               for name, (before, after) in decimation_effect(data, decimated, config).items()))
+        full_calc, full_render = pipeline_time(data, config)
+        decimated_calc, decimated_render = pipeline_time(decimated, config)
+        print(f'  calc_params {full_calc * 1000:8.1f} ms -> {decimated_calc * 1000:7.1f} ms   '
+              f'render {full_render * 1000:7.1f} ms -> {decimated_render * 1000:7.1f} ms')
+
+
+def calc_example(config):
+    data = add_units(clean_extracted_data(extract_data(load_json_data(config['sounding_file']), ATTRIBUTES), config))
+    return data, calc_params(data, 'vectorized', config['calculation']['backend'])
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (1000, 5000, 20000))
@@ -0,0 +1,75 @@
+'''
+Benchmark of the ensemble overlay (display_ensemble): time to build and save the figure (PNG in memory,
+including the batched parcel traces, envelopes and summary table) for a growing number of members,
+against the single-sounding figure (display_sounding) and a naive overlay with one skew.plot line per
+member and trace. The members are perturbed copies of the example sounding on 100 levels.
+
+Usage: python benchmarks/bench_ensemble.py [n_members ...]
+'''
+
+import os
+import sys
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from metpy.plots import SkewT
+import numpy as np
+from src import load_json_data, process_sounding, display_sounding, display_ensemble, calc_ensemble
+from suite import members, measure
+
+
+def save(fig):
+    buffer = BytesIO()
+    fig.savefig(buffer, format='png', dpi=100)
+    return buffer
+
+
+def naive_overlay(soundings, config, fig):
+    # one Line2D per member and trace, parcel traces from the same batched calculation
+    ensemble = calc_ensemble(soundings, config)
+    skew = SkewT(fig, rotation=45)
+    for row, sounding in enumerate(soundings):
+        pres = sounding['pressure'].m_as('hPa')
+        skew.plot(pres, sounding['temp'].m_as('degC'), 'red', lw=0.8, alpha=0.3)
+        skew.plot(pres, sounding['dewpoint'].m_as('degC'), 'blue', lw=0.8, alpha=0.3)
+        skew.plot(ensemble['pressure'][row], ensemble['parcel'][row] - 273.15, 'k', ls='--', lw=0.8, alpha=0.3)
+    skew.plot_dry_adiabats(lw=1, linestyle='solid', colors='darkgreen', alpha=0.4)
+    skew.plot_moist_adiabats(lw=1, linestyle='dashed', colors='darkgreen', alpha=0.4)
+    skew.plot_mixing_lines(lw=1, linestyle='dashed', colors='darkblue', alpha=0.4)
+    skew.ax.set_xlim(config['skewt']['xlim'])
+    skew.ax.set_ylim(config['skewt']['ylim'])
+
+
+def timing(draw, config, repeats=5):
+    def draw_and_save():
+        fig = Figure(figsize=tuple(config['figsize']))
+        FigureCanvasAgg(fig)
+        draw(fig)
+        save(fig)
+    return np.median(measure(draw_and_save, repeats, 0, repeats))
+
+
+def main(sizes=(1, 10, 50, 100)):
+    config = load_json_data()
+    windy_sounding = load_json_data(config['sounding_file'])
+    extracted_data, params = process_sounding(windy_sounding, config)
+    print('\n100 levels per member')
+
+    baseline = timing(lambda fig: display_sounding(extracted_data, config, params, fig, windy_sounding['properties']), config)
+    print(f'{"single sounding":24s} {baseline * 1000:8.1f} ms')
+
+    for n in sizes:
+        soundings = list(members(extracted_data, n))
+        overlay = timing(lambda fig: display_ensemble(soundings, config, fig), config)
+        naive = timing(lambda fig: naive_overlay(soundings, config, fig), config)
+        print(f'{f"{n} members":24s} {overlay * 1000:8.1f} ms ({overlay / baseline:4.2f}x single)   '
+              f'naive lines {naive * 1000:8.1f} ms ({naive / overlay:4.1f}x overlay, without envelopes and table)')
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (1, 10, 50, 100))
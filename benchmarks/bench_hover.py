@@ -0,0 +1,75 @@
+'''
+Benchmark of the hover handling of the sounding properties: time per mouse move of the HoverTexts
+dispatcher (bounding box hit test, blitting on enter/leave only) against the previous handler, which
+hit-tested every text with text.contains and redrew the whole figure for every text on every move.
+The mouse moves over the properties panel, the skew-t and back; two properties are long enough to be shortened.
+
+Usage: python benchmarks/bench_hover.py [n_events]
+'''
+
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backend_bases import MouseEvent
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+from src import load_json_data, process_sounding, display_skewt_plot, display_parameters
+from suite import mouse_path
+
+
+def previous_on_hover(fig, text_elements, event):
+    # hover handler of display_parameters before the dispatcher
+    for text, full_text, short_text in text_elements:
+        if text.contains(event)[0]:
+            text.set_text(full_text)
+            fig.canvas.draw_idle()
+        else:
+            text.set_text(short_text)
+            fig.canvas.draw_idle()
+
+
+def main(n=200):
+    config = load_json_data()
+    windy_sounding = load_json_data(config['sounding_file'])
+    extracted_data, params = process_sounding(windy_sounding, config)
+    properties = dict(windy_sounding['properties'], origin_member='20241004_1200_member_17_of_50.gz',
+                      channel='NOAA MADIS global radiosonde feed')
+
+    results = {}
+    for name in ['previous handler', 'HoverTexts']:
+        fig = Figure(figsize=tuple(config['figsize']))
+        canvas = FigureCanvasAgg(fig)
+        gs = fig.add_gridspec(10, 15)
+        display_skewt_plot(extracted_data, config, params, fig, gs[:, 0:10])
+        hover_texts = display_parameters(config, params, fig, properties)
+        text_elements = [(text, overlay.get_text(), short_text) for text, short_text, overlay in hover_texts.elements]
+
+        timings, transitions = [], 0
+        for x, y in mouse_path(fig, hover_texts, n):
+            event = MouseEvent('motion_notify_event', canvas, x, y)
+            active = hover_texts.active
+            start = perf_counter()
+            if name == 'HoverTexts':
+                hover_texts.on_move(event)
+            else:
+                previous_on_hover(fig, text_elements, event)
+            timings.append(perf_counter() - start)
+            transitions += hover_texts.active != active
+        results[name] = (timings, transitions)
+
+    print(f'\nPer mouse move over {n} events ({len(text_elements)} shortened texts):')
+    baseline = np.median(results['previous handler'][0])
+    for name, (timings, transitions) in results.items():
+        print(f'{name:18s} median {np.median(timings) * 1000:8.3f} ms   max {np.max(timings) * 1000:8.2f} ms   '
+              f'mean {np.mean(timings) * 1000:8.3f} ms   speedup {baseline / np.median(timings):7.0f}x'
+              + (f'   ({transitions} enter/leave transitions)' if name == 'HoverTexts' else ''))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
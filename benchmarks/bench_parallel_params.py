@@ -0,0 +1,44 @@
+'''
+Benchmark of the parallel evaluation of the params (LazyParams.evaluate_parallel): wall time of all params
+calculated serially (evaluate) and with 2, 4, ... threads, with the per-level profiles split into chunks, on
+synthetic high-resolution soundings (see suite.py), and the largest difference of any value to the serial
+calculation. The speedup depends on the number of cores (printed first), evaluate_parallel never starts more
+threads than cores and falls back to the serial calculation on a single core.
+
+Usage: python benchmarks/bench_parallel_params.py [levels ...]
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from src import load_json_data, extract_data, clean_extracted_data, add_units, compare_parallel
+from src.data_processing import ATTRIBUTES
+from suite import synthetic_sounding
+
+
+def main(sizes=(1000, 5000, 20000), repeats=5):
+    config = load_json_data()
+    calculation = config['calculation']
+    options = {'wet_bulb': calculation['wet_bulb'], 'backend': calculation['backend']}
+    chunk_levels = calculation['parallel']['chunk_levels']
+    print(f'\n{os.cpu_count()} cores, backend {options["backend"]}, wet-bulb {options["wet_bulb"]}, '
+          f'chunks of at least {chunk_levels} levels')
+
+    for levels in sizes:
+        extracted_data = add_units(clean_extracted_data(extract_data(synthetic_sounding(levels), ATTRIBUTES), config))
+        print(f'{len(extracted_data["pressure"])} levels')
+        for workers in (2, 4, 8):
+            comparisons = [compare_parallel(extracted_data, **options, workers=workers, chunk_levels=chunk_levels)
+                           for _ in range(repeats)]
+            serial = np.median([comparison['serial_s'] for comparison in comparisons])
+            parallel = np.median([comparison['parallel_s'] for comparison in comparisons])
+            max_difference = max(comparison['max_difference'] for comparison in comparisons)
+            print(f'  {workers} threads ({comparisons[0]["workers"]} used)   serial {serial * 1000:8.1f} ms   parallel {parallel * 1000:8.1f} ms   '
+                  f'speedup {serial / parallel:5.2f}x   max difference {max_difference:.3g}')
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (1000, 5000, 20000))
@@ -0,0 +1,67 @@
+'''
+Benchmark of the interactive parcel tool: time per drag event (fast_parcel with the moist adiabat table
+plus blitting the parcel artists) on the example sounding and on a dense sounding, compared to lifting
+the same parcel with mpcalc.parcel_profile and mpcalc.cape_cin. 60 fps leave 16.7 ms per event.
+
+Usage: python benchmarks/bench_parcel_tool.py [n_events] [dense_levels]
+'''
+
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backend_bases import MouseEvent
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import metpy.calc as mpcalc
+import numpy as np
+from src import load_json_data, process_sounding, display_sounding, ParcelTool
+from src.units import units
+from suite import densify, drag_path
+
+
+
+def main(n=200, levels=5000):
+    config = load_json_data()
+    windy_sounding = load_json_data(config['sounding_file'])
+    extracted_data, params = process_sounding(windy_sounding, config)
+
+    print(f'\nPer drag event over {n} events:')
+    for name, data in [(f'example ({len(extracted_data["pressure"])} levels)', extracted_data),
+                       (f'dense ({levels} levels)', densify(extracted_data, levels))]:
+        fig = Figure(figsize=tuple(config['figsize']))
+        canvas = FigureCanvasAgg(fig)
+        skew = display_sounding(extracted_data, config, dict(params), fig)
+        tool = ParcelTool(skew, data, config)
+        canvas.draw()
+        tool._dragging = True
+
+        timings = []
+        for press, temp in drag_path(n):
+            x, y = skew.ax.transData.transform((temp, press))
+            event = MouseEvent('motion_notify_event', canvas, x, y, button=1)
+            start = perf_counter()
+            tool._on_move(event)
+            timings.append(perf_counter() - start)
+
+        pres, temp, dew = [data[key] for key in ['pressure', 'temp', 'dewpoint']]
+        reference = []
+        for press, start_temp in list(drag_path(n))[:10]:
+            above = pres.m <= press
+            start = perf_counter()
+            start_dew = np.interp(np.log(press), np.log(pres.m[::-1]), dew.m[::-1]) * dew.units
+            profile = mpcalc.parcel_profile(pres[above], start_temp * units.degC, min(start_dew, start_temp * units.degC))
+            mpcalc.cape_cin(pres[above], temp[above], dew[above], profile)
+            reference.append(perf_counter() - start)
+
+        median = np.median(timings)
+        print(f'{name:24s} parcel tool median {median * 1000:6.2f} ms ({1 / median:6.0f} events/s)   '
+              f'mpcalc lift + cape_cin median {np.median(reference) * 1000:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
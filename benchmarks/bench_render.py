@@ -0,0 +1,54 @@
+'''
+Benchmark of in-memory rendering (render_bytes) per render profile: median render time per image
+(after the first image, which builds the template), image size in pixels and encoded bytes,
+compared with the previous path of a new display_sounding figure saved with savefig.
+
+Usage: python benchmarks/bench_render.py [n_images]
+'''
+
+import os
+import sys
+from io import BytesIO
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+from src import load_json_data, process_sounding, display_sounding, render_bytes
+
+
+def main(n=20):
+    config = load_json_data()
+    windy_sounding = load_json_data(config['sounding_file'])
+    extracted_data, params = process_sounding(windy_sounding, config)
+    properties = windy_sounding.get('properties')
+
+    timings = []
+    for _ in range(max(n // 4, 3)):
+        start = perf_counter()
+        fig = Figure(figsize=tuple(config['figsize']))
+        FigureCanvasAgg(fig)
+        display_sounding(extracted_data, config, params, fig, properties)
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', dpi=100)
+        timings.append(perf_counter() - start)
+    baseline = np.median(timings)
+    print(f'\n{"new figure + savefig":22s} median {baseline * 1000:7.1f} ms   {len(buffer.getvalue()) / 1024:7.0f} KiB')
+
+    for profile in dict.fromkeys(['default', *config['render']['profiles']]):
+        first = render_bytes(extracted_data, params, config, 'png', profile, sounding_properties=properties)
+        images = [render_bytes(extracted_data, params, config, 'png', profile, sounding_properties=properties)
+                  for _ in range(n)]
+        render_time = np.median([image['render_s'] for image in images])
+        image = images[-1]
+        print(f'{profile:22s} median {render_time * 1000:7.1f} ms   {len(image["data"]) / 1024:7.0f} KiB   '
+              f'{image["width"]}x{image["height"]} px   first image {first["render_s"] * 1000:6.0f} ms   '
+              f'speedup {baseline / render_time:5.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
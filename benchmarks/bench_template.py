@@ -0,0 +1,68 @@
+'''
+Benchmark of the per-frame render time of SoundingFigureTemplate against building a new figure
+with display_sounding for every sounding (the path used by main.py and render_batch).
+
+Usage: python benchmarks/bench_template.py [n_frames]
+'''
+
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import numpy as np
+from src import load_json_data, process_sounding, display_sounding
+from src.template import SoundingFigureTemplate
+
+
+def frames(extracted_data, params, n):
+    # shifted copies of the sounding, so every frame has different data
+    for i in range(n):
+        shifted = dict(extracted_data)
+        shifted['temp'] = extracted_data['temp'] + (i % 5 - 2) * 0.5 * extracted_data['temp'].units
+        yield shifted, params
+
+
+def main(n=20):
+    config = load_json_data()
+    windy_sounding = load_json_data(config['sounding_file'])
+    extracted_data, params = process_sounding(windy_sounding, config)
+    properties = windy_sounding.get('properties')
+
+    def current_path(data, params):
+        fig = Figure(figsize=tuple(config['figsize']))
+        canvas = FigureCanvasAgg(fig)
+        display_sounding(data, config, {**params}, fig, properties)
+        canvas.draw()
+
+    results = {}
+    for name, template in [('template (full draw)', SoundingFigureTemplate(config, blit=False)),
+                           ('template (blit)', SoundingFigureTemplate(config, blit=True))]:
+        template.render(extracted_data, params, properties) # first frame builds the cached background
+        timings = []
+        for data, frame_params in frames(extracted_data, params, n):
+            start = perf_counter()
+            template.render(data, frame_params, properties)
+            timings.append(perf_counter() - start)
+        results[name] = timings
+
+    timings = []
+    for data, frame_params in frames(extracted_data, params, n):
+        start = perf_counter()
+        current_path(data, frame_params)
+        timings.append(perf_counter() - start)
+    results['display_sounding (new figure)'] = timings
+
+    print(f'\nPer-frame render time over {n} frames ({config["sounding_file"]}):')
+    baseline = np.median(results['display_sounding (new figure)'])
+    for name, timings in results.items():
+        print(f'{name:32s} median {np.median(timings) * 1000:8.1f} ms   speedup {baseline / np.median(timings):5.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
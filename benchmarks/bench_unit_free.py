@@ -0,0 +1,67 @@
+'''
+Benchmark of the unit-free calculation backend: calc_params(..., backend='fast') (float arrays in hPa and K,
+units attached to the results only) against backend='metpy' (metpy.calc on pint quantities), for the example
+sounding and for it interpolated to more levels. Prints the time of all params per backend, the time per
+parameter (instrumentation stages) and the maximum deviation of every parameter between the backends.
+
+Usage: python benchmarks/bench_unit_free.py [levels ...]
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+from src import load_json_data, process_sounding, calc_params, serialize_params, configure
+from suite import densify, measure
+
+
+
+def time_backend(extracted_data, backend, repeats):
+    return min(measure(lambda: calc_params(extracted_data, 'vectorized', backend).evaluate(), repeats, 0))
+
+
+def stage_times(extracted_data, backend):
+    instrumentation = configure({'instrumentation': {'enabled': True}})
+    calc_params(extracted_data, 'vectorized', backend).evaluate()
+    configure({})
+    return {record['stage'].split('/', 1)[1]: record['wall_s'] for record in instrumentation.records
+            if record['stage'].startswith('calc_params/')}
+
+
+def deviations(extracted_data):
+    metpy_params = serialize_params(calc_params(extracted_data, 'vectorized', 'metpy'), skip=())
+    fast_params = serialize_params(calc_params(extracted_data, 'vectorized', 'fast'), skip=())
+    result = {}
+    for category, values in metpy_params.items():
+        for name, value in values.items():
+            pairs = zip(value, fast_params[category][name]) if isinstance(value, list) else [(value, fast_params[category][name])]
+            diff = [np.abs(np.asarray(a['value'], dtype=float) - np.asarray(b['value'], dtype=float)) for a, b in pairs]
+            result[name] = max(float(np.nanmax(d, initial=0.0)) for d in diff)
+    return result
+
+
+def main(sizes=(0, 200, 1000)):
+    config = load_json_data()
+    config['cache']['enabled'] = False
+    extracted_data, _ = process_sounding(load_json_data(config['sounding_file']), config)
+
+    for levels in sizes:
+        data = densify(extracted_data, levels) if levels else extracted_data
+        name = f'{len(data["pressure"])} levels' + ('' if levels else ' (example)')
+        metpy_time = time_backend(data, 'metpy', 3)
+        fast_time = time_backend(data, 'fast', 10)
+        print(f'\n{name}: metpy {metpy_time * 1000:8.2f} ms   fast {fast_time * 1000:8.2f} ms   '
+              f'-> speedup {metpy_time / fast_time:.1f}x')
+
+        metpy_stages, fast_stages = stage_times(data, 'metpy'), stage_times(data, 'fast')
+        errors = deviations(data)
+        print(f'  {"node":34s} {"metpy ms":>9s} {"fast ms":>9s}')
+        for stage, wall_time in metpy_stages.items():
+            print(f'  {stage:34s} {wall_time * 1000:9.3f} {fast_stages.get(stage, np.nan) * 1000:9.3f}')
+        print(f'  max |fast - metpy|: ' + ', '.join(f'{name} {error:.1e}' for name, error in errors.items()))
+
+
+if __name__ == '__main__':
+    main(tuple(int(arg) for arg in sys.argv[1:]) or (0, 200, 1000))
@@ -0,0 +1,43 @@
+'''
+Benchmark of the wet-bulb temperature calculation: vectorized solver of src/thermo.py against
+mpcalc.wet_bulb_temperature on synthetic soundings of increasing size. The vectorized solver should
+scale linearly (constant time per level), the accuracy against MetPy is checked on every size MetPy runs.
+
+Usage: python benchmarks/bench_wet_bulb.py [max_metpy_levels]
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import metpy.calc as mpcalc
+from src import load_json_data, process_sounding, compare_wet_bulb_with_metpy
+from src import thermo
+from suite import densify, measure
+
+
+def timed(func, *args, repeat=3):
+    return min(measure(lambda: func(*args), repeat, 0))
+
+
+def main(max_metpy_levels=1000):
+    config = load_json_data()
+    extracted_data, _ = process_sounding(load_json_data(config['sounding_file']), config)
+
+    print(f'\n{"levels":>8s} {"vectorized":>12s} {"per level":>12s} {"metpy":>12s} {"speedup":>9s} {"max |ΔTw|":>11s}')
+    for levels in [100, 1000, 10000, 100000]:
+        data = densify(extracted_data, levels)
+        pres, temp, dew = data['pressure'].m_as('hPa'), data['temp'].m_as('K'), data['dewpoint'].m_as('K')
+        vectorized = timed(thermo.wet_bulb_temperature, pres, temp, dew)
+
+        metpy, speedup, deviation = '-', '-', '-'
+        if levels <= max_metpy_levels:
+            reference = timed(mpcalc.wet_bulb_temperature, data['pressure'], data['temp'], data['dewpoint'], repeat=1)
+            metpy, speedup = f'{reference * 1000:10.1f}ms', f'{reference / vectorized:8.0f}x'
+            deviation = f'{compare_wet_bulb_with_metpy(data)["Tw"]:.1e} K'
+        print(f'{levels:8d} {vectorized * 1000:10.2f}ms {vectorized / levels * 1e6:10.3f}us {metpy:>12s} {speedup:>9s} {deviation:>11s}')
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,450 @@
+'''
+Benchmark suite of the whole pipeline on synthetic windy.com soundings of 50, 500, 5 000 and 50 000 levels
+and on the example sounding: ingest, cleaning and decimation, wind level selection, calc_params (total per
+backend, in parallel and every parameter, recorded with src/instrumentation.py in separate runs so the totals
+are measured without its bookkeeping), the vectorized wet-bulb solver, the unit-free parcel, headless rendering
+(Agg) of every display_* function, in-memory rendering per render profile and with the figure template, hover
+and parcel tool events, batched params and the ensemble overlay of perturbed members, and the sounding archive.
+
+The standalone benchmarks/bench_*.py scripts compare these against their references (MetPy, a new figure per
+image, serial calculation, ...) and print accuracies; the fixtures they share are defined here.
+
+Every measurement is repeated (--min-repeats times, more within the --budget in seconds per measurement)
+and the minimum and median wall times are stored in .benchmarks/<timestamp>_<commit>.json together with
+the commit and the library versions. The run is compared offline with the latest stored run of another
+commit (or --baseline): a stage whose minimum time grew by more than --threshold (and more than --min-delta ms)
+is flagged as regression and the suite exits with status 1 (unless --no-fail).
+
+Usage: python benchmarks/suite.py [--sizes 50 500 5000 50000] [--stages ingest clean wind calc parcel render ...]
+                                  [--baseline FILE] [--threshold 0.3] [--no-save] [--no-fail]
+'''
+
+import argparse
+import contextlib
+import functools
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib import gridspec
+from matplotlib.backend_bases import MouseEvent
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.pyplot as plt
+import metpy
+import numpy as np
+from src import load_json_data, extract_data, clean_extracted_data, add_units, calc_params, read_sounding_columns, extract_columns
+from src import display_skewt_plot, display_hodograph_plot, display_parameters, display_sounding, plot_extracted_data
+from src import decimate_extracted_data, render_bytes, batch_calc_params, display_ensemble, build_archive, SoundingArchive
+from src import FastParcelAnalysis, MoistAdiabatTable, fast_parcel, ParcelTool
+from src import data_processing
+from src import thermo
+from src.data_processing import ATTRIBUTES
+from src.template import SoundingFigureTemplate
+from src.instrumentation import configure
+from src.units import units
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+RESULTS_DIR = os.path.join(ROOT, '.benchmarks')
+SIZES = [50, 500, 5000, 50000]
+STAGES = ['ingest', 'clean', 'wind', 'calc', 'parcel', 'render', 'interaction', 'ensemble', 'archive']
+EVENTS = 50 # mouse events per interaction measurement
+
+
+def synthetic_sounding(levels, seed=0):
+
+    '''
+    Function to build a windy.com FeatureCollection with the given number of levels: standard atmosphere
+    temperature with a tropopause, small-scale noise, a moist boundary layer and veering, increasing winds.
+    All levels lie within the default ranges of the config, so cleaning keeps every row.
+    '''
+
+    rng = np.random.default_rng(seed)
+    pressure = np.geomspace(1000, 150, levels)
+    height = 44330.8 * (1 - (pressure / 1013.25) ** 0.190263) # standard atmosphere
+    temp = np.maximum(288.15 - 0.0065 * height, 216.65) + 1.5 * np.sin(height / 1500) + rng.normal(0, 0.2, levels)
+    depression = 1 + 25 * (1 - pressure / 1000) + np.abs(rng.normal(0, 1, levels))
+    dewpoint = temp - depression
+    speed = 5 + 30 * (1 - pressure / 1000)
+    direction = np.radians(180 + 90 * (1 - pressure / 1000))
+    wind_u, wind_v = -speed * np.sin(direction), -speed * np.cos(direction)
+    lon, lat, start = 10.3772, 50.5617, 1728038700
+
+    features = [{
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [lon + i * 1e-5, lat + i * 1e-5, float(round(height[i], 1))]},
+        'properties': {
+            'pressure': float(round(pressure[i], 3)), 'temp': float(round(temp[i], 2)), 'dewpoint': float(round(dewpoint[i], 2)),
+            'gpheight': float(round(height[i], 1)), 'wind_u': float(round(wind_u[i], 2)), 'wind_v': float(round(wind_v[i], 2)),
+            'time': start + int(i * 5400 / levels), 'flags': 0
+        }
+    } for i in range(levels)]
+    return {'type': 'FeatureCollection', 'features': features,
+            'properties': {'lon': lon, 'lat': lat, 'elevation': 110.0, 'station_id': 'synthetic', 'path_source': 'synthetic'}}
+
+
+def densify(extracted_data, levels):
+
+    '''
+    Function to interpolate a sounding (linear in log pressure) to levels log-spaced levels between its bottom
+    and top, like high resolution radiosonde data. Returns pressure, temperature and dewpoint in their units.
+    '''
+
+    pres = extracted_data['pressure'].m_as('hPa')
+    dense = np.geomspace(pres[0], pres[-1], levels)
+    data = {'pressure': dense * units.hPa}
+    for key in ['temp', 'dewpoint']:
+        values = extracted_data[key]
+        data[key] = units.Quantity(np.interp(np.log(dense), np.log(pres[::-1]), values.m[::-1]), values.units)
+    return data
+
+
+def members(extracted_data, n, levels=100, seed=0):
+
+    '''
+    Function to generate ensemble members: the sounding interpolated onto levels log-spaced levels with smooth
+    random temperature and moisture perturbations, largest near the ground.
+    '''
+
+    rng = np.random.default_rng(seed)
+    raw = extracted_data['pressure'].m_as('hPa')
+    pres = np.geomspace(raw[0], raw[-1], levels)
+    temp, dew = [np.interp(np.log(pres), np.log(raw[::-1]), extracted_data[key].m_as('degC')[::-1])
+                 for key in ['temp', 'dewpoint']]
+    weight = np.clip((pres - 300) / (pres[0] - 300), 0, 1)
+    for _ in range(n):
+        phase = rng.uniform(0, 2 * np.pi)
+        wave = np.sin(np.log(pres) * 6 + phase)
+        warm = temp + rng.normal(0, 2) * weight + wave * rng.uniform(0, 1.5)
+        moist = np.minimum(dew + rng.normal(0, 3) * weight + wave * rng.uniform(0, 2), warm)
+        yield {'pressure': pres * units.hPa, 'temp': warm * units.degC, 'dewpoint': moist * units.degC}
+
+
+def write_soundings(windy_sounding, directory, n, seed=0):
+    # n copies of a windy.com sounding as JSON files, scattered by up to 5 degrees and 60 days
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    properties = windy_sounding['properties']
+    for i in range(n):
+        moved = dict(properties, lat=properties['lat'] + rng.uniform(-5, 5), lon=properties['lon'] + rng.uniform(-5, 5))
+        if 'syn_timestamp' in properties:
+            moved['syn_timestamp'] = properties['syn_timestamp'] - int(rng.integers(0, 60)) * 86400
+        with open(os.path.join(directory, f'sounding_{i:05d}.json'), 'w') as f:
+            json.dump(dict(windy_sounding, properties=moved), f)
+
+
+def drag_path(n):
+    # cursor positions (pressure in hPa, temperature in degC) of a parcel tool drag through the lower troposphere
+    return zip(np.linspace(950, 700, n), np.linspace(15, -5, n))
+
+
+def mouse_path(fig, hover_texts, n):
+    # display coordinates of a mouse move over the shortened parameter texts, the skew-t and back
+    fig.canvas.draw()
+    targets = [box.get_points().mean(axis=0) for box, _, _ in hover_texts._boxes]
+    waypoints = np.array([targets[0], [fig.bbox.width * 0.4, fig.bbox.height * 0.5], targets[-1], targets[0]])
+    steps = np.linspace(0, len(waypoints) - 1, n)
+    return np.column_stack([np.interp(steps, np.arange(len(waypoints)), waypoints[:, i]) for i in range(2)])
+
+
+@functools.lru_cache
+def moist_adiabat_table():
+    # built once per run, as the parcel tool does once per figure
+    return MoistAdiabatTable()
+
+
+def measure(func, min_repeats, budget, max_repeats=50):
+
+    '''
+    Function to time func() repeatedly: min_repeats times, then until budget seconds are used
+    or max_repeats is reached (the minimum filters out first-call effects like font caching).
+
+    Returns
+    -------
+    list(float) : Wall times in seconds.
+    '''
+
+    timings = []
+    while len(timings) < max_repeats:
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+        if len(timings) >= min_repeats and sum(timings) >= budget:
+            break
+    return timings
+
+
+def result_entry(timings):
+    return {'min_ms': min(timings) * 1000, 'median_ms': float(np.median(timings)) * 1000, 'repeats': len(timings)}
+
+
+def render(draw):
+    # render on a new headless figure, including the Agg draw
+    fig = Figure(figsize=(15, 10))
+    canvas = FigureCanvasAgg(fig)
+    draw(fig)
+    canvas.draw()
+
+
+def bench_case(name, filepath, config, stages, min_repeats, budget):
+
+    '''
+    Function to run the benchmarks of one sounding file.
+
+    Returns
+    -------
+    dict : '<case>/<stage>/<function>' -> result_entry.
+    '''
+
+    results = {}
+
+    def record(stage, func):
+        results[f'{name}/{stage}'] = result_entry(measure(func, min_repeats, budget))
+        print(f'{name + "/" + stage:58s} {results[f"{name}/{stage}"]["min_ms"]:12.2f} ms  (x{results[f"{name}/{stage}"]["repeats"]})')
+
+    # data of the later stages, calculated once
+    windy_sounding = load_json_data(filepath)
+    raw = extract_data(windy_sounding, ATTRIBUTES)
+    cleaned = clean_extracted_data(raw, config)
+    extracted_data = add_units(cleaned)
+
+    if 'ingest' in stages:
+        record('ingest/load_json_data', lambda: load_json_data(filepath))
+        record('ingest/extract_data', lambda: extract_data(windy_sounding, ATTRIBUTES))
+        record('ingest/read_sounding_columns', lambda: extract_columns(read_sounding_columns(filepath, ATTRIBUTES)[0], ATTRIBUTES))
+    if 'clean' in stages:
+        record('clean/clean_extracted_data', lambda: clean_extracted_data(raw, config))
+        record('clean/add_units', lambda: add_units(cleaned))
+        decimation = {**config, 'decimation': {**config.get('decimation', {}), 'enabled': True, 'min_levels': 0}}
+        record('clean/decimate_extracted_data', lambda: decimate_extracted_data(cleaned, decimation))
+    if 'wind' in stages:
+        record('wind/extract_relevant_wind_data', lambda: data_processing.extract_relevant_wind_data(extracted_data, config))
+
+    calculation = config.get('calculation', {})
+    options = {'wet_bulb': calculation.get('wet_bulb', 'metpy'), 'backend': calculation.get('backend', 'metpy')}
+    params = calc_params(extracted_data, **options).evaluate()
+    pres, temp, dew = [extracted_data[key].m_as(unit) for key, unit in [('pressure', 'hPa'), ('temp', 'K'), ('dewpoint', 'K')]]
+    properties = windy_sounding.get('properties')
+
+    if 'calc' in stages:
+        # totals with the instrumentation disabled, the stage bookkeeping is not part of the measured time
+        configure({})
+        other = 'fast' if options['backend'] == 'metpy' else 'metpy'
+        parallel = calculation.get('parallel', {})
+        record('calc/calc_params', lambda: calc_params(extracted_data, **options).evaluate())
+        record(f'calc/calc_params_{other}', lambda: calc_params(extracted_data, options['wet_bulb'], other).evaluate())
+        record('calc/evaluate_parallel', lambda: calc_params(extracted_data, **options).evaluate_parallel(
+            workers=parallel.get('workers') or 2, chunk_levels=parallel.get('chunk_levels', 500)))
+        record('calc/wet_bulb_temperature', lambda: thermo.wet_bulb_temperature(pres, temp, dew))
+
+        # calc_params is lazy, every node of the params graph is recorded as stage of the instrumentation when
+        # evaluated, in separate runs
+        instrumentation = configure({'instrumentation': {'enabled': True}})
+        for _ in range(min_repeats):
+            calc_params(extracted_data, **options).evaluate()
+        per_parameter = {}
+        for entry in instrumentation.records:
+            if entry['stage'].startswith('calc_params/'):
+                per_parameter.setdefault(entry['stage'].split('/', 1)[1], []).append(entry['wall_s'])
+        for parameter, timings in per_parameter.items():
+            results[f'{name}/calc/{parameter}'] = result_entry(timings)
+            print(f'{name + "/calc/" + parameter:58s} {min(timings) * 1000:12.2f} ms  (x{len(timings)})')
+        configure({})
+
+    if 'parcel' in stages:
+        def parcel_analysis():
+            parcel = FastParcelAnalysis(pres, temp, dew)
+            return parcel.lfc, parcel.el, parcel.cape_cin(), parcel.lifted_index()
+        table = moist_adiabat_table()
+        record('parcel/FastParcelAnalysis', parcel_analysis)
+        record('parcel/fast_parcel', lambda: fast_parcel(pres, temp, dew, pres[0], temp[0], dew[0], table))
+
+    if 'render' in stages:
+        def skewt(fig):
+            display_skewt_plot(extracted_data, config, {**params}, fig, gridspec.GridSpec(1, 1, figure=fig)[0])
+
+        def hodograph(fig):
+            display_hodograph_plot(extracted_data, config, fig.add_subplot())
+
+        def overview():
+            with contextlib.redirect_stdout(io.StringIO()): # range diagnostics of every variable
+                plot_extracted_data(extracted_data, config)
+            plt.gcf().canvas.draw()
+            plt.close('all')
+
+        record('render/display_skewt_plot', lambda: render(skewt))
+        record('render/display_hodograph_plot', lambda: render(hodograph))
+        record('render/display_parameters', lambda: render(lambda fig: display_parameters(config, {**params}, fig, properties)))
+        record('render/display_sounding', lambda: render(lambda fig: display_sounding(extracted_data, config, {**params}, fig, properties)))
+        record('render/plot_extracted_data', overview)
+        for profile in dict.fromkeys(['default', *config.get('render', {}).get('profiles', {})]):
+            record(f'render/render_bytes_{profile}',
+                   lambda profile=profile: render_bytes(extracted_data, params, config, 'png', profile, sounding_properties=properties))
+        template = SoundingFigureTemplate(config, blit=True)
+        record('render/template_render', lambda: template.render(extracted_data, params, properties))
+
+    if 'interaction' in stages:
+        # EVENTS mouse moves per measurement, the figures are drawn once before
+        fig = Figure(figsize=tuple(config['figsize']))
+        canvas = FigureCanvasAgg(fig)
+        display_skewt_plot(extracted_data, config, {**params}, fig, fig.add_gridspec(10, 15)[:, 0:10])
+        long_properties = dict(properties, origin_member='20241004_1200_member_17_of_50.gz', channel='NOAA MADIS global radiosonde feed')
+        hover_texts = display_parameters(config, {**params}, fig, long_properties)
+        moves = [MouseEvent('motion_notify_event', canvas, x, y) for x, y in mouse_path(fig, hover_texts, EVENTS)]
+        record(f'interaction/hover_{EVENTS}_moves', lambda: [hover_texts.on_move(event) for event in moves])
+
+        fig = Figure(figsize=tuple(config['figsize']))
+        canvas = FigureCanvasAgg(fig)
+        skew = display_sounding(extracted_data, config, {**params}, fig, properties)
+        tool = ParcelTool(skew, extracted_data, config, moist_adiabat_table())
+        canvas.draw()
+        tool._dragging = True
+        drags = [MouseEvent('motion_notify_event', canvas, *skew.ax.transData.transform((start_temp, start_pres)), button=1)
+                 for start_pres, start_temp in drag_path(EVENTS)]
+        record(f'interaction/parcel_drag_{EVENTS}_moves', lambda: [tool._on_move(event) for event in drags])
+
+    if 'ensemble' in stages:
+        soundings = list(members(extracted_data, 10, len(pres)))
+        record('ensemble/batch_calc_params', lambda: batch_calc_params(soundings, config))
+        record('ensemble/display_ensemble', lambda: render(lambda fig: display_ensemble(soundings, config, fig)))
+
+    if 'archive' in stages:
+        with tempfile.TemporaryDirectory() as directory:
+            write_soundings(windy_sounding, os.path.join(directory, 'json'), 5)
+            target = os.path.join(directory, 'archive')
+            record('archive/build_archive', lambda: build_archive([os.path.join(directory, 'json')], target))
+            archive = SoundingArchive(target)
+            keys = list(archive.keys())
+            record('archive/get', lambda: [archive.get(key) for key in keys])
+            record('archive/process', lambda: archive.process(keys[0], config))
+            record('archive/query', lambda: archive.query(properties['lat'], properties['lon'], 500))
+
+    return results
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return commit, bool(dirty)
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def machine():
+    return {'node': platform.node(), 'machine': platform.machine(), 'python': platform.python_version(), 'cpus': os.cpu_count()}
+
+
+def load_baseline(commit, baseline=None):
+    # latest stored run of another commit on the same machine and python version
+    if baseline:
+        with open(baseline) as f:
+            return json.load(f), baseline
+    for filepath in sorted(glob.glob(os.path.join(RESULTS_DIR, '*.json')), reverse=True):
+        with open(filepath) as f:
+            run = json.load(f)
+        if run['commit'] != commit and run['machine'] == machine():
+            return run, filepath
+    return None, None
+
+
+def compare(results, baseline, threshold, min_delta):
+
+    '''
+    Function to compare the minimum times of a run with a baseline run.
+
+    Returns
+    -------
+    tuple(list, list) : Regressions and improvements as (name, baseline ms, current ms).
+    '''
+
+    regressions, improvements = [], []
+    for name, entry in results.items():
+        if name not in baseline['results']:
+            continue
+        old, new = baseline['results'][name]['min_ms'], entry['min_ms']
+        if new > old * (1 + threshold) and new - old > min_delta:
+            regressions.append((name, old, new))
+        elif new < old / (1 + threshold) and old - new > min_delta:
+            improvements.append((name, old, new))
+    return regressions, improvements
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage on synthetic and example soundings.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES, help='levels of the synthetic soundings')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='stages to benchmark')
+    parser.add_argument('--no-example', action='store_true', help='skip the example sounding of the config')
+    parser.add_argument('--min-repeats', type=int, default=3, help='minimum number of calls per measurement')
+    parser.add_argument('--budget', type=float, default=0.5, help='seconds per measurement')
+    parser.add_argument('--baseline', help='results file to compare with (default: latest run of another commit)')
+    parser.add_argument('--threshold', type=float, default=0.3, help='relative slowdown flagged as regression')
+    parser.add_argument('--min-delta', type=float, default=1.0, help='absolute slowdown in ms below which nothing is flagged')
+    parser.add_argument('--no-save', action='store_true', help='do not store the results in .benchmarks')
+    parser.add_argument('--no-fail', action='store_true', help='exit with status 0 even if regressions were found')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    config = load_json_data(os.path.join(ROOT, 'src', 'config.json'))
+    commit, dirty = git_commit()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cases = []
+        for levels in args.sizes:
+            filepath = os.path.join(directory, f'synthetic_{levels}.json')
+            with open(filepath, 'w') as f:
+                json.dump(synthetic_sounding(levels), f)
+            cases.append((f'levels_{levels}', filepath))
+        if not args.no_example:
+            cases.append(('example', os.path.join(ROOT, config['sounding_file'])))
+
+        print(f'\n{"benchmark":58s} {"min":>15s}')
+        for name, filepath in cases:
+            results.update(bench_case(name, filepath, config, args.stages, args.min_repeats, args.budget))
+
+    run = {
+        'commit': commit, 'dirty': dirty, 'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'machine': machine(), 'versions': {'numpy': np.__version__, 'metpy': metpy.__version__, 'matplotlib': matplotlib.__version__},
+        'results': results
+    }
+
+    baseline, baseline_path = load_baseline(commit, args.baseline)
+    regressions = []
+    if baseline is None:
+        print('\nNo baseline run of another commit found, nothing to compare.')
+    else:
+        regressions, improvements = compare(results, baseline, args.threshold, args.min_delta)
+        print(f'\nCompared with {baseline["commit"]} ({baseline_path}), threshold {args.threshold:.0%}:')
+        for label, entries in [('REGRESSION', regressions), ('improvement', improvements)]:
+            for name, old, new in entries:
+                print(f'{label:12s} {name:58s} {old:10.2f} ms -> {new:10.2f} ms ({new / old - 1:+.0%})')
+        if not regressions and not improvements:
+            print('no significant changes')
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        filepath = os.path.join(RESULTS_DIR, f'{stamp}_{commit}{"-dirty" if dirty else ""}.json')
+        with open(filepath, 'w') as f:
+            json.dump(run, f, indent=1)
+        print(f'\nResults stored in {filepath}')
+
+    sys.exit(1 if regressions and not args.no_fail else 0)
+
+
+if __name__ == '__main__':
+    main()
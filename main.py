@@ -1,39 +1,239 @@
-from src import *
+from src import load_json_data, process_sounding, serialize_params, ParamsCache
+from src.instrumentation import configure, stage, event
+from datetime import datetime, timezone
+import argparse
+import contextlib
+import json
+import os
 import sys
-from time import perf_counter
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
+import time
+import numpy as np
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Plot skew-t, hodograph and parameters of windy.com soundings.')
+    parser.add_argument('sounding_file', nargs='?', help='windy.com JSON sounding to display (default: config sounding_file)')
+    parser.add_argument('--params-only', action='store_true', help='print the calculated parameters as JSON, without loading matplotlib')
+    parser.add_argument('--batch', nargs='+', metavar='PATH', help='directories or glob patterns of soundings to render headless')
+    parser.add_argument('--params-table', nargs='+', metavar='PATH', help='print the indices of many soundings as CSV table (batched calculation, without matplotlib)')
+    parser.add_argument('--build-archive', nargs='+', metavar='PATH', help='convert soundings into a memory-mapped archive: archive directory followed by directories or glob patterns of soundings')
+    parser.add_argument('--archive', metavar='DIR', help='read soundings from an archive (see --build-archive), sounding_file is the key of the sounding')
+    parser.add_argument('--near', nargs=2, type=float, metavar=('LAT', 'LON'), help='list the soundings of the --archive around a location, from the index only')
+    parser.add_argument('--radius-km', type=float, default=50.0, help='search radius of --near in km (default: 50)')
+    parser.add_argument('--days', type=float, help='only list soundings of --near with a reference time in the last DAYS days')
+    parser.add_argument('--model', help='only list soundings of --near from this model')
+    parser.add_argument('--sequence', nargs='+', metavar='PATH', help='directories or glob patterns of a forecast series to step through (sorted by time)')
+    parser.add_argument('--save-animation', metavar='FILE', help='save the --sequence as an animation (e.g. .gif) instead of opening a window')
+    parser.add_argument('--ensemble', nargs='+', metavar='PATH', help='overlay many soundings (e.g. ensemble members) on one skew-t with percentile envelopes and a summary of the indices, --save writes an image')
+    parser.add_argument('--watch', nargs='+', metavar='PATH', help='watch directories or glob patterns and process new or changed soundings (results and manifest in --output-dir)')
+    parser.add_argument('--once', action='store_true', help='with --watch: process the new and changed soundings once and exit')
+    parser.add_argument('--serve', action='store_true', help='run the local HTTP render service (see server section of the config), with --archive soundings can be requested by key')
+    parser.add_argument('--port', type=int, help='port of the render service (default: config server.port)')
+    parser.add_argument('--save', metavar='FILE', help='render the sounding into an image file (format from the extension) instead of opening a window')
+    parser.add_argument('--render-profile', help='render profile of --save, --batch and --watch, e.g. fast or thumbnail (see render section of the config)')
+    parser.add_argument('--output-dir', help='directory for rendered images (batch and watch mode)')
+    parser.add_argument('--format', choices=['png', 'svg'], help='image format (batch and watch mode)')
+    parser.add_argument('--workers', type=int, help='number of worker processes (batch, sequence, watch and serve mode, default: all cores)')
+    parser.add_argument('--decimate', action='store_true', help='reduce high-resolution soundings to their significant levels and report the compression and CAPE/LI change (see decimation section of the config)')
+    parser.add_argument('--parallel', action='store_true', help='calculate independent parameters in a thread pool and per-level profiles in chunks, and report the time against the serial calculation (see calculation.parallel in the config)')
+    parser.add_argument('--no-cache', action='store_true', help='bypass the on-disk params cache')
+    parser.add_argument('--instrument', nargs='?', const='table', choices=['table', 'jsonl'], help='record wall time and calls per pipeline stage, report as summary table (default) or JSON lines on stderr')
+    parser.add_argument('--instrument-output', metavar='FILE', help='write the instrumentation records to FILE instead of stderr')
+    parser.add_argument('--memory', action='store_true', help='also record the peak memory per stage (tracemalloc, slower)')
+    parser.add_argument('--profile', action='append', metavar='STAGE', help='run a stage (e.g. calc_params) under cProfile, can be repeated')
+    parser.add_argument('--clear-cache', action='store_true', help='remove all entries from the params cache before running')
+    return parser.parse_args(argv)
 
-    start_time = perf_counter()
+def main():
 
+    args = parse_args()
     config = load_json_data()
-    config['sounding_file'] = 'data/windy_sounding4.json'
+
+    settings = config.setdefault('instrumentation', {})
+    if args.instrument:
+        settings.update(enabled=True, format=args.instrument)
+    if args.instrument_output:
+        settings['output'] = args.instrument_output
+    if args.memory:
+        settings['memory'] = True
+    if args.profile:
+        settings.update(enabled=True, profile=settings.get('profile', []) + args.profile)
+    instrumentation = configure(config)
+
+    if args.no_cache:
+        config['cache']['enabled'] = False
+    if args.decimate:
+        config.setdefault('decimation', {})['enabled'] = True
+    if args.parallel:
+        config['calculation'].setdefault('parallel', {}).update(enabled=True, report=True)
+    cache = ParamsCache.from_config(config)
+    if args.clear_cache:
+        cache.clear()
+
+    if args.params_table:
+        from src import params_table, write_params_table
+        with contextlib.redirect_stdout(sys.stderr): # keep stdout valid CSV
+            filepaths, table = params_table(args.params_table, config)
+        write_params_table(filepaths, table)
+        instrumentation.report()
+        return
+
+    if args.build_archive:
+        from src import build_archive
+        if len(args.build_archive) < 2:
+            sys.exit('--build-archive needs the archive directory and at least one input path')
+        archive = build_archive(args.build_archive[1:], args.build_archive[0])
+        print(f'{len(archive)} soundings, {archive.offsets[-1]} levels written to {archive.path}')
+        instrumentation.report()
+        return
+
+    if args.ensemble:
+        import matplotlib
+        if args.save:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from src import load_ensemble, display_ensemble
+        with stage('load'):
+            filepaths, soundings = load_ensemble(args.ensemble, config)
+        with stage('render'):
+            fig = plt.figure(figsize=tuple(config['figsize']))
+            display_ensemble(soundings, config, fig)
+            if args.save:
+                start_time = time.perf_counter()
+                fig.savefig(args.save)
+                print(f'{args.save}: {len(filepaths)} soundings, saved in {(time.perf_counter() - start_time) * 1000:.0f} ms', file=sys.stderr)
+        instrumentation.report()
+        if not args.save:
+            plt.show()
+        return
+
+    if args.watch:
+        from src import watch_folder
+        results = watch_folder(args.watch, config, args.output_dir, args.workers, args.format, args.render_profile, args.once)
+        sys.exit(1 if results['failed'] else 0)
+
+    if args.serve:
+        from src import serve
+        serve(config, port=args.port, workers=args.workers, archive=args.archive)
+        return
+
+    if args.archive and args.near:
+        from src import SoundingArchive
+        from src.archive import DAY_S
+        start = time.time() - args.days * DAY_S if args.days is not None else None
+        matches = SoundingArchive(args.archive).query(*args.near, args.radius_km, start=start, model=args.model)
+        print('key,lat,lon,reftime,model,distance_km')
+        for match in matches:
+            reftime = datetime.fromtimestamp(match['reftime'], timezone.utc).isoformat() if np.isfinite(match['reftime']) else ''
+            print(f"{match['key']},{match['lat']},{match['lon']},{reftime},{match['model']},{match['distance_km']:.1f}")
+        return
+
+    if args.batch:
+        from src import render_batch
+        results = render_batch(args.batch, config, args.output_dir, args.format, args.workers, profile=args.render_profile)
+        instrumentation.report()
+        sys.exit(1 if any(result['error'] for result in results) else 0)
+
+    if args.sequence:
+        if args.save_animation:
+            import matplotlib
+            matplotlib.use('Agg')
+        from src import SequenceViewer
+        viewer = SequenceViewer(args.sequence, config, args.workers)
+        if args.save_animation:
+            viewer.save(args.save_animation)
+            viewer.close()
+        else:
+            viewer.run()
+        return
+
+    config['sounding_file'] = args.sounding_file or config['sounding_file']
 
     # try:
 
-    windy_sounding = load_json_data(config['sounding_file'])
+    # extract, clean, add units and calculate indices, temperatures, points like lcl, lfc, el, lcc, cape, cin...
+    # (diagnostics go to stderr in compute-only mode to keep stdout valid JSON)
+    with contextlib.redirect_stdout(sys.stderr) if args.params_only else contextlib.nullcontext():
+        if args.archive: # array views into the archive, no JSON parsing
+            from src import SoundingArchive
+            archive = SoundingArchive(args.archive)
+            key = args.sounding_file if args.sounding_file is not None else 0
+            extracted_data, params = archive.process(key, config, cache)
+            windy_sounding = {'properties': archive.properties(key)}
+            config['sounding_file'] = f'{args.archive}:{archive.index["key"][archive.row(key)]}'
+        else:
+            windy_sounding = load_json_data(config['sounding_file'])
+            extracted_data, params = process_sounding(windy_sounding, config, cache)
+
+        parallel = config['calculation'].get('parallel', {})
+        if parallel.get('enabled', False):
+            from src import displayed_params, compare_parallel
+            names = None if args.params_only else displayed_params(config)
+            workers, chunk_levels = parallel.get('workers') or args.workers, parallel.get('chunk_levels', 500)
+            params.evaluate_parallel(names, workers, chunk_levels)
+            if parallel.get('report', False):
+                options = {key: config['calculation'].get(key, 'metpy') for key in ['wet_bulb', 'backend']}
+                comparison = compare_parallel(extracted_data, **options, workers=workers, chunk_levels=chunk_levels, names=names)
+                event('compare_parallel', **comparison)
+                if comparison['workers'] == 1:
+                    print(f"calc_params: serial {comparison['serial_s'] * 1000:.1f} ms, one core or worker, "
+                          f"calculated serially", file=sys.stderr)
+                else:
+                    print(f"calc_params: serial {comparison['serial_s'] * 1000:.1f} ms, parallel {comparison['parallel_s'] * 1000:.1f} ms "
+                          f"with {comparison['workers']} threads ({comparison['speedup']:.2f}x), "
+                          f"max difference {comparison['max_difference']:.3g}", file=sys.stderr)
+
+        if args.decimate: # compression and effect on the params, against the cleaned sounding before decimation
+            from src import extract_data, clean_extracted_data, decimate_extracted_data, decimation_effect
+            from src.data_processing import ATTRIBUTES
+            cleaned = clean_extracted_data(archive.get(key) if args.archive else extract_data(windy_sounding, ATTRIBUTES), config)
+            decimated, report = decimate_extracted_data(cleaned, config, return_report=True)
+            effect = decimation_effect(cleaned, decimated, config) if report['levels_after'] < report['levels_before'] else {}
+            print(f"decimation: {report['levels_before']} -> {report['levels_after']} levels "
+                  f"({report['compression_ratio']:.1f}x)" + ''.join(
+                      f', {name} {before:.2f} -> {after:.2f}' for name, (before, after) in effect.items()), file=sys.stderr)
 
-    attributes = ['pressure', 'temp', 'dewpoint', 'gpheight', 'wind_u', 'wind_v']
-    extracted_data = extract_data(windy_sounding, attributes) # extract data from raw json format
-    extracted_data = clean_extracted_data(extracted_data, config) # clean data from outliers
-    extracted_data = add_units(extracted_data) # add units to data for displaying and further calculations
+    event('params_cache', **cache.stats())
 
-    plot_extracted_data(extracted_data, config) # plot pressure, temperature, dewpoint, height and windspeeds for better data inspection
-    params = calc_params(extracted_data) # calculate indices, temperatures, points like lcl, lfc, el, lcc, cape, cin...
+    if args.params_only: # compute-only mode, matplotlib is never imported
+        print(json.dumps(serialize_params(params.evaluate()), indent=4, ensure_ascii=False))
+        instrumentation.report()
+        return
 
-    fig = plt.figure(figsize=tuple(config['figsize']))
-    gs = gridspec.GridSpec(10, 15)
-    gs_skewt = gs[:, 0:10] # location where to show skew-t
-    ax_hodograph = fig.add_subplot(gs[0:5, 10:15]) # ax to plot hodograph on
-    display_skewt_plot(extracted_data, config, params, fig, gs_skewt)
-    display_hodograph_plot(extracted_data, config, ax_hodograph)
+    if args.save: # in-memory rendering with the figure template, no window
+        import matplotlib
+        matplotlib.use('Agg')
+        from src import render_bytes
+        fmt = os.path.splitext(args.save)[1][1:].lower() or 'png'
+        with stage('render'):
+            image = render_bytes(extracted_data, params, config, fmt, args.render_profile,
+                                 sounding_properties=windy_sounding.get('properties'), title=config['sounding_file'])
+        with open(args.save, 'wb') as f:
+            f.write(image['data'])
+        params.flush()
+        print(f"{args.save}: {image['width']}x{image['height']} px, profile {image['profile']}, "
+              f"rendered in {image['render_s'] * 1000:.0f} ms", file=sys.stderr)
+        instrumentation.report()
+        return
 
-    sounding_properties = windy_sounding.get('properties', 1)
-    display_parameters(config, params, fig, sounding_properties)
+    # plotting modules are only loaded when something is displayed
+    import matplotlib.pyplot as plt
+    from src import plot_extracted_data, display_sounding, open_google_maps
 
-    print(f'Execution time: {perf_counter() - start_time:.4f} seconds')
+    with stage('render'):
+        plot_extracted_data(extracted_data, config) # plot pressure, temperature, dewpoint, height and windspeeds for better data inspection
+
+        fig = plt.figure(figsize=tuple(config['figsize']))
+        sounding_properties = windy_sounding.get('properties', 1)
+        skew = display_sounding(extracted_data, config, params, fig, sounding_properties)
+        if config.get('parcel_tool', {}).get('enabled', False):
+            from src import ParcelTool
+            parcel_tool = ParcelTool(skew, extracted_data, config) # keep a reference, callbacks are weakly referenced
+        if instrumentation.enabled: # time the first full draw, otherwise done by plt.show
+            with stage('draw'):
+                fig.canvas.draw()
+        params.flush()
+
+    instrumentation.report() # before plt.show, which blocks until the window is closed
 
     lon, lat = [sounding_properties.get(x, 1) for x in ['lon', 'lat']]
     open_google_maps(lat, lon)
@@ -42,11 +242,11 @@ def main():
     plt.show()
 
     # except FileNotFoundError as e: # if config- or data file are missing
-    #     print(e.with_traceback) 
-    #     sys.exit(1) 
+    #     print(e.with_traceback)
+    #     sys.exit(1)
     # except ValueError as e: # if there exist less than 5 data points
     #     print(e.with_traceback)
     #     sys.exit(1)
-   
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
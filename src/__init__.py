@@ -1,30 +1,111 @@
 # src/__init__.py
 
-from .display import display_skewt_plot
-from .display import display_hodograph_plot
-from .display import display_parameters
-from .display import plot_extracted_data
-from .display import open_google_maps
-from .data_processing import load_json_data
-from .data_processing import extract_data
-from .data_processing import calc_params
-from .data_processing import add_units
-from .data_processing import clean_extracted_data
-from .data_processing import extract_relevant_wind_data
+import importlib
+
+# public names and the module they live in. Modules are imported on first attribute access
+# (PEP 562), so compute-only use never loads matplotlib, metpy.plots or the display code.
+_exports = {
+    # from display.py
+    "display_skewt_plot": "display",
+    "display_hodograph_plot": "display",
+    "display_parameters": "display",
+    "plot_extracted_data": "display",
+    "open_google_maps": "display",
+    "display_sounding": "display",
+    "category_layout": "display",
+    "format_param_value": "display",
+    "HoverTexts": "display",
+    # from template.py
+    "SoundingFigureTemplate": "template",
+    # from render.py
+    "render_bytes": "render",
+    "render_profile": "render",
+    # from data_processing.py
+    "load_json_data": "data_processing",
+    "extract_data": "data_processing",
+    "calc_params": "data_processing",
+    "add_units": "data_processing",
+    "clean_extracted_data": "data_processing",
+    "detect_outliers": "data_processing",
+    "rolling_median_mad": "data_processing",
+    "decreasing_levels": "data_processing",
+    "inversion_levels": "data_processing",
+    "significant_levels": "data_processing",
+    "decimate_extracted_data": "data_processing",
+    "decimation_effect": "data_processing",
+    "extract_relevant_wind_data": "data_processing",
+    "log_pressure_weights": "data_processing",
+    "interpolate_to_levels": "data_processing",
+    "extract_sounding": "data_processing",
+    "collect_sounding_files": "data_processing",
+    "sounding_time": "data_processing",
+    "process_columns": "data_processing",
+    "process_sounding": "data_processing",
+    "calc_wet_bulb": "data_processing",
+    "serialize_params": "data_processing",
+    # from params.py
+    "LazyParams": "params",
+    "param_graph": "params",
+    "displayed_params": "params",
+    "compare_parallel": "params",
+    "parallel_workers": "params",
+    # from ingest.py
+    "iter_windy_json": "ingest",
+    "features_to_columns": "ingest",
+    "read_sounding_columns": "ingest",
+    "extract_columns": "ingest",
+    # from parcel.py
+    "ParcelAnalysis": "parcel",
+    "FastParcelAnalysis": "parcel",
+    "compare_with_metpy": "parcel",
+    "compare_fast_with_metpy": "parcel",
+    "MoistAdiabatTable": "parcel",
+    "fast_parcel": "parcel",
+    # from thermo.py
+    "compare_wet_bulb_with_metpy": "thermo",
+    # from parcel_tool.py
+    "ParcelTool": "parcel_tool",
+    # from instrumentation.py
+    "Instrumentation": "instrumentation",
+    "configure": "instrumentation",
+    "get_instrumentation": "instrumentation",
+    # from cache.py
+    "ParamsCache": "cache",
+    "params_key": "cache",
+    # from batched.py
+    "batch_calc_params": "batched",
+    "params_table": "batched",
+    "write_params_table": "batched",
+    "calc_ensemble": "batched",
+    "summarize_params_table": "batched",
+    # from ensemble.py
+    "display_ensemble": "ensemble",
+    "load_ensemble": "ensemble",
+    # from archive.py
+    "SoundingArchive": "archive",
+    "build_archive": "archive",
+    # from batch.py
+    "render_sounding_file": "batch",
+    "render_batch": "batch",
+    # from watch.py
+    "FolderWatcher": "watch",
+    "watch_folder": "watch",
+    # from server.py
+    "RenderServer": "server",
+    "serve": "server",
+    # from sequence.py
+    "SequenceViewer": "sequence",
+    "load_sequence": "sequence"
+}
 
 # if from xy import * -> everything in __all__ is imported OR (if __all__ not specified) all available functions are taken
-__all__ =   [
-            # from display.py
-            "display_skewt_plot", 
-            "display_hodograph_plot", 
-            "display_parameters", 
-            "plot_extracted_data", 
-            "open_google_maps",
-            # from data_processing.py
-            "load_json_data", 
-            "extract_data", 
-            "calc_params", 
-            "add_units", 
-            "clean_extracted_data",
-            "extract_relevant_wind_data"
-            ] 
\ No newline at end of file
+__all__ = list(_exports)
+
+def __getattr__(name):
+    if name in _exports:
+        module = importlib.import_module(f'.{_exports[name]}', __name__)
+        return getattr(module, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
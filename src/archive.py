@@ -0,0 +1,266 @@
+import json
+import os
+import sys
+import numpy as np
+from .data_processing import ATTRIBUTES
+from .data_processing import load_json_data
+from .data_processing import collect_sounding_files
+from .data_processing import sounding_time
+from .data_processing import process_columns
+from .ingest import features_to_columns
+from .ingest import extract_columns
+from .instrumentation import timed
+
+# bump when the layout of the archive files changes, older archives are rejected
+ARCHIVE_VERSION = 1
+EARTH_RADIUS_KM = 6371.0
+DAY_S = 86400.0
+
+
+def _float(value):
+    # float of a property, nan if missing (None / null in the JSON)
+    return np.nan if value is None else float(value)
+
+
+def _index_entry(key, properties, windy_sounding):
+    # location, reference time and model of a sounding from its properties (nan / '' if unknown)
+    reftime = properties.get('reftime', properties.get('syn_timestamp'))
+    if reftime is None:
+        reftime = sounding_time(windy_sounding)
+    reftime = _float(reftime)
+    model = properties.get('model', properties.get('path_source', ''))
+    return (key, _float(properties.get('lat')), _float(properties.get('lon')),
+            reftime if np.isfinite(reftime) else np.nan, str(model or ''))
+
+
+@timed()
+def build_archive(inputs, path, fields=ATTRIBUTES):
+
+    '''
+    Function to convert windy.com JSON soundings into a columnar archive directory:
+    one .npy block per field with the extracted levels of all soundings concatenated, an offsets table
+    (sounding i is rows offsets[i]:offsets[i+1] of every block), an index with key (file name without
+    extension), lat, lon, reftime and model of every sounding and the remaining properties as JSON.
+    Files which can not be read or extracted are reported on stderr and skipped.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories, files or glob patterns of soundings (see collect_sounding_files).
+    path : str : Directory of the archive, created if necessary, existing archive files are replaced.
+    fields : list(str) : Fields extracted from every sounding (see extract_data).
+
+    Returns
+    -------
+    SoundingArchive : The written archive.
+
+    Raises
+    ------
+    ValueError : If two soundings have the same key or no sounding could be read.
+    '''
+
+    blocks = {field: [] for field in fields}
+    entries, properties, lengths, keys = [], [], [], set()
+    for filepath in collect_sounding_files(inputs):
+        key = os.path.splitext(os.path.basename(filepath))[0]
+        try:
+            windy_sounding = load_json_data(filepath)
+            columns = extract_columns(features_to_columns(windy_sounding['features'], fields), fields)
+            sounding_properties = windy_sounding.get('properties') or {}
+            entry = _index_entry(key, sounding_properties, windy_sounding)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f'{filepath}: skipped ({e})', file=sys.stderr)
+            continue
+        if key in keys:
+            raise ValueError(f"Duplicate sounding key '{key}' ({filepath}), keys are the file names.")
+        keys.add(key)
+        entries.append(entry)
+        properties.append(sounding_properties)
+        lengths.append(len(columns[fields[0]]))
+        for field in fields:
+            blocks[field].append(columns[field])
+    if not entries:
+        raise ValueError(f'No soundings could be read from {inputs}.')
+
+    key_width = max(len(entry[0]) for entry in entries)
+    model_width = max(max(len(entry[4]) for entry in entries), 1)
+    index = np.array(entries, dtype=[('key', f'U{key_width}'), ('lat', 'f8'), ('lon', 'f8'),
+                                     ('reftime', 'f8'), ('model', f'U{model_width}')])
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+
+    os.makedirs(path, exist_ok=True)
+    for field in fields:
+        np.save(os.path.join(path, f'{field}.npy'), np.concatenate(blocks[field]).astype(np.float64))
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+    np.save(os.path.join(path, 'index.npy'), index)
+    with open(os.path.join(path, 'properties.json'), 'w') as f:
+        json.dump(properties, f)
+    # written last, a directory without manifest is an incomplete archive
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        json.dump({'version': ARCHIVE_VERSION, 'fields': list(fields), 'soundings': len(index),
+                   'levels': int(offsets[-1])}, f, indent=4)
+    return SoundingArchive(path)
+
+
+def haversine_km(lat, lon, lats, lons):
+
+    '''
+    Function to calculate the great circle distance in km from one point to arrays of points (degrees).
+    '''
+
+    lat, lon, lats, lons = (np.radians(value) for value in (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class SoundingArchive:
+
+    '''
+    Reader of an archive written by build_archive. Opening loads the manifest, index and offsets only,
+    the data blocks are memory-mapped on first access, so queries never touch them and a sounding
+    is returned as read-only array views into the mapped blocks (no JSON parsing, no copies).
+
+    Parameters
+    ----------
+    path : str : Directory of the archive.
+
+    Raises
+    ------
+    ValueError : If the directory holds no complete archive or one of another version.
+    '''
+
+    def __init__(self, path):
+
+        manifest_file = os.path.join(path, 'manifest.json')
+        if not os.path.isfile(manifest_file):
+            raise ValueError(f'{path} is no sounding archive (missing manifest.json).')
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != ARCHIVE_VERSION:
+            raise ValueError(f"Archive {path} has version {manifest.get('version')}, expected {ARCHIVE_VERSION}.")
+
+        self.path = path
+        self.fields = manifest['fields']
+        self.index = np.load(os.path.join(path, 'index.npy'))
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self._rows = {key: row for row, key in enumerate(self.index['key'].tolist())}
+        self._blocks = {}
+        self._properties = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def keys(self):
+        return list(self._rows)
+
+    def row(self, key):
+
+        '''
+        Returns the row of a sounding in the index, key can be the key or the row itself.
+        '''
+
+        if isinstance(key, (int, np.integer)):
+            if not -len(self) <= key < len(self):
+                raise IndexError(f'Row {key} out of range for archive with {len(self)} soundings.')
+            return int(key) % len(self)
+        if key not in self._rows:
+            raise KeyError(f"No sounding '{key}' in archive {self.path}.")
+        return self._rows[key]
+
+    def block(self, field):
+
+        '''
+        Returns the memory-mapped block of a field (all soundings concatenated).
+        '''
+
+        if field not in self._blocks:
+            if field not in self.fields:
+                raise KeyError(f"Field '{field}' not in archive, available: {self.fields}.")
+            self._blocks[field] = np.load(os.path.join(self.path, f'{field}.npy'), mmap_mode='r')
+        return self._blocks[field]
+
+    def query(self, lat=None, lon=None, radius_km=None, start=None, end=None, model=None):
+
+        '''
+        Function to select soundings from the index only, e.g. all soundings within 50 km of a point
+        in the last 7 days: query(lat, lon, 50, start=time.time() - 7 * 86400). Unset criteria match all.
+
+        Parameters
+        ----------
+        lat, lon : float : Center of the search (degrees), used with radius_km.
+        radius_km : float : Maximum great circle distance from the center.
+        start, end : float : Range of the reference time (Unix timestamps in seconds, inclusive).
+        model : str : Model (or path_source) of the soundings.
+
+        Returns
+        -------
+        np.ndarray : Index records (key, lat, lon, reftime, model) of the matches, sorted by reftime,
+            with an additional 'distance_km' field (nan without center).
+        '''
+
+        index = self.index
+        mask = np.ones(len(index), dtype=bool)
+        distance = np.full(len(index), np.nan)
+        if radius_km is not None:
+            if lat is None or lon is None:
+                raise ValueError('radius_km needs lat and lon of the center.')
+            distance = haversine_km(lat, lon, index['lat'], index['lon'])
+            mask &= distance <= radius_km # nan locations never match
+        if start is not None:
+            mask &= index['reftime'] >= start
+        if end is not None:
+            mask &= index['reftime'] <= end
+        if model is not None:
+            mask &= index['model'] == model
+
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(index['reftime'][rows], kind='stable')]
+        matches = np.empty(len(rows), dtype=index.dtype.descr + [('row', 'i8'), ('distance_km', 'f8')])
+        for name in index.dtype.names:
+            matches[name] = index[name][rows]
+        matches['row'] = rows
+        matches['distance_km'] = distance[rows]
+        return matches
+
+    def get(self, key):
+
+        '''
+        Function to open a sounding as zero-copy views into the mapped data blocks.
+
+        Parameters
+        ----------
+        key : str or int : Key or index row of the sounding.
+
+        Returns
+        -------
+        dict(np.ndarray) : Read-only array per field, in the layout of extract_data (see process_columns).
+        '''
+
+        row = self.row(key)
+        lower, upper = self.offsets[row], self.offsets[row + 1]
+        return {field: self.block(field)[lower:upper] for field in self.fields}
+
+    def properties(self, key):
+
+        '''
+        Returns the windy.com properties of a sounding (loaded on first use).
+        '''
+
+        if self._properties is None:
+            with open(os.path.join(self.path, 'properties.json')) as f:
+                self._properties = json.load(f)
+        return self._properties[self.row(key)]
+
+    def process(self, key, config, cache=None):
+
+        '''
+        Function to run the processing pipeline on a sounding of the archive (see process_columns).
+
+        Returns
+        -------
+        tuple(dict, dict) : extracted_data with units attached and the params calculated by calc_params
+        '''
+
+        return process_columns(self.get(key), config, cache)
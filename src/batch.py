@@ -0,0 +1,162 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from statistics import median
+from time import perf_counter
+import os
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from .data_processing import load_json_data
+from .data_processing import collect_sounding_files
+from .data_processing import process_sounding
+from .display import display_sounding
+from .cache import ParamsCache
+from .render import render_bytes
+from .instrumentation import configure
+from .instrumentation import get_instrumentation
+from .instrumentation import timed
+
+
+def output_path(filepath, output_dir, fmt):
+
+    '''
+    Function to derive the output image path of a sounding file, e.g. data/a.json -> output/a.png
+    '''
+
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(output_dir, f'{name}.{fmt}')
+
+
+@timed()
+def render_sounding_file(filepath, config, output_dir, fmt='png', dpi=None, profile=None):
+
+    '''
+    Function to render one windy.com sounding file headless (Agg canvas, no pyplot window) to an image file.
+
+    Parameters
+    ----------
+    filepath : str : Path of the windy.com JSON sounding.
+    config : dict : Configuration dictionary containing plot settings and functionalities.
+    output_dir : str : Directory to write the image to.
+    fmt : str : Image format, e.g. 'png' or 'svg'.
+    dpi : int, optional : Resolution of raster images, per default the one of the render profile.
+    profile : str, optional : Render profile (see render_bytes), used with config['batch']['template'].
+
+    Returns
+    -------
+    dict : 'file', 'output', 'error' (None on success), 'duration' and 'render_s' (drawing and encoding only)
+        in seconds and 'cache_hit'.
+    '''
+
+    start_time = perf_counter()
+    result = {'file': filepath, 'output': None, 'error': None, 'cache_hit': False, 'render_s': None}
+    cache = ParamsCache.from_config(config)
+
+    # every file is isolated, a broken sounding must not stop the whole batch
+    try:
+        windy_sounding = load_json_data(filepath)
+        extracted_data, params = process_sounding(windy_sounding, config, cache)
+        result['cache_hit'] = cache.hits > 0
+
+        result['output'] = output_path(filepath, output_dir, fmt)
+
+        if config.get('batch', {}).get('template', False):
+            # static background is built once per worker, only the sounding's artists are updated
+            image = render_bytes(extracted_data, params, config, fmt, profile, dpi, windy_sounding.get('properties'),
+                                 f'Source: {filepath}')
+            with open(result['output'], 'wb') as f:
+                f.write(image['data'])
+            result['render_s'] = image['render_s']
+        else:
+            render_start = perf_counter()
+            fig = Figure(figsize=tuple(config['figsize']))
+            FigureCanvasAgg(fig)
+            display_sounding(extracted_data, config, params, fig, windy_sounding.get('properties'))
+            fig.suptitle(f'Source: {filepath}')
+            fig.savefig(result['output'], format=fmt, dpi=dpi or 100)
+            result['render_s'] = perf_counter() - render_start
+        params.flush() # one cache write with everything the image needed
+
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    result['duration'] = perf_counter() - start_time
+    return result
+
+
+def _init_worker(config):
+    # worker processes never open windows, their stages are recorded in memory and returned to the parent
+    # (profiles are left out, the workers would overwrite each other's .prof files)
+    matplotlib.use('Agg')
+    configure({'instrumentation': {**config.get('instrumentation', {}), 'format': 'table', 'output': None, 'profile': []}})
+
+
+def _render_in_worker(*args):
+    # render_sounding_file in a worker, with the stages and events recorded for this file
+    instrumentation = get_instrumentation()
+    instrumentation.records.clear()
+    instrumentation.events.clear()
+    result = render_sounding_file(*args)
+    if instrumentation.enabled:
+        result['instrumentation'] = instrumentation.export()
+    return result
+
+
+def render_batch(inputs, config, output_dir=None, fmt=None, workers=None, dpi=None, profile=None):
+
+    '''
+    Function to render a directory or glob of windy.com soundings in a process pool and print a throughput summary.
+    With instrumentation enabled, the stages and events of the workers are merged into this process's report.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories, glob patterns or file paths (see collect_sounding_files).
+    config : dict : Configuration dictionary, defaults for the arguments below are taken from config['batch'].
+    output_dir : str, optional : Directory to write the images to, created if missing.
+    fmt : str, optional : Image format, e.g. 'png' or 'svg'.
+    workers : int, optional : Number of worker processes, all cores if None.
+    dpi : int, optional : Resolution of raster images.
+    profile : str, optional : Render profile, e.g. 'fast' or 'thumbnail' (see render_bytes).
+
+    Returns
+    -------
+    list(dict) : Results of render_sounding_file in order of the input files.
+    '''
+
+    batch_config = config.get('batch', {})
+    output_dir = output_dir or batch_config.get('output_dir', 'output')
+    fmt = fmt or batch_config.get('format', 'png')
+    workers = workers or batch_config.get('workers') or os.cpu_count()
+    dpi = dpi or batch_config.get('dpi')
+    profile = profile or batch_config.get('profile')
+
+    files = collect_sounding_files(inputs)
+    os.makedirs(output_dir, exist_ok=True)
+
+    start_time = perf_counter()
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as executor:
+        futures = {executor.submit(_render_in_worker, filepath, config, output_dir, fmt, dpi, profile): filepath
+                   for filepath in files}
+        for future in as_completed(futures):
+            result = future.result()
+            if 'instrumentation' in result:
+                get_instrumentation().merge(result.pop('instrumentation'))
+            results[result['file']] = result
+            if result['error'] is None:
+                print(f'{result["file"]} -> {result["output"]} [{result["duration"]:.2f} s, '
+                      f'render {result["render_s"] * 1000:.0f} ms]')
+            else:
+                print(f'{result["file"]} -> FAILED ({result["error"]}) [{result["duration"]:.2f} s]')
+    elapsed = perf_counter() - start_time
+
+    rendered = sum(result['error'] is None for result in results.values())
+    print(f'\nRendered {rendered}/{len(files)} soundings in {elapsed:.2f} s with {workers} workers '
+          f'({rendered / elapsed if elapsed > 0 else 0:.2f} soundings/s)')
+    render_times = sorted(result['render_s'] for result in results.values() if result['error'] is None)
+    if render_times:
+        print(f'Render time per image: median {median(render_times) * 1000:.0f} ms, max {render_times[-1] * 1000:.0f} ms')
+    cache_hits = sum(result['cache_hit'] for result in results.values())
+    print(f'Params cache: {cache_hits} hits, {len(files) - cache_hits} misses')
+
+    return [results[filepath] for filepath in files]
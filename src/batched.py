@@ -0,0 +1,419 @@
+import csv
+from itertools import islice
+import sys
+import numpy as np
+from .data_processing import load_json_data
+from .data_processing import collect_sounding_files
+from .data_processing import extract_sounding
+from .data_processing import log_pressure_weights
+from .data_processing import interpolate_to_levels
+from .units import units
+from . import thermo
+from .instrumentation import timed
+from .instrumentation import stage
+
+# columns of the params table, one row per sounding. Pressure in hPa, temperature in K,
+# CAPE/CIN in J/kg, indices in K (delta degC, K Index in degC as MetPy), nan where a value is undefined (e.g. no LFC)
+TABLE_COLUMNS = ['LCL pressure', 'LCL temperature', 'LFC pressure', 'EL pressure', 'CAPE', 'CIN',
+                 'Lifted Index', 'K Index', 'Total Totals Index', 'Showalter Index']
+TABLE_DTYPE = np.dtype([(column, 'f8') for column in TABLE_COLUMNS])
+
+# pressure levels of the indices, always part of the grid so they are taken from the soundings directly
+INDEX_LEVELS = [850, 700, 500]
+
+# rk4 steps of the moist ascent between neighbouring grid levels (the levels are close, see thermo.moist_lapse)
+PROFILE_STEPS = 2
+
+# unit-free magnitudes of the soundings (units looked up once, registry attribute access is slow)
+PRESSURE_UNIT = units.hPa
+TEMPERATURE_UNIT = units.K
+
+
+def pressure_grid(pressure_range=(1050, 100), levels=96):
+
+    '''
+    Function to build the common pressure grid of batched soundings: levels evenly spaced in log pressure,
+    with the levels of the indices (850, 700, 500 hPa) added.
+
+    Parameters
+    ----------
+    pressure_range : tuple(float) : Highest and lowest pressure of the grid in hPa.
+    levels : int : Number of log-spaced levels.
+
+    Returns
+    -------
+    np.ndarray : Pressure levels in hPa, decreasing.
+    '''
+
+    grid = np.geomspace(*pressure_range, levels)
+    return np.union1d(grid, INDEX_LEVELS)[::-1]
+
+
+def _magnitude(quantity, unit):
+    # magnitude in unit, skipping the (slow) pint conversion if the quantity is already in unit
+    return quantity.m if quantity.units == unit else quantity.m_as(unit)
+
+
+def stack_soundings(soundings, grid):
+
+    '''
+    Function to interpolate soundings (linear in log pressure) onto a common pressure grid and stack them
+    into 2-D arrays of shape (n_soundings, n_levels). The first column holds the lowest level of each sounding
+    (the surface parcel is lifted from the measured values), followed by the grid levels within the sounding.
+    Rows are padded with nan at the end, so every row is ordered from high to low pressure without gaps.
+    Soundings with identical pressure levels (e.g. of one model) share one set of interpolation weights.
+
+    Parameters
+    ----------
+    soundings : list(dict(pint.Quantity)) : extracted_data of the soundings (see extract_sounding).
+    grid : np.ndarray : Common pressure levels in hPa, decreasing (see pressure_grid).
+
+    Returns
+    -------
+    dict(np.ndarray) : 'pressure' (hPa), 'temp' and 'dewpoint' (K), each of shape (n_soundings, len(grid) + 1).
+    '''
+
+    # group the soundings by their pressure levels
+    groups = {}
+    for row, extracted_data in enumerate(soundings):
+        pres = _magnitude(extracted_data['pressure'], PRESSURE_UNIT)
+        group = groups.setdefault(pres.tobytes(), {'pressure': pres, 'rows': [], 'temp': [], 'dewpoint': []})
+        group['rows'].append(row)
+        for key in ['temp', 'dewpoint']:
+            group[key].append(_magnitude(extracted_data[key], TEMPERATURE_UNIT))
+
+    stacked = {key: np.full((len(soundings), len(grid) + 1), np.nan) for key in ['pressure', 'temp', 'dewpoint']}
+    for group in groups.values():
+        pres, rows = group['pressure'], group['rows']
+        levels = grid[(grid < pres[0]) & (grid >= pres[-1])]
+        indices = log_pressure_weights(pres, levels)
+        stacked['pressure'][rows, :len(levels) + 1] = np.concatenate(([pres[0]], levels))
+        for key in ['temp', 'dewpoint']:
+            values = np.array(group[key]).T # levels along the first axis, as interpolate_to_levels expects
+            stacked[key][rows, :len(levels) + 1] = np.concatenate((values[:1], interpolate_to_levels(values, indices))).T
+    return stacked
+
+
+def _interpolate_rows(pressure, values, target):
+    # linear interpolation in pressure (as metpy.interpolate.interpolate_1d) of every row at its own target
+    # pressure, nan where the target is outside of the row
+    rows = np.arange(len(pressure))
+    upper = np.clip(np.count_nonzero(pressure >= target[:, np.newaxis], axis=1), 1, pressure.shape[1] - 1)
+    lower = upper - 1
+    press_lower, press_upper = pressure[rows, lower], pressure[rows, upper]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = (target - press_lower) / (press_upper - press_lower)
+    result = values[rows, lower] * (1 - weight) + values[rows, upper] * weight
+    return np.where(target <= pressure[:, 0], result, np.nan)
+
+
+def parcel_profiles(pressure, temperature, dewpoint, steps=PROFILE_STEPS):
+
+    '''
+    Function to lift the parcels of the first column of stacked soundings: dry adiabatic up to the LCL,
+    moist adiabatic above, marching upwards level by level for all soundings at once.
+
+    Parameters
+    ----------
+    pressure : np.ndarray : Stacked pressure in hPa (see stack_soundings).
+    temperature : np.ndarray : Stacked temperature in K.
+    dewpoint : np.ndarray : Stacked dewpoint in K.
+    steps : int : Number of RK4 steps of the moist ascent between two levels.
+
+    Returns
+    -------
+    tuple(np.ndarray) : Parcel temperature in K (same shape as pressure), LCL pressure in hPa and temperature in K.
+    '''
+
+    press_lcl, temp_lcl = thermo.lcl(pressure[:, 0], temperature[:, 0], dewpoint[:, 0])
+    profile = temperature[:, :1] * (pressure / pressure[:, :1]) ** thermo.KAPPA
+
+    # state of the moist ascent: last level above the lcl a parcel was lifted to
+    state_pressure, state_temperature = press_lcl.copy(), temp_lcl.copy()
+    for level in range(1, pressure.shape[1]):
+        press = pressure[:, level]
+        moist = press < state_pressure # false for padding
+        if not moist.any():
+            continue
+        temp = thermo.moist_lapse(press[moist], state_pressure[moist], state_temperature[moist], steps)
+        profile[moist, level] = temp
+        state_pressure[moist], state_temperature[moist] = press[moist], temp
+    return profile, press_lcl, temp_lcl
+
+
+def _lfc_el(log_p, diff, log_lcl):
+    # batched parcel.py _lfc_el: bottom lfc and top el from the sign changes of the parcel excess of every row
+    rows = np.arange(len(log_p))
+    lower, upper = diff[:, :-1], diff[:, 1:]
+    crossing = np.sign(lower) * np.sign(upper) < 0 # false for padding
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossings = log_p[:, :-1] + lower / (lower - upper) * (log_p[:, 1:] - log_p[:, :-1])
+    rising = upper > 0
+
+    candidates = crossing & rising & (crossings < log_lcl[:, np.newaxis])
+    log_lfc = np.where(candidates.any(axis=1), crossings[rows, candidates.argmax(axis=1)], np.nan)
+    positive = np.any((diff > 0) & (log_p < log_lcl[:, np.newaxis]), axis=1) # positive above the lcl: lfc = lcl
+    log_lfc = np.where(np.isnan(log_lfc) & positive, log_lcl, log_lfc)
+
+    candidates = crossing & ~rising & (crossings < log_lfc[:, np.newaxis])
+    last = candidates.shape[1] - 1 - candidates[:, ::-1].argmax(axis=1)
+    log_el = np.where(candidates.any(axis=1), crossings[rows, last], np.nan)
+    return log_lfc, log_el
+
+
+def _integrate(log_p, values, bottom, top):
+    # -np.trapezoid over log pressure of every row as mpcalc.cape_cin: zero crossings are inserted as levels and
+    # only levels within bottom and top (log pressures) are used, a limit between two levels (e.g. lfc = lcl)
+    # does not add a partial segment
+    x0, x1 = log_p[:, :-1], log_p[:, 1:]
+    y0, y1 = values[:, :-1], values[:, 1:]
+    bottom, top = bottom[:, np.newaxis] + 1e-9, top[:, np.newaxis] - 1e-9
+    crossing = np.sign(y0) * np.sign(y1) < 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_zero = np.where(crossing, x0 + y0 / (y0 - y1) * (x1 - x0), x1)
+    y_zero = np.where(crossing, 0.0, y1)
+    lower = np.where((x0 <= bottom) & (x_zero >= top), (x0 - x_zero) * (y0 + y_zero) / 2, 0.0)
+    upper = np.where(crossing & (x_zero <= bottom) & (x1 >= top), (x_zero - x1) * y1 / 2, 0.0)
+    return (lower + upper).sum(axis=1)
+
+
+def _calc_chunk(stacked, return_profile=False):
+    # all parameters of stacked soundings as array operations over the sounding axis, with return_profile
+    # also the parcel temperature of every level
+    pressure, temperature, dewpoint = stacked['pressure'], stacked['temp'], stacked['dewpoint']
+    table = np.full(len(pressure), np.nan, dtype=TABLE_DTYPE)
+
+    profile, press_lcl, temp_lcl = parcel_profiles(pressure, temperature, dewpoint)
+    log_p, log_lcl = np.log(pressure), np.log(press_lcl)
+
+    # lfc and el with the lcl inserted as level, environment linear in pressure (as in fast_parcel)
+    env_lcl = _interpolate_rows(pressure, temperature, press_lcl)
+    order = np.argsort(-np.concatenate((log_p, log_lcl[:, np.newaxis]), axis=1), axis=1) # padding (nan) sorted last
+    log_p_with_lcl = np.take_along_axis(np.concatenate((log_p, log_lcl[:, np.newaxis]), axis=1), order, axis=1)
+    diff_with_lcl = np.take_along_axis(np.concatenate((profile - temperature, (temp_lcl - env_lcl)[:, np.newaxis]), axis=1), order, axis=1)
+    log_lfc, log_el = _lfc_el(log_p_with_lcl, diff_with_lcl, log_lcl)
+
+    # cape and cin from the virtual temperature excess with its own integration limits (as mpcalc.cape_cin)
+    env_virtual = thermo.virtual_temperature(temperature, thermo.mixing_ratio(thermo.saturation_vapor_pressure(dewpoint), pressure))
+    below_lcl = pressure > press_lcl[:, np.newaxis]
+    parcel_mixing_ratio = thermo.mixing_ratio(thermo.saturation_vapor_pressure(np.where(below_lcl, dewpoint, temperature)), pressure)
+    parcel_virtual = thermo.virtual_temperature(profile, parcel_mixing_ratio)
+    virtual_diff = parcel_virtual - env_virtual
+    # mpcalc.lfc compares with the lcl of the virtual start temperature (slightly above the lcl)
+    press_lcl_v, _ = thermo.lcl(pressure[:, 0], parcel_virtual[:, 0], dewpoint[:, 0])
+    log_lfc_v, log_el_v = _lfc_el(log_p, virtual_diff, np.log(press_lcl_v))
+    top = np.where(np.isnan(log_el_v), np.nanmin(log_p, axis=1), log_el_v)
+    convective = ~np.isnan(log_lfc_v)
+    table['CAPE'] = np.where(convective, thermo.RD * _integrate(log_p, virtual_diff, log_lfc_v, top), 0.0)
+    table['CIN'] = np.where(convective, np.minimum(thermo.RD * _integrate(log_p, virtual_diff, log_p[:, 0], log_lfc_v), 0.0), 0.0)
+
+    table['LCL pressure'], table['LCL temperature'] = press_lcl, temp_lcl
+    table['LFC pressure'], table['EL pressure'] = np.exp(log_lfc), np.exp(log_el)
+
+    # indices from the index levels (as metpy.calc, interpolated linear in pressure)
+    t850, t700, t500 = [_interpolate_rows(pressure, temperature, np.full(len(pressure), level)) for level in INDEX_LEVELS]
+    td850, td700 = [_interpolate_rows(pressure, dewpoint, np.full(len(pressure), level)) for level in INDEX_LEVELS[:2]]
+    table['Lifted Index'] = t500 - _interpolate_rows(pressure, profile, np.full(len(pressure), 500))
+    table['K Index'] = (t850 - t500) + td850 - (t700 - td700) - thermo.ZERO_DEGC # td850 is absolute, in degC as mpcalc.k_index
+    table['Total Totals Index'] = t850 + td850 - 2 * t500
+
+    # showalter index: 850 hPa parcel lifted to 500 hPa, as for a single sounding
+    table['Showalter Index'] = t500 - thermo.showalter_parcel(t850, td850)
+    return (table, profile) if return_profile else table
+
+
+@timed()
+def batch_calc_params(soundings, config=None, chunk_size=None):
+
+    '''
+    Function to calculate the parameters of many soundings at once. The soundings are interpolated onto
+    a common log-pressure grid and every parameter (LCL, LFC, EL, CAPE/CIN and indices) is calculated as
+    array operation over the sounding axis, without units and without per-sounding MetPy calls.
+    Soundings are processed in chunks to bound the memory of the 2-D arrays. On the levels of the grid the
+    results agree with calc_params (CAPE within ~0.01 J/kg), for coarse soundings the parcel is evaluated
+    on the interpolated grid levels and LFC, EL and CAPE/CIN can differ from calc_params on the few raw levels.
+
+    Parameters
+    ----------
+    soundings : iterable(dict(pint.Quantity)) : extracted_data of the soundings (see extract_sounding),
+        consumed chunk by chunk, so a generator never holds more than one chunk in memory.
+    config : dict, optional : Configuration dictionary, grid and chunk size are taken from config['batch_params'].
+    chunk_size : int, optional : Number of soundings per chunk, overrides the config.
+
+    Returns
+    -------
+    np.ndarray : Structured array with one row per sounding (in input order) and the fields TABLE_COLUMNS.
+    '''
+
+    batch_config = (config or {}).get('batch_params', {})
+    grid = pressure_grid(batch_config.get('pressure_range', (1050, 100)), batch_config.get('levels', 96))
+    chunk_size = chunk_size or batch_config.get('chunk_size', 1000)
+
+    tables = []
+    soundings = iter(soundings)
+    while chunk := list(islice(soundings, chunk_size)):
+        with stage('stack_soundings'):
+            stacked = stack_soundings(chunk, grid)
+        with stage('calc_chunk'):
+            tables.append(_calc_chunk(stacked))
+    return np.concatenate(tables) if tables else np.empty(0, dtype=TABLE_DTYPE)
+
+
+def params_table(inputs, config):
+
+    '''
+    Function to calculate the params table of sounding files. Files that can not be loaded or
+    have too few valid levels are reported on stderr and left out.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories, glob patterns or file paths (see collect_sounding_files).
+    config : dict : Configuration dictionary.
+
+    Returns
+    -------
+    tuple(list(str), np.ndarray) : File paths of the rows and the table (see batch_calc_params).
+    '''
+
+    filepaths = []
+
+    def soundings():
+        for filepath in collect_sounding_files(inputs):
+            try:
+                extracted_data = extract_sounding(load_json_data(filepath), config)
+            except (OSError, ValueError, KeyError) as e:
+                print(f'{filepath}: {type(e).__name__}: {e}', file=sys.stderr)
+                continue
+            filepaths.append(filepath)
+            yield extracted_data
+
+    table = batch_calc_params(soundings(), config)
+    return filepaths, table
+
+
+def write_params_table(filepaths, table, f=None):
+
+    '''
+    Function to write a params table as CSV, one row per sounding file.
+    '''
+
+    writer = csv.writer(f or sys.stdout)
+    writer.writerow(['file'] + TABLE_COLUMNS)
+    for filepath, row in zip(filepaths, table):
+        writer.writerow([filepath] + [f'{value:.6g}' for value in row.tolist()])
+
+
+def align_to_grid(stacked, grid):
+
+    '''
+    Function to align stacked soundings on the levels of the grid: column k of every row holds the value
+    at grid[k], nan where the grid level is outside of the sounding (the first column of stack_soundings,
+    the lowest level of a sounding, is left out as it is not a grid level).
+
+    Parameters
+    ----------
+    stacked : dict(np.ndarray) : Stacked soundings (see stack_soundings), 'pressure' and any further keys.
+    grid : np.ndarray : The pressure levels the soundings were stacked on.
+
+    Returns
+    -------
+    dict(np.ndarray) : Every key except 'pressure', each of shape (n_soundings, len(grid)).
+    '''
+
+    pressure = stacked['pressure']
+    # the grid levels of a row are contiguous, starting at the first grid level below its lowest level
+    offsets = np.count_nonzero(grid[np.newaxis, :] >= pressure[:, :1], axis=1)
+    rows, columns = np.nonzero(~np.isnan(pressure[:, 1:]))
+    aligned = {}
+    for key, values in stacked.items():
+        if key != 'pressure':
+            aligned[key] = np.full((len(pressure), len(grid)), np.nan)
+            aligned[key][rows, offsets[rows] + columns] = values[rows, columns + 1]
+    return aligned
+
+
+def percentile_envelopes(aligned, percentiles=(10, 50, 90), min_members=2):
+
+    '''
+    Function to calculate percentiles over the sounding axis on every grid level, e.g. the p10/p50/p90
+    envelopes of an ensemble.
+
+    Parameters
+    ----------
+    aligned : dict(np.ndarray) : Soundings aligned on a common grid (see align_to_grid).
+    percentiles : tuple(float) : Percentiles in [0, 100].
+    min_members : int : Levels with fewer soundings are nan.
+
+    Returns
+    -------
+    dict(np.ndarray) : Per key an array of shape (len(percentiles), n_levels).
+    '''
+
+    envelopes = {}
+    for key, values in aligned.items():
+        valid = np.count_nonzero(~np.isnan(values), axis=0) >= max(min_members, 1)
+        envelope = np.full((len(percentiles), values.shape[1]), np.nan)
+        if valid.any():
+            envelope[:, valid] = np.nanpercentile(values[:, valid], percentiles, axis=0)
+        envelopes[key] = envelope
+    return envelopes
+
+
+def summarize_params_table(table, percentiles=(10, 50, 90)):
+
+    '''
+    Function to summarize a params table over its soundings (undefined values, e.g. no LFC, are left out).
+
+    Parameters
+    ----------
+    table : np.ndarray : Params table (see batch_calc_params).
+    percentiles : tuple(float) : Percentiles in [0, 100].
+
+    Returns
+    -------
+    dict(dict) : Per column of TABLE_COLUMNS 'min', 'p<percentile>' for every percentile, 'max' and 'n',
+        the number of soundings with a defined value.
+    '''
+
+    summary = {}
+    for column in TABLE_COLUMNS:
+        values = table[column][~np.isnan(table[column])]
+        stats = dict.fromkeys(['min', *[f'p{percentile:g}' for percentile in percentiles], 'max'], np.nan)
+        if len(values):
+            stats.update(zip(stats, [values.min(), *np.percentile(values, percentiles), values.max()]))
+        summary[column] = dict(stats, n=len(values))
+    return summary
+
+
+@timed()
+def calc_ensemble(soundings, config=None, percentiles=(10, 50, 90)):
+
+    '''
+    Function to calculate everything an overlay of many soundings (ensemble members, neighbouring grid points
+    or forecast hours) needs in one batched pass: the soundings and their parcel profiles on a common
+    log-pressure grid, the percentile envelopes of temperature and dewpoint on the grid levels and the
+    params table with its summary (see batch_calc_params).
+
+    Parameters
+    ----------
+    soundings : list(dict(pint.Quantity)) : extracted_data of the soundings (see extract_sounding).
+    config : dict, optional : Configuration dictionary, the grid is taken from config['batch_params'].
+    percentiles : tuple(float) : Percentiles of the envelopes and the summary.
+
+    Returns
+    -------
+    dict : 'grid' (hPa), 'pressure' (hPa), 'temp', 'dewpoint' and 'parcel' (K) as stacked arrays
+        (see stack_soundings), 'envelopes' (see percentile_envelopes), 'table' and 'summary'
+        (see summarize_params_table).
+    '''
+
+    batch_config = (config or {}).get('batch_params', {})
+    grid = pressure_grid(batch_config.get('pressure_range', (1050, 100)), batch_config.get('levels', 96))
+    with stage('stack_soundings'):
+        stacked = stack_soundings(soundings, grid)
+    with stage('calc_chunk'):
+        table, profile = _calc_chunk(stacked, return_profile=True)
+    stacked['parcel'] = profile
+    aligned = align_to_grid(stacked, grid)
+    return dict(stacked, grid=grid, table=table, summary=summarize_params_table(table, percentiles),
+                envelopes=percentile_envelopes({key: aligned[key] for key in ['temp', 'dewpoint']}, percentiles))
@@ -0,0 +1,203 @@
+from .units import units
+import metpy
+import numpy as np
+import hashlib
+import json
+import os
+import tempfile
+
+# bump when the layout of params or of the cache files changes, invalidates all entries
+CACHE_VERSION = 1
+CACHE_KEYS = ['pressure', 'temp', 'dewpoint']
+
+
+def params_key(extracted_data, options=None):
+
+    '''
+    Function to build the content address of a sounding: sha256 over the cleaned pressure,
+    temperature and dewpoint arrays (magnitudes and units), the MetPy version and the cache version.
+
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    options : dict, optional : Keyword arguments of the calculation (e.g. wet_bulb method), part of the key.
+
+    Returns
+    -------
+    str : Hex digest identifying the calc_params input.
+    '''
+
+    digest = hashlib.sha256(f'{CACHE_VERSION}|{metpy.__version__}'.encode())
+    for key in CACHE_KEYS:
+        values = extracted_data[key]
+        digest.update(f'|{key}|{values.units}|'.encode())
+        digest.update(np.ascontiguousarray(values.m, dtype=np.float64).tobytes())
+    if options:
+        digest.update(f'|{json.dumps(options, sort_keys=True)}'.encode())
+    return digest.hexdigest()
+
+
+def dump_params(params, file):
+
+    '''
+    Function to write a params dict (category -> name -> quantity, e.g. LazyParams.computed()) to a compact .npz file.
+    Every quantity is stored as a float array, a JSON manifest keeps category, name, tuple position and unit.
+    '''
+
+    arrays, manifest = {}, []
+    for category, values in params.items():
+        for name, value in values.items():
+            parts = value if isinstance(value, tuple) else (value,)
+            for i, part in enumerate(parts):
+                arrays[f'arr_{len(manifest)}'] = np.asarray(part.m, dtype=np.float64)
+                manifest.append([category, name, i if isinstance(value, tuple) else None, str(part.units)])
+    np.savez(file, manifest=np.array(json.dumps(manifest)), **arrays)
+
+
+def load_params(file):
+
+    '''
+    Function to read a params dict written by dump_params, with units attached again.
+    '''
+
+    with np.load(file) as data:
+        params = {}
+        for i, (category, name, position, unit) in enumerate(json.loads(data['manifest'][()])):
+            value = data[f'arr_{i}']
+            quantity = units.Quantity(value[()] if value.ndim == 0 else value, unit)
+            category_params = params.setdefault(category, {})
+            if position is None:
+                category_params[name] = quantity
+            else:
+                category_params[name] = category_params.get(name, ()) + (quantity,)
+        return params
+
+
+class ParamsCache:
+
+    '''
+    Persistent, content-addressed cache for calc_params results with size-bounded LRU eviction.
+    Entries are single .npz files named after params_key, recency is tracked through the file mtime,
+    so several processes (e.g. batch workers) can share one cache directory.
+
+    Parameters
+    ----------
+    directory : str : Directory holding the cache entries, created on first write.
+    max_size_mb : float : Maximum total size of all entries, least recently used ones are evicted first.
+    enabled : bool : If False, the cache is bypassed and calc_params always computes.
+    '''
+
+    def __init__(self, directory='.cache/params', max_size_mb=100, enabled=True):
+        self.directory = directory
+        self.max_size = max_size_mb * 1024 ** 2
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config):
+        cache_config = config.get('cache', {})
+        return cls(cache_config.get('directory', '.cache/params'),
+                   cache_config.get('max_size_mb', 100),
+                   cache_config.get('enabled', True))
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue # removed by another process in the meantime
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def get(self, key):
+        try:
+            params = load_params(self._path(key))
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            self.misses += 1 # missing or unreadable (e.g. partially evicted) entry
+            return None
+        os.utime(self._path(key)) # mark as recently used
+        self.hits += 1
+        return params
+
+    def put(self, key, params):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first, so concurrent readers never see half written entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                dump_params(params, f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+
+        '''
+        Removes least recently used entries until the cache is within max_size.
+        '''
+
+        entries = sorted(self._entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def calc_params(self, extracted_data, calc, **options):
+
+        '''
+        Returns the params of a sounding created by calc(extracted_data, **options) (LazyParams, e.g. calc_params),
+        with the cached values added. The entry holds the values calculated so far, it is written when the params
+        are flushed (LazyParams.flush, called by evaluate) after values that were not cached have been calculated.
+
+        Parameters
+        ----------
+        extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+        calc : callable : Function creating the LazyParams (e.g. calc_params).
+        options : Keyword arguments passed to calc, results with different options are cached separately.
+
+        Returns
+        -------
+        LazyParams : params as returned by calc
+        '''
+
+        params = calc(extracted_data, **options)
+        if not self.enabled:
+            return params
+
+        key = params_key(extracted_data, options)
+        cached = self.get(key)
+        if cached is not None:
+            params.update(cached)
+        params.on_flush = lambda params: self.put(key, params.computed())
+        return params
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(entries),
+            'size_mb': sum(size for _, size, _ in entries) / 1024 ** 2
+        }
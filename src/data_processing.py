@@ -1,8 +1,31 @@
-from metpy.units import units
-import metpy.calc as mpcalc
+from .units import units
 import numpy as np
+from bisect import bisect_left
 import json
-
+import glob
+import os
+from .ingest import features_to_columns
+from .ingest import extract_columns
+from .params import LazyParams
+from .params import wet_bulb_temperature
+from .params import wet_bulb_potential_temperature
+from .instrumentation import timed
+from .instrumentation import event
+
+# attributes extracted from every windy.com sounding
+ATTRIBUTES = ['pressure', 'temp', 'dewpoint', 'gpheight', 'wind_u', 'wind_v']
+
+# units of the attributes, attached by add_units (looked up once, registry attribute access is slow)
+DEFAULT_UNITS = {
+    'pressure': units.hPa,
+    'temp': units.degK,
+    'dewpoint': units.degK,
+    'gpheight': units.m,
+    'wind_u': units.knots,
+    'wind_v': units.knots
+}
+
+@timed()
 def load_json_data(filepath='src/config.json'):
 
     '''
@@ -25,6 +48,51 @@ def load_json_data(filepath='src/config.json'):
     except FileNotFoundError as e:
         raise FileNotFoundError(f'File \'{filepath}\' not found. Terminating program.') from e
 
+def collect_sounding_files(inputs):
+
+    '''
+    Function to resolve directories, glob patterns and file paths to a sorted list of sounding files.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories (all *.json files inside are used), glob patterns or file paths.
+
+    Returns
+    -------
+    list(str) : Sorted list of unique file paths.
+    '''
+
+    files = set()
+    for entry in inputs:
+        if os.path.isdir(entry):
+            files.update(glob.glob(os.path.join(entry, '*.json')))
+        else:
+            files.update(glob.glob(entry) or [entry]) # keep non-matching paths to report them as errors
+    return sorted(files)
+
+def sounding_time(windy_sounding):
+
+    '''
+    Function to get the valid time of a windy.com sounding: the 'time' property of the sounding,
+    or the earliest 'time' of its data points.
+
+    Parameters
+    ----------
+    windy_sounding : dict : JSON data (geojson) from windy.com.
+
+    Returns
+    -------
+    float : Unix timestamp in seconds, inf if the sounding has no time (sorted last).
+    '''
+
+    properties = windy_sounding.get('properties') or {}
+    if properties.get('time') is not None:
+        return float(properties['time'])
+    times = [feature['properties']['time'] for feature in windy_sounding.get('features', [])
+             if feature.get('properties', {}).get('time') is not None]
+    return float(min(times)) if times else float('inf')
+
+@timed()
 def extract_data(data, fields, min_points=5):
     
     '''
@@ -39,73 +107,334 @@ def extract_data(data, fields, min_points=5):
     Returns
     -------
     dict : A dictionary of lists where each list corresponds to a field's extracted data.
+        Only levels with all fields present and a pressure between 100 and 1000 hPa are kept.
     
     Raises
     ------
     ValueError : If data points are less than `min_points` or mismatched lengths.
     '''
 
-    extracted_data = {field: [] for field in fields}  # Using a dictionary for clarity
+    # single pass over the features into typed columns, missing values and pressure filtering via masks
+    columns = features_to_columns(data['features'], fields)
+    extracted_columns = extract_columns(columns, fields, min_points)
 
-    for feature in data['features']:
-        properties = feature['properties']
+    return {field: values.tolist() for field, values in extracted_columns.items()}
 
-        current_values = [properties.get(field) for field in fields]
+def rolling_median_mad(values, window):
 
-        if all(current_values):
-            if 'pressure' in fields and not (1000 > float(current_values[fields.index('pressure')]) > 100):
-                continue  # Skip based on pressure filtering
+    '''
+    Function to calculate the centered rolling median and median absolute deviation (MAD) of a 1D array.
+    Edges are padded with the outermost values, so the output has the same length as the input.
 
-            for i, field in enumerate(fields):
-                extracted_data[field].append(float(current_values[i]))
+    Parameters
+    ----------
+    values : np.ndarray : 1D array of values.
+    window : int : Odd window length in samples.
 
-    # Ensure data validity
-    # check needed?
-    if any(len(values) < min_points for values in extracted_data.values()) or \
-       not all(len(values) == len(extracted_data[fields[0]]) for values in extracted_data.values()):
-        raise ValueError('Too few data points or mismatched lengths.')
-        
-    return extracted_data
+    Returns
+    -------
+    tuple(np.ndarray, np.ndarray) : rolling median and rolling MAD
+    '''
+
+    half = window // 2
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(values, half, mode='edge'), 2 * half + 1)
+    median = np.median(windows, axis=1)
+    mad = np.median(np.abs(windows - median[:, np.newaxis]), axis=1)
+    return median, mad
+
+def decreasing_levels(pressure):
+
+    '''
+    Function to find the longest strictly decreasing sequence of pressures (the most levels of a sounding that
+    are ordered from the surface upwards), so a single glitch only removes the glitching row and not every
+    valid level after it. Patience sorting, O(n log n).
+
+    Parameters
+    ----------
+    pressure : np.ndarray : Pressure of the rows, nan rows are never part of the sequence.
+
+    Returns
+    -------
+    np.ndarray(bool) : Mask of the rows of the sequence.
+    '''
+
+    pressure = np.asarray(pressure, dtype=float)
+    valid = ~np.isnan(pressure)
+    if np.all(np.diff(pressure[valid]) < 0): # already ordered, the usual case
+        return valid
+
+    tails, tail_rows = [], [] # smallest last -pressure of increasing sequences of every length, and its row
+    previous = np.full(len(pressure), -1)
+    for row, value in enumerate(-pressure):
+        if np.isnan(value):
+            continue
+        position = bisect_left(tails, value)
+        if position == len(tails):
+            tails.append(value)
+            tail_rows.append(row)
+        else:
+            tails[position], tail_rows[position] = value, row
+        previous[row] = tail_rows[position - 1] if position else -1
+
+    keep = np.zeros(len(pressure), dtype=bool)
+    row = tail_rows[-1] if tail_rows else -1
+    while row >= 0:
+        keep[row] = True
+        row = previous[row]
+    return keep
+
+def detect_outliers(columns, config):
+
+    '''
+    Function to flag probe measurements (rows) that should be removed from a sounding.
+    All checks are boolean masks over the columns, the run time is linear in the number of rows
+    (O(n log n) for the pressure order).
+
+    Checks (configured in config.json)
+    ----------------------------------
+    - default_ranges: value outside of the specified range (per field)
+    - cleaning.spike_detection: deviation from the rolling median of more than `threshold` robust
+      standard deviations (1.4826 * MAD, at least `min_deviation`)
+    - cleaning.non_monotonic_pressure: rows outside of the longest strictly decreasing pressure sequence
+      of the rows passing the other checks (see decreasing_levels)
+    - cleaning.dewpoint_above_temp: dewpoint higher than temperature by more than cleaning.dewpoint_tolerance
+      (rounding of saturated levels)
+
+    Parameters
+    ----------
+    columns : dict(np.ndarray) : Dict with one 1D array per field (e.g. from extract_data).
+    config : dict : Configuration dictionary containing default_ranges and cleaning settings.
+
+    Returns
+    -------
+    tuple(np.ndarray, dict) : mask of rows to keep and rejection report,
+        mapping each failed check (e.g. 'range:temp', 'spike:wind_u') to the rejected row indices.
+    '''
+
+    n_rows = len(next(iter(columns.values())))
+    cleaning = config.get('cleaning', {})
+    checks = {}
+
+    for key, (min_val, max_val) in config['default_ranges'].items():
+        if key in columns and None not in (min_val, max_val): # skip fields without a complete range
+            checks[f'range:{key}'] = ~((columns[key] >= min_val) & (columns[key] <= max_val))
+
+    spikes = cleaning.get('spike_detection', {})
+    if spikes.get('enabled', False) and n_rows >= spikes['window']:
+        for key in spikes['fields']:
+            if key in columns:
+                median, mad = rolling_median_mad(columns[key], spikes['window'])
+                scale = np.maximum(1.4826 * mad, spikes['min_deviation'])
+                checks[f'spike:{key}'] = np.abs(columns[key] - median) > spikes['threshold'] * scale
+
+    if cleaning.get('dewpoint_above_temp', False) and {'temp', 'dewpoint'} <= columns.keys():
+        checks['dewpoint_above_temp'] = columns['dewpoint'] > columns['temp'] + cleaning.get('dewpoint_tolerance', 0.1)
+
+    keep = np.ones(n_rows, dtype=bool)
+    for rejected in checks.values():
+        keep &= ~rejected
 
-def clean_extracted_data(extracted_data, config):
+    if cleaning.get('non_monotonic_pressure', False) and 'pressure' in columns:
+        # every level has to be above (lower pressure than) the previous levels, rows rejected by the other
+        # checks do not take part, of a glitch only the offending rows are removed
+        ordered = decreasing_levels(np.where(keep, columns['pressure'], np.nan))
+        checks['non_monotonic_pressure'] = keep & ~ordered
+        keep &= ordered
+
+    report = {name: np.flatnonzero(rejected) for name, rejected in checks.items() if rejected.any()}
+    return keep, report
+
+@timed()
+def clean_extracted_data(extracted_data, config, return_report=False):
 
     '''
     Function to remove probe measurements (rows) with measurements that are outside of specified ranges (config.json)
+    or flagged by the optional robust checks (see detect_outliers).
 
     Parameters
     ----------
-    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    extracted_data :  dict(list) :  Dict with one list or array of values per field from sounding
     config : dict : Configuration dictionary containing plot settings and functionalities.
+    return_report : bool : If True, the rejection report of detect_outliers is returned as well.
 
     Returns
     -------
-    dict : cleaned extracted_data
+    dict(np.ndarray) : cleaned extracted_data
+    dict : rejection report, only if return_report is True
     '''
 
-    default_ranges = config['default_ranges']
-    indices_to_remove = {key: [] for key in extracted_data.keys()}
+    columns = {key: np.asarray(values, dtype=float) for key, values in extracted_data.items()}
+    keep, report = detect_outliers(columns, config)
 
-    for key, values in extracted_data.items():
-        if key in default_ranges:
-            min_val, max_val = default_ranges.get(key, (None, None))
-            if None in (min_val, max_val): 
-                print(f'function: clean_extracted_data -- skipping {key} since range could not be found.')
-                continue # if range couldn't be retreived
-            for index, value in enumerate(values):
-                if not (min_val <= value <= max_val):
-                    indices_to_remove[key].append((index, value))
+    event('clean_extracted_data', removed_rows=int(np.count_nonzero(~keep)),
+          report={name: rows.tolist() for name, rows in report.items()})
 
-    indices_to_remove_list = sum(indices_to_remove.values(), [])
-    print(f'function: clean_extracted_data -- indices to remove: {indices_to_remove} ({len(indices_to_remove_list)} indices)')
-    
-    if len(indices_to_remove_list) == 0:
-        return extracted_data
+    cleaned = {key: values[keep] for key, values in columns.items()}
+    return (cleaned, report) if return_report else cleaned # return cleaned data
+
+def inversion_levels(temp, min_strength=0.0):
 
-    for lst in extracted_data.values():
-        for idx,_ in sorted(indices_to_remove_list, reverse=True):
-            lst.pop(idx)
-    return extracted_data # return cleaned data
+    '''
+    Function to find the base and top of every inversion layer (temperature increasing with height,
+    i.e. with decreasing pressure) of a sounding.
+
+    Parameters
+    ----------
+    temp : np.ndarray : Temperature of the levels, ordered from the surface upwards.
+    min_strength : float : Minimum temperature increase from base to top of a layer.
+
+    Returns
+    -------
+    np.ndarray : Sorted indices of the bases and tops.
+    '''
+
+    rising = np.diff(temp) > 0
+    edges = np.diff(np.concatenate(([0], rising.astype(np.int8), [0])))
+    bases, tops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) # runs of rising steps: levels base..top
+    strong = temp[tops] - temp[bases] >= min_strength
+    return np.union1d(bases[strong], tops[strong])
+
+def significant_levels(log_pres, fields, tolerances, keep=None):
+
+    '''
+    Function to select the levels of a sounding needed to reproduce every field within a tolerance by linear
+    interpolation in log-pressure between the selected levels (Ramer-Douglas-Peucker). All segments are split
+    at once per iteration: the fields are interpolated between the selected levels for all levels in one
+    vectorized step, and the level with the largest error of every segment exceeding the tolerance is added,
+    until no level exceeds it. The error of a level is the largest of its field errors relative to their tolerances.
 
+    Parameters
+    ----------
+    log_pres : np.ndarray : Log-pressure of the levels, monotonic.
+    fields : list(np.ndarray) : Values of every field at the levels (e.g. temperature, dewpoint, wind_u, wind_v).
+    tolerances : list(float) : Maximum interpolation error of every field.
+    keep : np.ndarray(bool), optional : Levels which are always selected. The first and last level always are.
+
+    Returns
+    -------
+    np.ndarray(bool) : Mask of the selected levels.
+    '''
+
+    n = len(log_pres)
+    selected = np.zeros(n, dtype=bool) if keep is None else np.array(keep, dtype=bool)
+    selected[[0, -1]] = True
+    values = np.column_stack(fields) / np.asarray(tolerances, dtype=float) # errors > 1 exceed the tolerance
+    levels = np.arange(n)
+
+    while True:
+        kept = np.flatnonzero(selected)
+        if len(kept) == n:
+            break
+        # selected levels enclosing every level, the last level belongs to the last segment
+        segment = np.minimum(np.searchsorted(kept, levels, side='right') - 1, len(kept) - 2)
+        lower, upper = kept[segment], kept[segment + 1]
+        spacing = log_pres[upper] - log_pres[lower]
+        frac = np.divide(log_pres - log_pres[lower], spacing, out=np.zeros(n), where=spacing != 0)
+        error = np.abs(values - (values[lower] + frac[:, None] * (values[upper] - values[lower])))
+        error = np.where(np.isnan(error), 0.0, error).max(axis=1)
+        error[selected] = 0.0
+
+        # level with the largest error per segment, if above the tolerance
+        segment_max = np.maximum.reduceat(error, kept[:-1])
+        candidates = np.flatnonzero((error == segment_max[segment]) & (error > 1.0))
+        if len(candidates) == 0:
+            break
+        first = np.concatenate(([True], np.diff(segment[candidates]) != 0)) # ties: one level per segment
+        selected[candidates[first]] = True
+    return selected
+
+@timed()
+def decimate_extracted_data(extracted_data, config, return_report=False):
+
+    '''
+    Function to reduce a high-resolution sounding to its significant levels (see significant_levels) with the
+    tolerances of config['decimation']: temperature within max_temp_error (K), dewpoint within max_dewpoint_error (K),
+    wind components within max_wind_error (knots) and geopotential height within max_height_error (m) of the full
+    sounding, interpolated linearly in log-pressure. The surface and top level, the base and top of every inversion
+    of at least min_inversion (K) and the levels enclosing the hodograph pressure levels (so the interpolated winds
+    are unchanged) are always kept. Soundings with less than min_levels levels are returned unchanged.
+
+    Parameters
+    ----------
+    extracted_data :  dict(np.ndarray) :  Dict with one array of values per field, cleaned (see clean_extracted_data)
+    config : dict : Configuration dictionary containing the decimation and hodograph settings.
+    return_report : bool : If True, a report (levels before and after, compression ratio, kept inversion and
+        hodograph levels) is returned as well.
+
+    Returns
+    -------
+    dict(np.ndarray) : decimated extracted_data
+    dict : report, only if return_report is True
+    '''
+
+    settings = config.get('decimation', {})
+    columns = {key: np.asarray(values, dtype=float) for key, values in extracted_data.items()}
+    n = len(columns['pressure'])
+    report = {'levels_before': n, 'levels_after': n, 'compression_ratio': 1.0, 'inversion_levels': 0, 'hodograph_levels': 0}
+    if n < max(settings.get('min_levels', 100), 3):
+        return (columns, report) if return_report else columns
+
+    keep = np.zeros(n, dtype=bool)
+    if 'temp' in columns:
+        inversions = inversion_levels(columns['temp'], settings.get('min_inversion', 1.0))
+        keep[inversions] = True
+        report['inversion_levels'] = len(inversions)
+
+    pres = columns['pressure']
+    levels = np.sort(np.array(config['hodograph']['pressure_levels'], dtype=float))[::-1]
+    levels = levels[(levels <= pres.max()) & (levels >= pres.min())]
+    if len(levels):
+        lower, upper, _ = log_pressure_weights(pres, levels)
+        hodograph = np.union1d(lower, upper)
+        keep[hodograph] = True
+        report['hodograph_levels'] = len(hodograph)
+
+    tolerances = {'temp': settings.get('max_temp_error', 1.0), 'dewpoint': settings.get('max_dewpoint_error', 2.0),
+                  'wind_u': settings.get('max_wind_error', 2.0), 'wind_v': settings.get('max_wind_error', 2.0),
+                  'gpheight': settings.get('max_height_error', 20.0)}
+    fields = [key for key in tolerances if key in columns]
+    selected = significant_levels(np.log(pres), [columns[key] for key in fields], [tolerances[key] for key in fields], keep)
+
+    decimated = {key: values[selected] for key, values in columns.items()}
+    report.update(levels_after=int(np.count_nonzero(selected)), compression_ratio=n / np.count_nonzero(selected))
+    event('decimate_extracted_data', **report)
+    return (decimated, report) if return_report else decimated
+
+def decimation_effect(extracted_data, decimated, config):
+
+    '''
+    Function to calculate the change of CAPE, CIN and lifted index caused by decimate_extracted_data.
+
+    Parameters
+    ----------
+    extracted_data, decimated :  dict(np.ndarray) :  Sounding before and after the decimation (without units).
+    config : dict : Configuration dictionary containing the calculation settings.
+
+    Returns
+    -------
+    dict : (before, after) per parameter, CAPE and CIN in J/kg, lifted index in K.
+    '''
+
+    calculation = config.get('calculation', {})
+    values = []
+    for data in (extracted_data, decimated):
+        params = calc_params(add_units(data), calculation.get('wet_bulb', 'metpy'), calculation.get('backend', 'metpy'))
+        values.append({'cape': float(params['cape_cin']['CAPE'].m_as('J/kg')),
+                       'cin': float(params['cape_cin']['CIN'].m_as('J/kg')),
+                       'lifted_index': float(np.ravel(params['indices']['Lifted Index'].m_as('K'))[0])})
+    return {name: (values[0][name], values[1][name]) for name in values[0]}
+
+def _clean_and_decimate(extracted_data, config):
+    # cleaning and the optional decimation stage of the pipeline
+    extracted_data = clean_extracted_data(extracted_data, config) # clean data from outliers
+    if not config.get('decimation', {}).get('enabled', False):
+        return extracted_data
+    decimated, report = decimate_extracted_data(extracted_data, config, return_report=True)
+    if config['decimation'].get('report', False) and report['levels_after'] < report['levels_before']:
+        event('decimation_effect', **decimation_effect(extracted_data, decimated, config))
+    return decimated
+
+@timed()
 def add_units(extracted_data):
 
     '''
@@ -113,25 +442,43 @@ def add_units(extracted_data):
 
     Parameters
     ----------
-    extracted_data :  dict(list) :  Dict with pint.Quantity values from sounding
+    extracted_data :  dict(list) :  Dict with lists or arrays of values from sounding
 
     Returns
     -------
     list : list of numpy arrays with corresponding units attatched
     '''
 
-    default_units = {
-        'pressure': units.hPa,
-        'temp': units.degK,
-        'dewpoint': units.degK,
-        'gpheight': units.m,
-        'wind_u': units.knots,
-        'wind_v': units.knots
-    }
-    return {key: np.array(val) * default_units[key] for key, val in extracted_data.items()}
+    # Quantity(array, unit) wraps the float64 array directly, array * unit goes through pint's arithmetic
+    return {key: units.Quantity(np.array(val, dtype=np.float64), DEFAULT_UNITS[key]) for key, val in extracted_data.items()}
+
 
+def calc_wet_bulb(pres, temp, dew, theta_e, method='metpy'):
 
-def calc_params(extracted_data):
+    '''
+    Function to calculate wet-bulb and wet-bulb potential temperature of every level.
+
+    Parameters
+    ----------
+    pres, temp, dew : pint.Quantity : Pressure, temperature and dewpoint profiles.
+    theta_e : pint.Quantity : Equivalent potential temperature of the levels (reused for θw).
+    method : str : 'metpy' (mpcalc, one lcl and moist adiabat solve per level) or
+        'vectorized' (thermo.py, all levels at once, within 1e-4 K of MetPy).
+
+    Returns
+    -------
+    tuple(pint.Quantity) : Wet-bulb temperature and wet-bulb potential temperature.
+
+    Raises
+    ------
+    ValueError : If the method is unknown.
+    '''
+
+    return (wet_bulb_temperature(pres, temp, dew, method),
+            wet_bulb_potential_temperature(pres, temp, dew, theta_e, method))
+
+
+def calc_params(extracted_data, wet_bulb='metpy', backend='metpy'):
     
     '''
     Function to calculate meteorological parameters like points (lcl, lfc...), 
@@ -141,51 +488,166 @@ def calc_params(extracted_data):
     Parameters
     ----------
     extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    wet_bulb : str : Method for the wet-bulb temperatures, see calc_wet_bulb.
+    backend : str : 'metpy' (metpy.calc with pint) or 'fast' (unit-free float arrays, units attached to the results).
 
     Returns
     -------
-    dict : Contains all calculated temperatures, indices, points and quantities
-    '''
-
-    pres, temp, dew = [extracted_data.get(key, 1) for key in ['pressure', 'temp', 'dewpoint']]
-
-    parcel_profile = mpcalc.parcel_profile(pres, temp[0], dew[0])
-    cape, cin = mpcalc.cape_cin(pres, temp, dew, parcel_profile)
-
-    params = {
-        'points': {
-            'LCL': mpcalc.lcl(pres[0], temp[0], dew[0]),
-            'LFC': mpcalc.lfc(pres, temp, dew),
-            'EL': mpcalc.el(pres, temp, dew),
-            'CCL': mpcalc.ccl(pres, temp, dew)[:2]  # Extracted only necessary values
-        },
-        'cape_cin': {
-            'CAPE': cape,
-            'CIN': cin
-        },
-        'temperatures': {
-            '\u03B8e': mpcalc.equivalent_potential_temperature(pres, temp, dew),
-            'Tw': mpcalc.wet_bulb_temperature(pres, temp, dew),
-            '\u03B8w': mpcalc.wet_bulb_potential_temperature(pres, temp, dew)
-        },
-        'indices': {
-            'Lifted Index': mpcalc.lifted_index(pres, temp, parcel_profile),
-            'K Index': mpcalc.k_index(pres, temp, dew),
-            'Total Totals Index': mpcalc.total_totals_index(pres, temp, dew),
-            'Showalter Index': mpcalc.showalter_index(pres, temp, dew)
-        },
-        'other': {
-            'Parcel Profile': parcel_profile
+    LazyParams : Mapping category -> name -> value of all temperatures, indices, points and quantities:
+        points (LCL, LFC, EL, CCL), cape_cin, temperatures (θe, Tw, θw per level), indices and
+        other (parcel profile). Every value is calculated with its dependencies on first access
+        (see params.param_graph), so only the values a caller reads are ever calculated.
+        Instrumentation records LazyParams.evaluate as stage 'calc_params' and every node as its own stage.
+    '''
+
+    return LazyParams(extracted_data, wet_bulb, backend)
+
+def serialize_params(params, skip=('other',)):
+
+    '''
+    Function to convert params (see calc_params) into JSON serializable values.
+
+    Parameters
+    ----------
+    params : dict : Parameters calculated by calc_params.
+    skip : tuple : Categories to leave out, per default the per-level parcel profile.
+
+    Returns
+    -------
+    dict : Same structure as params, every quantity as {'value': float or list, 'units': str},
+        points as list of such dicts (pressure, temperature).
+    '''
+
+    def serialize(quantity):
+        value = np.asarray(quantity.m, dtype=float)
+        value = value.item() if value.size == 1 else value.tolist() # e.g. lifted index comes as array of length 1
+        return {'value': value, 'units': f'{quantity.units:~}'}
+
+    return {
+        category: {
+            name: [serialize(q) for q in value] if isinstance(value, tuple) else serialize(value)
+            for name, value in values.items()
         }
+        for category, values in params.items() if category not in skip
     }
 
-    return params
+@timed()
+def extract_sounding(windy_sounding, config):
+
+    '''
+    Function to run the data part of the processing pipeline on a windy.com sounding:
+    extract -> clean -> (decimate, see decimate_extracted_data) -> add units.
+
+    Parameters
+    ----------
+    windy_sounding : dict : The JSON formatted sounding data (see load_json_data).
+    config : dict : Configuration dictionary containing plot settings and functionalities.
+
+    Returns
+    -------
+    dict(pint.Quantity) : extracted_data with units attached
+    '''
+
+    extracted_data = extract_data(windy_sounding, ATTRIBUTES) # extract data from raw json format
+    extracted_data = _clean_and_decimate(extracted_data, config) # clean data from outliers, optionally decimate
+    return add_units(extracted_data) # add units to data for displaying and further calculations
+
+@timed()
+def process_columns(extracted_data, config, cache=None):
+
+    '''
+    Function to run the processing pipeline on already extracted data (e.g. array views from a SoundingArchive):
+    clean -> (decimate) -> add units -> calculate parameters.
 
+    Parameters
+    ----------
+    extracted_data :  dict(list) :  Dict with one list or array of values per field from sounding (see extract_data)
+    config : dict : Configuration dictionary containing plot settings and functionalities.
+    cache : ParamsCache, optional : On-disk cache to look up params in before calculating them.
+
+    Returns
+    -------
+    tuple(dict, dict) : extracted_data with units attached and the params calculated by calc_params
+    '''
+
+    extracted_data = _clean_and_decimate(extracted_data, config) # clean data from outliers, optionally decimate
+    extracted_data = add_units(extracted_data) # add units to data for displaying and further calculations
+
+    # calculate indices, temperatures, points like lcl, lfc, el, lcc, cape, cin...
+    calculation = config.get('calculation', {})
+    options = {'wet_bulb': calculation.get('wet_bulb', 'metpy'), 'backend': calculation.get('backend', 'metpy')}
+    params = cache.calc_params(extracted_data, calc_params, **options) if cache else calc_params(extracted_data, **options)
+    return extracted_data, params
+
+@timed()
+def process_sounding(windy_sounding, config, cache=None):
+
+    '''
+    Function to run the processing pipeline on a windy.com sounding:
+    extract -> clean -> add units -> calculate parameters.
+
+    Parameters
+    ----------
+    windy_sounding : dict : The JSON formatted sounding data (see load_json_data).
+    config : dict : Configuration dictionary containing plot settings and functionalities.
+    cache : ParamsCache, optional : On-disk cache to look up params in before calculating them.
+
+    Returns
+    -------
+    tuple(dict, dict) : extracted_data with units attached and the params calculated by calc_params
+    '''
+
+    return process_columns(extract_data(windy_sounding, ATTRIBUTES), config, cache) # extract data from raw json format
+
+def log_pressure_weights(pressure, levels):
+
+    '''
+    Function to calculate the indices and weights for linear interpolation in log-pressure
+    from a sounding to pressure levels, using np.searchsorted. The weights can be applied to any
+    number of variables on the same sounding (see interpolate_to_levels).
+
+    Parameters
+    ----------
+    pressure : np.ndarray : Pressure of the sounding, decreasing with index.
+    levels : np.ndarray : Pressure levels to interpolate to, within the range of pressure.
+
+    Returns
+    -------
+    tuple(np.ndarray, np.ndarray, np.ndarray) : lower and upper sample index and weight of the upper sample
+    '''
+
+    log_pres = np.log(pressure[::-1]) # searchsorted needs ascending values
+    log_levels = np.log(levels)
+
+    upper = np.clip(np.searchsorted(log_pres, log_levels), 1, len(log_pres) - 1)
+    lower = upper - 1
+    spacing = log_pres[upper] - log_pres[lower]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(spacing > 0, (log_levels - log_pres[lower]) / spacing, 0.0) # 0 for duplicate levels
+
+    # convert back to indices of the (decreasing) sounding
+    n = len(pressure)
+    return n - 1 - lower, n - 1 - upper, weight
+
+def interpolate_to_levels(values, indices):
+
+    '''
+    Function to apply interpolation indices and weights from log_pressure_weights to an array
+    (levels along the first axis, further axes e.g. for many soundings on the same levels).
+    '''
+
+    lower, upper, weight = indices
+    weight = weight.reshape(weight.shape + (1,) * (values.ndim - 1))
+    return values[lower] * (1 - weight) + values[upper] * weight
+
+@timed()
 def extract_relevant_wind_data(extracted_data, config):
     
     '''
-    Function that filters out wind_u and wind_v samples from specific height levels specified in config.json,
-    e.g. 1000, 975, 950, 925, 900, 850, 800, 700, 600... hPa (pressure levels)
+    Function that interpolates wind_u and wind_v (linear in log-pressure) to the pressure levels specified in config.json,
+    e.g. 1000, 975, 950, 925, 900, 850, 800, 700, 600... hPa (pressure levels).
+    Levels outside of the sounding's pressure range are left out. display_sounding calculates it once and
+    passes it to the skew-t barbs and the hodograph.
 
     Parameters
     ----------
@@ -194,37 +656,23 @@ def extract_relevant_wind_data(extracted_data, config):
 
     Returns
     -------
-    dict : extracted_data with only keys being wind_u, wind_v and pressure
+    dict : wind_u, wind_v and pressure at the pressure levels
     '''
 
     # load pressure, wind_u and win_v from extracted_data variable
     pres, wind_u, wind_v = [extracted_data.get(key, 1) for key in ['pressure', 'wind_u', 'wind_v']]
-    
-    # create dictionary for selected data to return
-    extracted_wind_data = {key: [] for key in ['pressure', 'wind_u', 'wind_v']}
-
     pres_lvls = config['hodograph']['pressure_levels']
 
-    if len(pres) > len(pres_lvls)+5:
+    pres_hpa = pres.to('hPa').m
+    levels = np.sort(np.array(pres_lvls, dtype=float))[::-1]
+    levels = levels[(levels <= pres_hpa.max()) & (levels >= pres_hpa.min())]
 
-        indices = []
-        index_pres_lvls = 0
-    
-        for i, val in enumerate(pres):
-            if val.m <= pres_lvls[index_pres_lvls]:
-
-                if pres_lvls[index_pres_lvls] >= val.m >= pres_lvls[index_pres_lvls+1]:
-                    indices.append(i)
-                index_pres_lvls += 1
-
-        extracted_wind_data['pressure'] = np.array([pres[x].m for x in indices]) * pres.units
-        extracted_wind_data['wind_u'] = np.array([wind_u[x].m for x in indices]) * wind_u.units
-        extracted_wind_data['wind_v'] = np.array([wind_v[x].m for x in indices]) * wind_v.units
-
-        print(f'\nHodograph datapoint selection:')
-        for x in extracted_wind_data.values():
-            print(f'ARRAY: {x}, LENGTH: {len(x)}')
+    indices = log_pressure_weights(pres_hpa, levels)
+    extracted_wind_data = {
+        'pressure': (levels * units.hPa).to(pres.units),
+        'wind_u': interpolate_to_levels(wind_u.m, indices) * wind_u.units,
+        'wind_v': interpolate_to_levels(wind_v.m, indices) * wind_v.units
+    }
 
-        return extracted_wind_data
-    
-    return extracted_data
+    event('extract_relevant_wind_data', levels=levels.tolist())
+    return extracted_wind_data
@@ -1,15 +1,21 @@
+from .units import units
+from .units import enable_matplotlib_units
 from metpy.plots import SkewT
 from metpy.plots import Hodograph
-from metpy.units import units
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
+import numpy as np
 from .data_processing import extract_relevant_wind_data
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
+from .params import text_categories
+from .params import magnitude
+from .instrumentation import timed
 import webbrowser
 
+enable_matplotlib_units() # plotting pint.Quantity values needs pint's matplotlib converters
 
-def display_skewt_plot(extracted_data, config, params, fig, gridspec):
+
+@timed()
+def display_skewt_plot(extracted_data, config, params, fig, gridspec, wind_data=None):
 
     '''
     Creates a Skew-T plot using the provided pressure, temperature, dewpoint, 
@@ -22,10 +28,11 @@ def display_skewt_plot(extracted_data, config, params, fig, gridspec):
     params : dict : Additional parameters used for plotting and displaying (e.g., parcel profile, temperatures).
     fig : matplotlib.figure.Figure : A Matplotlib figure object to plot on.
     gridspec : matplotlib.gridspec.GridSpec, optional : Gridspec to set the position of skew-t in fig.
+    wind_data : dict, optional : Result of extract_relevant_wind_data, calculated if not given.
 
     Returns
     -------
-    None
+    metpy.plots.SkewT : The skew-t, e.g. to attach a ParcelTool.
     
     Functionalities
     ---------------
@@ -40,52 +47,59 @@ def display_skewt_plot(extracted_data, config, params, fig, gridspec):
     pres, temp, dew = [extracted_data.get(key, 1) for key in ['pressure', 'temp', 'dewpoint']]
 
     skewt_config = config['skewt']
-    parcel_profile = params['other']['Parcel Profile'].to('degC')
+    functionalities = skewt_config['functionalities']
+
+    # plain arrays in the axis units (hPa, degC), converted once instead of by pint's matplotlib converter on every call
+    pres_hpa = magnitude(pres, units.hPa)
+    temp_c, dew_c = magnitude(temp, units.degC), magnitude(dew, units.degC)
+    parcel_profile = magnitude(params['other']['Parcel Profile'], units.degC)
 
     skew = SkewT(fig, rotation=45, subplot=gridspec)
 
-    skew.plot(pres, temp, 'red', label='Temperature')
-    skew.plot(pres, dew, 'blue', label='Dewpoint')
-    skew.plot(pres, parcel_profile, 'k', linestyle='--', label='Parcel Trace')
+    skew.plot(pres_hpa, temp_c, 'red', label='Temperature')
+    skew.plot(pres_hpa, dew_c, 'blue', label='Dewpoint')
+    skew.plot(pres_hpa, parcel_profile, 'k', linestyle='--', label='Parcel Trace')
 
     skew.plot_dry_adiabats(lw=1, linestyle='solid', colors='darkgreen', alpha=0.4)
     skew.plot_moist_adiabats(lw=1, linestyle='dashed', colors='darkgreen', alpha=0.4)
     skew.plot_mixing_lines(lw=1, linestyle='dashed', colors='darkblue', alpha=0.4)
 
-    wind_data = extract_relevant_wind_data(extracted_data, config)
+    if wind_data is None:
+        wind_data = extract_relevant_wind_data(extracted_data, config)
     barb_pres, barb_wind_u, barb_wind_v = [wind_data.get(key, 1) for key in ['pressure', 'wind_u', 'wind_v']]
-    skew.plot_barbs(barb_pres, barb_wind_u, barb_wind_v) # <=============== AMOUNT OF FLAGS
+    skew.plot_barbs(magnitude(barb_pres, units.hPa), barb_wind_u.m, barb_wind_v.m) # <=============== AMOUNT OF FLAGS
         
     # adding temperatures
-    if skewt_config['functionalities']['show_equiv_pot_temp']:
-        skew.plot(pres, params['temperatures']['\u03B8e'], c='pink',
+    if functionalities['show_equiv_pot_temp']:
+        skew.plot(pres_hpa, magnitude(params['temperatures']['\u03B8e'], units.degC), c='pink',
                     lw=2, linestyle='solid', label='Equivalent Potential Temperature')
 
-    if skewt_config['functionalities']['show_wb_temp']:
-        skew.plot(pres, params['temperatures']['Tw'].to('degC'), c='lightblue',
+    if functionalities['show_wb_temp']:
+        skew.plot(pres_hpa, magnitude(params['temperatures']['Tw'], units.degC), c='lightblue',
                     lw=2, linestyle='solid', label='Wet-Bulb Temperature')
 
-    if skewt_config['functionalities']['show_wb_pot_temp']:
-        skew.plot(pres, params['temperatures']['\u03B8w'].to('degC'), c='lightblue',
+    if functionalities['show_wb_pot_temp']:
+        skew.plot(pres_hpa, magnitude(params['temperatures']['\u03B8w'], units.degC), c='lightblue',
                     lw=2, linestyle='dotted', label='Wet-Bulb Potential Temperature')
 
     # adding CAPE and CIN area to plot
-    if skewt_config['functionalities']['show_cape_cin']:
-        skew.shade_cape(pres, temp, parcel_profile)
-        skew.shade_cin(pres, temp, parcel_profile)
+    if functionalities['show_cape_cin']:
+        skew.shade_cape(pres_hpa, temp_c, parcel_profile)
+        skew.shade_cin(pres_hpa, temp_c, parcel_profile)
 
     # show parameters as points in plot
-    if skewt_config['functionalities']['show_params']:
-        y = [l[0] for l in params.get('points').values()]
-        x = [l[1] for l in params.get('points').values()]
-        labels = list(params.get('points').keys())
+    if functionalities['show_params']:
+        points = params['points']
+        y = [float(magnitude(point[0], units.hPa)) for point in points.values()]
+        x = [float(magnitude(point[1], units.degC)) for point in points.values()]
+        labels = list(points.keys())
 
         # show params as points in plot
         skew.ax.scatter(x, y, marker='x', c='purple', s=50, zorder=5) 
 
         # Add labels to each point
         for i, label in enumerate(labels):        
-            skew.ax.text(x[i] + 1 * units.degK, y[i], label, c='purple',fontsize=8, zorder=5)
+            skew.ax.text(x[i] + 1, y[i], label, c='purple',fontsize=8, zorder=5)
 
     skew.ax.set_xlabel(f'temperature ({units.degC})')
     skew.ax.set_ylabel(f'pressure ({units.hPa})')
@@ -95,8 +109,10 @@ def display_skewt_plot(extracted_data, config, params, fig, gridspec):
     skew.ax.grid(skewt_config['grid'])
     skew.ax.set_title(skewt_config['title'])
     if skewt_config['legend']: skew.ax.legend()
+    return skew
 
-def display_hodograph_plot(extracted_data, config, ax):
+@timed()
+def display_hodograph_plot(extracted_data, config, ax, wind_data=None):
 
     '''
     Creates a Hodograph plot using the provided geopotential height, wind components,
@@ -107,6 +123,7 @@ def display_hodograph_plot(extracted_data, config, ax):
     extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
     config : dict : Configuration dictionary containing plot settings and functionalities.
     ax : matplotlib.axes.Axes : A Matplotlib axes object.
+    wind_data : dict, optional : Result of extract_relevant_wind_data, calculated if not given.
 
     Returns
     -------
@@ -116,9 +133,10 @@ def display_hodograph_plot(extracted_data, config, ax):
     ---------------
     - Plots a hodograph with colormapped wind vectors by height.
     - Adds a grid to the hodograph plot based on the configured grid increment.
-    - Reduces amount of displayed datapoints to the measurements at pressure levels derived from config.
+    - Reduces amount of displayed datapoints to winds interpolated to the pressure levels derived from config.
     '''
-    wind_data = extract_relevant_wind_data(extracted_data, config)
+    if wind_data is None:
+        wind_data = extract_relevant_wind_data(extracted_data, config)
     pres, wind_u, wind_v = [wind_data.get(key, 1) for key in ['pressure', 'wind_u', 'wind_v']]
     hodograph_config = config['hodograph']
 
@@ -126,6 +144,137 @@ def display_hodograph_plot(extracted_data, config, ax):
     hodo.plot_colormapped(wind_u, wind_v, pres)
     hodo.add_grid(increment=hodograph_config['grid_increment'])
 
+def category_layout(config, category_name):
+
+    '''
+    Returns position and text settings of a parameter category from config['text_display'],
+    falling back to the general settings for keys the category doesn't define.
+
+    Returns
+    -------
+    tuple : cat_x, cat_y, headline_elevation, indent, line_spacing, unit, headline,
+        key_val_spacing, text_fontsize, hl_fontsize
+    '''
+
+    general = config['text_display']['general']
+    x, y = general['abs_position']
+    category = config['text_display']['categories'][category_name]
+
+    cat_x = x + category.get('rel_position', 0)[0]
+    cat_y = y + category.get('rel_position', 0)[1]
+
+    keys = ['headline_elevation', 'indent', 'line_spacing', 'unit', 'headline',
+                'key_val_spacing', 'text_fontsize', 'hl_fontsize' ]
+    return (cat_x, cat_y) + tuple(category.get(key, general[key]) for key in keys)
+
+def format_param_value(category_name, val, unit):
+
+    '''
+    Formats a parameter value with the abbreviated units from the config file, e.g. '5.3°C | 916.5 hPa' for points.
+    '''
+
+    if category_name == 'points':
+        return f'{round(float(np.ravel(magnitude(val[1], units.degC))[0]), 1)}{unit[0]} | {round(float(np.ravel(val[0].m)[0]), 1)}{unit[1]}'
+    elif category_name == 'temperatures':
+        return f'{round(val[0].m, 1)}{unit}'
+    elif category_name == 'sounding_properties':
+        return f'{val}'
+    # indices like the lifted index are 1-element arrays, + 0.0: no '-0.0' for tiny negative values
+    return f'{round(float(np.ravel(val.m)[0]), 1) + 0.0}{unit}'
+
+class HoverTexts:
+
+    '''
+    Single hover dispatcher of a figure for shortened texts, which show their full text while the mouse is
+    over them. Hit testing uses the bounding boxes of the texts, calculated once per full draw, and the figure
+    only changes when the mouse enters or leaves a text. The full text is an animated overlay (opaque
+    background over the short text) which is blitted in, on leave the saved pixels below it are restored,
+    so moving the mouse never redraws the skew-t or hodograph. Canvases without blitting fall back to
+    swapping the text and draw_idle, on transitions only.
+
+    Parameters
+    ----------
+    fig : matplotlib.figure.Figure : Figure of the texts.
+    '''
+
+    def __init__(self, fig):
+
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.elements = [] # (text, short_text, overlay)
+        self._boxes = None # (short bbox, full bbox, saved region) per element, from the last full draw
+        self.active = None # index of the element showing its full text
+        # closures, the canvas only keeps weak references to bound methods
+        self.canvas.mpl_connect('motion_notify_event', lambda event: self.on_move(event))
+        self.canvas.mpl_connect('draw_event', lambda event: self.on_draw(event))
+
+    def add(self, text, full_text):
+
+        '''
+        Registers a text artist (showing its shortened text) and the full text shown on hover.
+        '''
+
+        overlay = self.fig.text(*text.get_position(), full_text, fontsize=text.get_fontsize(), ha=text.get_ha(),
+                                va=text.get_va(), transform=text.get_transform(), animated=True, # never in full draws or saved images
+                                bbox=dict(facecolor=self.fig.get_facecolor(), edgecolor='none', pad=1))
+        self.elements.append((text, text.get_text(), overlay))
+        self._boxes = None
+
+    def on_draw(self, event):
+        # a full draw (first draw, resize) moves the texts: recalculate the boxes and save the pixels below the overlays
+        if event.canvas is not self.canvas or not self.elements:
+            return
+        renderer = event.renderer
+        self._boxes = []
+        for text, _, overlay in self.elements:
+            full_box = overlay.get_window_extent(renderer).padded(4) # incl. the background patch
+            region = self.canvas.copy_from_bbox(full_box) if self.canvas.supports_blit else None
+            self._boxes.append((text.get_window_extent(renderer), full_box, region))
+        if self.active is not None and self.canvas.supports_blit:
+            self.fig.draw_artist(self.elements[self.active][2])
+
+    def hit(self, x, y):
+
+        '''
+        Returns the index of the element at display coordinates x, y or None.
+        The active element is hit on its full text, the others on their short text.
+        '''
+
+        if self._boxes is None or x is None:
+            return None
+        if self.active is not None and self._boxes[self.active][1].contains(x, y):
+            return self.active
+        for i, (short_box, _, _) in enumerate(self._boxes):
+            if short_box.contains(x, y):
+                return i
+        return None
+
+    def on_move(self, event):
+        hovered = self.hit(event.x, event.y)
+        if hovered == self.active: # no transition, nothing to draw
+            return
+        previous, self.active = self.active, hovered
+
+        if not self.canvas.supports_blit:
+            if previous is not None:
+                text, short_text, _ = self.elements[previous]
+                text.set_text(short_text)
+            if hovered is not None:
+                text, _, overlay = self.elements[hovered]
+                text.set_text(overlay.get_text())
+            self.canvas.draw_idle()
+            return
+
+        if previous is not None:
+            _, full_box, region = self._boxes[previous]
+            self.canvas.restore_region(region)
+            self.canvas.blit(full_box)
+        if hovered is not None:
+            self.fig.draw_artist(self.elements[hovered][2])
+            self.canvas.blit(self._boxes[hovered][1])
+
+
+@timed()
 def display_parameters(config, params, fig, sounding_properties=None):
 
     '''
@@ -140,20 +289,15 @@ def display_parameters(config, params, fig, sounding_properties=None):
 
     Returns
     -------
-    None
+    HoverTexts : Hover dispatcher of the shortened sounding properties.
 
     Functionalities
     ---------------
     - Displays categories of parameters with headlines, units, and values.
     - Custom positioning and formatting of parameter blocks according to config.
+    - Shows the full text of shortened sounding properties while the mouse is over them.
     '''
-    # removing the 'other' category, since it shouldn't be displayed
-    if 'other' in params.keys():
-        params.popitem()
-        
-    general = config['text_display']['general']
-    x, y = general['abs_position']
-    
+
     def param_block(category_name, param_category):
         '''
         Helper function to display a block of parameters within a specific category 
@@ -173,26 +317,8 @@ def display_parameters(config, params, fig, sounding_properties=None):
         - Displays each parameter with a key-value pair and corresponding units.
         - Custom formatting based on the category's configuration.
         '''
-        def on_hover(event):
-
-            for text, full_text, short_text in text_elements:
-                if text.contains(event)[0]:  # Check if mouse is over the text
-                    text.set_text(full_text)  # Set to full text on hover
-                    fig.canvas.draw_idle()    # Redraw canvas
-                else:
-                    text.set_text(short_text)  # Revert to short text when not hovering
-                    fig.canvas.draw_idle()
-        text_elements = []
-
-        category = config['text_display']['categories'][category_name]
-
-        cat_x = x + category.get('rel_position', 0)[0]
-        cat_y = y + category.get('rel_position', 0)[1]
-                                   
-        keys = ['headline_elevation', 'indent', 'line_spacing', 'unit', 'headline', 
-                    'key_val_spacing', 'text_fontsize', 'hl_fontsize' ]
-        headline_elevation, indent, line_spacing, unit, headline, key_val_spacing, \
-                    text_fontsize, hl_fontsize = [category.get(key, general[key]) for key in keys]
+        cat_x, cat_y, headline_elevation, indent, line_spacing, unit, headline, key_val_spacing, \
+                    text_fontsize, hl_fontsize = category_layout(config, category_name)
 
         fig.text(cat_x, cat_y + headline_elevation, headline, fontsize=hl_fontsize, ha='left', va='top')
         for i, (key, val) in enumerate(param_category.items(), start=1):
@@ -203,36 +329,60 @@ def display_parameters(config, params, fig, sounding_properties=None):
             
             # create string to display value indented and below the headline, 
             # with corresponding abbreviated units from the config file
-            if category_name == 'points':
-                val_text = f'{round(val[1].to('degC'), 1).m}{unit[0]} | {round(val[0].m, 1)}{unit[1]}'
-            elif category_name == 'temperatures':
-                val_text = f'{round(val[0].m, 1)}{unit}'
-            elif category_name == 'sounding_properties':
-
-                if len(str(val)) >= 20:
-                    # to extend text on hovering over it, if its so long that it would overlap with the skewt
-                    short_text, full_text = str(val)[0:15] + '...', val
-                    text = fig.text(cat_x + indent + key_val_spacing , cat_y - i*line_spacing, short_text, fontsize=text_fontsize, ha='left', va='top')
-                    text_elements += [(text, full_text, short_text)]
-                    continue
-
-                val_text = f'{val}'
-            else:
-                val_text = f'{round(float(val.m), 1)}{unit}'
+            if category_name == 'sounding_properties' and len(str(val)) >= 20:
+                # to extend text on hovering over it, if its so long that it would overlap with the skewt
+                short_text, full_text = str(val)[0:15] + '...', str(val)
+                text = fig.text(cat_x + indent + key_val_spacing , cat_y - i*line_spacing, short_text, fontsize=text_fontsize, ha='left', va='top')
+                hover_texts.add(text, full_text)
+                continue
+
+            val_text = format_param_value(category_name, val, unit)
 
             fig.text(cat_x + indent + key_val_spacing , cat_y - i*line_spacing, val_text, fontsize=text_fontsize, ha='left', va='top')
-        if category_name == 'sounding_properties':
-            fig.canvas.mpl_connect("motion_notify_event", on_hover)
 
-    for category_name, category_params in params.items():
-        param_block(category_name, category_params)
+    hover_texts = HoverTexts(fig) # one dispatcher for all shortened texts of the figure
+
+    # 'other' (parcel profile) and disabled categories are not displayed, and never calculated
+    for category_name in text_categories(config):
+        param_block(category_name, params[category_name])
 
     if sounding_properties:
         param_block('sounding_properties', sounding_properties)
+    return hover_texts
+
+
+
+
+@timed()
+def display_sounding(extracted_data, config, params, fig, sounding_properties=None):
+
+    '''
+    Composes the full sounding figure: skew-t on the left, hodograph on the upper right
+    and the parameter text blocks below it.
 
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    config : dict : Configuration dictionary containing plot settings and functionalities.
+    params : dict : Parameters calculated by calc_params.
+    fig : matplotlib.figure.Figure : The Matplotlib figure object to draw on.
+    sounding_properties : dict, optional : Properties of the sounding (e.g. lat, lon, station_id).
 
+    Returns
+    -------
+    metpy.plots.SkewT : The skew-t of the figure.
+    '''
 
+    gs = gridspec.GridSpec(10, 15, figure=fig)
+    gs_skewt = gs[:, 0:10] # location where to show skew-t
+    ax_hodograph = fig.add_subplot(gs[0:5, 10:15]) # ax to plot hodograph on
+    wind_data = extract_relevant_wind_data(extracted_data, config) # shared by barbs and hodograph
+    skew = display_skewt_plot(extracted_data, config, params, fig, gs_skewt, wind_data)
+    display_hodograph_plot(extracted_data, config, ax_hodograph, wind_data)
+    display_parameters(config, params, fig, sounding_properties)
+    return skew
 
+@timed()
 def plot_extracted_data(extracted_data, config):
 
     '''
@@ -0,0 +1,182 @@
+import sys
+import numpy as np
+from matplotlib import gridspec
+from matplotlib.collections import LineCollection
+from metpy.plots import SkewT
+from .data_processing import load_json_data
+from .data_processing import collect_sounding_files
+from .data_processing import extract_sounding
+from .batched import calc_ensemble
+from .params import magnitude
+from .units import units
+from . import thermo
+from .instrumentation import timed
+from .instrumentation import stage
+
+# rows of the summary table: column of the params table, unit and number format
+SUMMARY_ROWS = [
+    ('CAPE', 'J/kg', '{:.0f}'),
+    ('CIN', 'J/kg', '{:.0f}'),
+    ('Lifted Index', 'K', '{:.1f}'),
+    ('Showalter Index', 'K', '{:.1f}'),
+    ('K Index', '°C', '{:.1f}'),
+    ('Total Totals Index', 'K', '{:.1f}'),
+    ('LCL pressure', 'hPa', '{:.0f}'),
+    ('LFC pressure', 'hPa', '{:.0f}'),
+    ('EL pressure', 'hPa', '{:.0f}')
+]
+
+
+def load_ensemble(inputs, config):
+
+    '''
+    Function to load and extract the soundings of an ensemble. Files that can not be loaded or
+    have too few valid levels are reported on stderr and left out.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories, glob patterns or file paths (see collect_sounding_files).
+    config : dict : Configuration dictionary.
+
+    Returns
+    -------
+    tuple(list(str), list(dict(pint.Quantity))) : File paths and extracted_data of the soundings.
+
+    Raises
+    ------
+    ValueError : If no sounding could be loaded.
+    '''
+
+    filepaths, soundings = [], []
+    for filepath in collect_sounding_files(inputs):
+        try:
+            soundings.append(extract_sounding(load_json_data(filepath), config))
+        except (OSError, ValueError, KeyError) as e:
+            print(f'{filepath}: {type(e).__name__}: {e}', file=sys.stderr)
+            continue
+        filepaths.append(filepath)
+    if not soundings:
+        raise ValueError(f'No sounding found in {inputs}.')
+    return filepaths, soundings
+
+
+def _trace_segments(pressure, values):
+    # one (temperature in degC, pressure in hPa) polyline per row of stacked arrays, without the nan padding
+    lengths = np.count_nonzero(~np.isnan(pressure), axis=1)
+    values = values - thermo.ZERO_DEGC
+    return [np.column_stack((values[row, :length], pressure[row, :length])) for row, length in enumerate(lengths)]
+
+
+def display_summary_table(ax, summary, percentiles=(10, 50, 90)):
+
+    '''
+    Draws the summary of the indices over the members (see summarize_params_table) as table on ax.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes : The axes to draw on, its frame and ticks are hidden.
+    summary : dict(dict) : Summary of the params table.
+    percentiles : tuple(float) : Percentiles of the summary.
+
+    Returns
+    -------
+    matplotlib.table.Table : The table.
+    '''
+
+    columns = ['min', *[f'p{percentile:g}' for percentile in percentiles], 'max']
+    cell_text, row_labels = [], []
+    for column, unit, number_format in SUMMARY_ROWS:
+        stats = summary[column]
+        cell_text.append([number_format.format(stats[key]) if np.isfinite(stats[key]) else '-' for key in columns]
+                         + [str(stats['n'])])
+        row_labels.append(f'{column} ({unit})')
+
+    ax.axis('off')
+    table = ax.table(cellText=cell_text, rowLabels=row_labels, colLabels=columns + ['n'], loc='center')
+    table.auto_set_font_size(False)
+    table.set_fontsize(8)
+    table.scale(1, 1.4)
+    return table
+
+
+@timed()
+def display_ensemble(soundings, config, fig, envelopes=None, table=None, title=None):
+
+    '''
+    Overlays many soundings (ensemble members, neighbouring grid points or forecast hours) on one skew-t.
+    Temperature, dewpoint and parcel traces of all members are drawn as one LineCollection each instead of
+    one line per member and trace, so the number of artists (and the draw time) hardly grows with the members.
+    Parcel traces and the params of the summary table are calculated batched on the common pressure grid
+    (see calc_ensemble), the percentile envelopes are shaded between the lowest and highest percentile with
+    the middle one as line.
+
+    Parameters
+    ----------
+    soundings : list(dict(pint.Quantity)) : extracted_data of the members (see extract_sounding).
+    config : dict : Configuration dictionary, overlay settings are taken from config['ensemble'].
+    fig : matplotlib.figure.Figure : The Matplotlib figure object to draw on.
+    envelopes : bool, optional : Shade the percentile envelopes, config['ensemble']['envelopes'] if None.
+    table : bool, optional : Show the summary table of the indices, config['ensemble']['table'] if None.
+    title : str, optional : Title of the skew-t.
+
+    Returns
+    -------
+    tuple(metpy.plots.SkewT, dict) : The skew-t and the result of calc_ensemble.
+    '''
+
+    ensemble_config = config.get('ensemble', {})
+    skewt_config = config['skewt']
+    percentiles = tuple(ensemble_config.get('percentiles', (10, 50, 90)))
+    envelopes = ensemble_config.get('envelopes', True) if envelopes is None else envelopes
+    table = ensemble_config.get('table', True) if table is None else table
+    linewidth = ensemble_config.get('linewidth', 0.8)
+    # fainter members the more there are, so dense bundles do not turn opaque and hide the envelopes
+    alpha = min(ensemble_config.get('member_alpha', 0.3), max(0.05, 5 / len(soundings)))
+
+    ensemble = calc_ensemble(soundings, config, percentiles)
+
+    gs = gridspec.GridSpec(10, 15, figure=fig)
+    skew = SkewT(fig, rotation=45, subplot=gs[:, 0:10] if table else gs[:, :])
+    ax = skew.ax
+
+    # measured levels of the members as polylines in data coordinates (degC, hPa), skewed by the axes transform
+    with stage('ensemble_traces'):
+        pressures = [magnitude(sounding['pressure'], units.hPa) for sounding in soundings]
+        traces = {
+            'Temperature': ([np.column_stack((magnitude(sounding['temp'], units.degC), pres))
+                             for sounding, pres in zip(soundings, pressures)], 'red', 'solid'),
+            'Dewpoint': ([np.column_stack((magnitude(sounding['dewpoint'], units.degC), pres))
+                          for sounding, pres in zip(soundings, pressures)], 'blue', 'solid'),
+            'Parcel Trace': (_trace_segments(ensemble['pressure'], ensemble['parcel']), 'k', 'dashed')
+        }
+        for label, (segments, color, linestyle) in traces.items():
+            ax.add_collection(LineCollection(segments, colors=color, linestyles=linestyle, linewidths=linewidth,
+                                             alpha=alpha, label=f'{label} ({len(segments)} members)'))
+
+    if envelopes:
+        grid = ensemble['grid']
+        for key, name, color, median_color in [('temp', 'Temperature', 'red', 'darkred'),
+                                               ('dewpoint', 'Dewpoint', 'blue', 'navy')]:
+            envelope = ensemble['envelopes'][key] - thermo.ZERO_DEGC
+            lower, upper = envelope[0], envelope[-1]
+            ax.fill_betweenx(grid, lower, upper, where=~np.isnan(lower), color=color, alpha=0.2, lw=0, zorder=3,
+                             label=f'{name} p{percentiles[0]:g}-p{percentiles[-1]:g}')
+            if len(percentiles) > 2:
+                ax.plot(envelope[len(percentiles) // 2], grid, color=median_color, lw=2, zorder=4,
+                        label=f'{name} p{percentiles[len(percentiles) // 2]:g}')
+
+    skew.plot_dry_adiabats(lw=1, linestyle='solid', colors='darkgreen', alpha=0.4)
+    skew.plot_moist_adiabats(lw=1, linestyle='dashed', colors='darkgreen', alpha=0.4)
+    skew.plot_mixing_lines(lw=1, linestyle='dashed', colors='darkblue', alpha=0.4)
+
+    ax.set_xlabel(f'temperature ({units.degC})')
+    ax.set_ylabel(f'pressure ({units.hPa})')
+    ax.set_xlim(skewt_config['xlim'])
+    ax.set_ylim(skewt_config['ylim'])
+    ax.grid(skewt_config['grid'])
+    ax.set_title(title or f'{skewt_config["title"]} ({len(soundings)} members)')
+    if skewt_config['legend']: ax.legend(loc='upper left', fontsize=8)
+
+    if table:
+        display_summary_table(fig.add_subplot(gs[1:9, 11:15]), ensemble['summary'], percentiles)
+    return skew, ensemble
@@ -0,0 +1,254 @@
+import numpy as np
+import json
+import re
+
+# columns parsed from the GeoJSON geometry and the per-level 'time' property
+GEOMETRY_COLUMNS = ['lon', 'lat', 'altitude']
+TIME_COLUMN = 'time'
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class _JSONStream:
+
+    '''
+    Minimal incremental reader for a top-level JSON object. Values are decoded with
+    json.JSONDecoder.raw_decode from a sliding text buffer that is refilled in chunks,
+    so only the element currently being decoded has to fit into memory.
+    '''
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # drop the consumed part of the buffer so memory stays bounded by the chunk size
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = _whitespace.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def peek(self):
+        self.skip_whitespace()
+        if self.pos >= len(self.buf):
+            raise ValueError('Unexpected end of JSON data.')
+        return self.buf[self.pos]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'Expected \'{char}\' at position {self.pos} but found \'{self.buf[self.pos]}\'.')
+        self.pos += 1
+
+    def value(self):
+        self.skip_whitespace()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                # a value ending exactly at the buffer end might be cut off (e.g. a number)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_windy_json(filepath, chunk_size=1 << 16):
+
+    '''
+    Generator that streams a windy.com JSON sounding (GeoJSON FeatureCollection) from disk.
+    Features are yielded one by one without building the full dict tree in memory.
+
+    Parameters
+    ----------
+    filepath : string : Path to the windy.com JSON file.
+    chunk_size : int : Number of characters read from disk per refill of the parse buffer.
+
+    Yields
+    ------
+    tuple(str, object) : ('feature', dict) for every element of 'features',
+        (key, value) for every other top-level entry (e.g. ('properties', {...})).
+    '''
+
+    try:
+        with open(filepath, 'r') as f:
+            stream = _JSONStream(f, chunk_size)
+            stream.expect('{')
+            if stream.peek() == '}':
+                return
+
+            while True:
+                key = stream.value()
+                stream.expect(':')
+
+                if key == 'features':
+                    stream.expect('[')
+                    if stream.peek() == ']':
+                        stream.pos += 1
+                    else:
+                        while True:
+                            yield 'feature', stream.value()
+                            if stream.peek() == ']':
+                                stream.pos += 1
+                                break
+                            stream.expect(',')
+                else:
+                    yield key, stream.value()
+
+                if stream.peek() == '}':
+                    return
+                stream.expect(',')
+
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f'File \'{filepath}\' not found. Terminating program.') from e
+
+
+def features_to_columns(features, fields, capacity=256):
+
+    '''
+    Function to convert GeoJSON features into typed numpy columns in a single pass.
+    Columns are preallocated and grow geometrically, missing fields are stored as NaN (NaT for time).
+
+    Parameters
+    ----------
+    features : iterable(dict) : GeoJSON features, e.g. data['features'] or streamed features.
+    fields : list : List of properties to extract (e.g., ['pressure', 'temp', 'dewpoint']).
+    capacity : int : Initial number of preallocated rows.
+
+    Returns
+    -------
+    dict(np.ndarray) : One float64 column per field, 'lon', 'lat' and 'altitude' from
+        geometry.coordinates and 'time' as datetime64[s].
+    '''
+
+    float_columns = list(fields) + [col for col in GEOMETRY_COLUMNS if col not in fields]
+    columns = {col: np.full(capacity, np.nan) for col in float_columns}
+    columns[TIME_COLUMN] = np.full(capacity, np.datetime64('NaT'), dtype='datetime64[s]')
+
+    n = 0
+    for feature in features:
+        properties = feature.get('properties')
+        if not properties:
+            continue # skip features without measurements (e.g. the flight path LineString)
+
+        if n == capacity:
+            capacity *= 2
+            for col, arr in columns.items():
+                grown = np.full(capacity, np.datetime64('NaT') if col == TIME_COLUMN else np.nan, dtype=arr.dtype)
+                grown[:n] = arr
+                columns[col] = grown
+
+        for field in fields:
+            value = properties.get(field)
+            if value is not None:
+                columns[field][n] = value
+
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'Point':
+            for col, coord in zip(GEOMETRY_COLUMNS, geometry.get('coordinates', ())):
+                if col not in fields:
+                    columns[col][n] = coord
+
+        timestamp = properties.get(TIME_COLUMN)
+        if timestamp is not None:
+            columns[TIME_COLUMN][n] = timestamp
+        n += 1
+
+    return {col: arr[:n] for col, arr in columns.items()}
+
+
+def read_sounding_columns(filepath, fields, chunk_size=1 << 16):
+
+    '''
+    Function to stream a windy.com JSON sounding from disk straight into numpy columns.
+
+    Parameters
+    ----------
+    filepath : string : Path to the windy.com JSON file.
+    fields : list : List of properties to extract (e.g., ['pressure', 'temp', 'dewpoint']).
+    chunk_size : int : Number of characters read from disk per refill of the parse buffer.
+
+    Returns
+    -------
+    tuple(dict(np.ndarray), dict) : Columns (see features_to_columns) and the
+        top-level 'properties' of the sounding.
+    '''
+
+    properties = {}
+
+    def features():
+        for key, value in iter_windy_json(filepath, chunk_size):
+            if key == 'feature':
+                yield value
+            elif key == 'properties':
+                properties.update(value)
+
+    columns = features_to_columns(features(), fields)
+    return columns, properties
+
+
+def valid_rows(columns, fields, pressure_range=(100, 1000)):
+
+    '''
+    Function to build the row mask of complete measurements inside the pressure range.
+
+    Parameters
+    ----------
+    columns : dict(np.ndarray) : Columns as returned by features_to_columns.
+    fields : list : Fields that all have to be present for a row to be valid.
+    pressure_range : tuple : Exclusive (min, max) pressure in hPa, only applied if 'pressure' is in fields.
+
+    Returns
+    -------
+    np.ndarray(bool) : True for every row to keep.
+    '''
+
+    mask = np.ones(len(columns[fields[0]]), dtype=bool)
+    for field in fields:
+        mask &= np.isfinite(columns[field])
+
+    if 'pressure' in fields:
+        min_pres, max_pres = pressure_range
+        with np.errstate(invalid='ignore'):
+            mask &= (columns['pressure'] > min_pres) & (columns['pressure'] < max_pres)
+    return mask
+
+
+def extract_columns(columns, fields, min_points=5):
+
+    '''
+    Function to select the valid rows of the requested fields from numpy columns.
+
+    Parameters
+    ----------
+    columns : dict(np.ndarray) : Columns as returned by features_to_columns or read_sounding_columns.
+    fields : list : List of fields to extract (e.g., ['pressure', 'temp', 'dewpoint']).
+    min_points : int : Minimum number of points required for the data to be valid.
+
+    Returns
+    -------
+    dict(np.ndarray) : One float64 array per field, containing only valid rows.
+
+    Raises
+    ------
+    ValueError : If data points are less than `min_points`.
+    '''
+
+    mask = valid_rows(columns, fields)
+    if np.count_nonzero(mask) < min_points:
+        raise ValueError('Too few data points or mismatched lengths.')
+    return {field: columns[field][mask] for field in fields}
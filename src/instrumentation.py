@@ -0,0 +1,273 @@
+import cProfile
+import contextlib
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import tracemalloc
+from time import perf_counter
+
+# output formats of Instrumentation.report
+FORMATS = ['table', 'jsonl']
+
+
+class Instrumentation:
+
+    '''
+    Records wall time, call count and (optionally) peak memory per pipeline stage. Stages are nested
+    context managers (see stage and timed), a stage inside calc_params is named e.g. 'calc_params/cape_cin'.
+    Diagnostics of the pipeline functions are recorded as events. Disabled, a stage costs one attribute check.
+
+    Parameters
+    ----------
+    enabled : bool : Record stages and events.
+    fmt : str : 'table' (summary per stage when reported) or 'jsonl' (one JSON object per stage call and event).
+    output : str, optional : File the records are written to, stderr if None.
+    memory : bool : Track the peak memory of every stage with tracemalloc (slows down the pipeline).
+    profile : list(str) : Stage names (e.g. 'calc_params') to run under cProfile, the stats are written to
+        profile_dir/<stage>.prof and the top functions added to the report.
+    profile_dir : str : Directory of the .prof files.
+    '''
+
+    def __init__(self, enabled=False, fmt='table', output=None, memory=False, profile=(), profile_dir='.cache/profiles'):
+
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown instrumentation format '{fmt}', use one of {FORMATS}.")
+        self.enabled = enabled
+        self.fmt = fmt
+        self.output = output
+        self.memory = memory
+        self.profile = set(profile)
+        self.profile_dir = profile_dir
+        self.records = []
+        self.events = []
+        self._order = {} # stage path -> position of its first call
+        self._stack = []
+        self._profiler = None
+        self._file = None
+
+    @classmethod
+    def from_config(cls, config):
+        settings = config.get('instrumentation', {})
+        return cls(settings.get('enabled', False), settings.get('format', 'table'), settings.get('output'),
+                   settings.get('memory', False), settings.get('profile', []), settings.get('profile_dir', '.cache/profiles'))
+
+    def _write(self, text):
+        if self._file is None:
+            self._file = open(self.output, 'a') if self.output else sys.stderr
+        self._file.write(text + '\n')
+        self._file.flush()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+
+        '''
+        Context manager recording one call of a stage (nested in the currently running stage).
+        '''
+
+        if not self.enabled:
+            yield
+            return
+
+        path = '/'.join([frame['path'] for frame in self._stack[-1:]] + [name])
+        frame = {'path': path, 'peak': 0, 'start_memory': 0}
+        self._order.setdefault(path, len(self._order))
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack: # keep the peak of the enclosing stage before resetting it
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['start_memory'] = current
+
+        profiler = None
+        if name in self.profile and self._profiler is None: # cProfile can not be nested
+            profiler = self._profiler = cProfile.Profile()
+        self._stack.append(frame)
+        start = perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            wall_time = perf_counter() - start
+            self._stack.pop()
+            record = {'stage': path, 'wall_s': wall_time}
+            if self.memory:
+                frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                record['peak_kb'] = max(frame['peak'] - frame['start_memory'], 0) / 1024
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], frame['peak'])
+            self.records.append(record)
+            if self.fmt == 'jsonl':
+                self._write(json.dumps(record, default=str))
+            if profiler:
+                self._profiler = None
+                self._dump_profile(path, profiler)
+
+    def _dump_profile(self, path, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        filepath = os.path.join(self.profile_dir, f'{path.replace("/", ".")}.prof')
+        profiler.dump_stats(filepath)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(15)
+        self.event('profile', stage=path, file=filepath, stats=text.getvalue())
+
+    def event(self, name, **fields):
+
+        '''
+        Records a diagnostic event of a stage (e.g. the rows removed by clean_extracted_data).
+        '''
+
+        if not self.enabled:
+            return
+        record = {'event': name, 'stage': self._stack[-1]['path'] if self._stack else None, **fields}
+        self.events.append(record)
+        if self.fmt == 'jsonl':
+            self._write(json.dumps(record, default=str))
+
+    def export(self):
+
+        '''
+        Returns the stages and events recorded so far in a picklable form (e.g. to send them from a worker
+        process to the parent, see merge).
+        '''
+
+        return {'records': list(self.records), 'events': list(self.events), 'order': sorted(self._order, key=self._order.get)}
+
+    def merge(self, recorded):
+
+        '''
+        Adds the stages and events recorded by another process (see export), nested in the currently
+        running stage, so the workers of e.g. render_batch appear in the report of the parent process.
+        '''
+
+        if not self.enabled:
+            return
+        parent = [frame['path'] for frame in self._stack[-1:]]
+        for path in recorded['order']:
+            self._order.setdefault('/'.join(parent + [path]), len(self._order))
+        for record in recorded['records']:
+            record = {**record, 'stage': '/'.join(parent + [record['stage']])}
+            self.records.append(record)
+            if self.fmt == 'jsonl':
+                self._write(json.dumps(record, default=str))
+        for event in recorded['events']:
+            path = '/'.join(parent + [event['stage']]) if event['stage'] else (parent[0] if parent else None)
+            event = {**event, 'stage': path}
+            self.events.append(event)
+            if self.fmt == 'jsonl':
+                self._write(json.dumps(event, default=str))
+
+    def summary(self):
+
+        '''
+        Returns the recorded stages aggregated per stage in order of their first call:
+        calls, total, mean and max wall time in seconds and the peak memory in KiB (if tracked).
+        '''
+
+        stages = {}
+        for record in self.records:
+            entry = stages.setdefault(record['stage'], {'stage': record['stage'], 'calls': 0, 'total_s': 0.0, 'max_s': 0.0})
+            entry['calls'] += 1
+            entry['total_s'] += record['wall_s']
+            entry['max_s'] = max(entry['max_s'], record['wall_s'])
+            if 'peak_kb' in record:
+                entry['peak_kb'] = max(entry.get('peak_kb', 0.0), record['peak_kb'])
+        for entry in stages.values():
+            entry['mean_s'] = entry['total_s'] / entry['calls']
+        return sorted(stages.values(), key=lambda entry: self._order[entry['stage']]) # parents before their children
+
+    def report(self):
+
+        '''
+        Writes the summary table and the events (table format) or a closing summary record (jsonl format).
+        '''
+
+        if not self.enabled:
+            return
+        summary = self.summary()
+        if self.fmt == 'jsonl':
+            self._write(json.dumps({'summary': summary}))
+            return
+
+        lines = [f'{"stage":42s} {"calls":>6s} {"total ms":>10s} {"mean ms":>10s} {"max ms":>10s}' + (f' {"peak KiB":>10s}' if self.memory else '')]
+        for entry in summary:
+            depth = entry['stage'].count('/')
+            name = '  ' * depth + entry['stage'].rsplit('/', 1)[-1]
+            line = f'{name:42s} {entry["calls"]:6d} {entry["total_s"] * 1000:10.2f} {entry["mean_s"] * 1000:10.2f} {entry["max_s"] * 1000:10.2f}'
+            if self.memory:
+                line += f' {entry.get("peak_kb", 0.0):10.1f}'
+            lines.append(line)
+        for event in self.events:
+            fields = ', '.join(f'{key}={value}' for key, value in event.items() if key not in ('event', 'stage', 'stats'))
+            lines.append(f'[{event["event"]}] {fields}')
+            if 'stats' in event:
+                lines.append(event['stats'])
+        self._write('\n'.join(lines))
+
+    def close(self):
+        if self._file not in (None, sys.stderr):
+            self._file.close()
+        self._file = None
+
+
+# instrumentation of this process, replaced by configure
+_instrumentation = Instrumentation()
+
+
+def configure(config):
+
+    '''
+    Function to set up the instrumentation of this process from config['instrumentation'].
+
+    Returns
+    -------
+    Instrumentation : The active instrumentation.
+    '''
+
+    global _instrumentation
+    _instrumentation.close()
+    _instrumentation = Instrumentation.from_config(config)
+    return _instrumentation
+
+
+def get_instrumentation():
+    return _instrumentation
+
+
+def stage(name):
+
+    '''
+    Context manager recording a stage with the active instrumentation, e.g. with stage('render'): ...
+    '''
+
+    return _instrumentation.stage(name)
+
+
+def event(name, **fields):
+    _instrumentation.event(name, **fields)
+
+
+def timed(name=None):
+
+    '''
+    Decorator recording every call of a function as stage (named after the function if name is None).
+    '''
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _instrumentation.enabled:
+                return func(*args, **kwargs)
+            with _instrumentation.stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,567 @@
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+from time import perf_counter
+import os
+import metpy.calc as mpcalc
+import numpy as np
+from .units import units
+from .parcel import ParcelAnalysis
+from .parcel import FastParcelAnalysis
+from . import thermo
+from .instrumentation import stage
+from .instrumentation import event
+from .instrumentation import timed
+
+# categories and names of the params (as displayed) and the node of the dependency graph calculating each of them
+PARAM_LAYOUT = {
+    'points': {
+        'LCL': 'lcl',
+        'LFC': 'lfc',
+        'EL': 'el',
+        'CCL': 'ccl'
+    },
+    'cape_cin': {
+        'CAPE': 'cape',
+        'CIN': 'cin'
+    },
+    'temperatures': {
+        '\u03B8e': 'equivalent_potential_temperature',
+        'Tw': 'wet_bulb_temperature',
+        '\u03B8w': 'wet_bulb_potential_temperature'
+    },
+    'indices': {
+        'Lifted Index': 'lifted_index',
+        'K Index': 'k_index',
+        'Total Totals Index': 'total_totals_index',
+        'Showalter Index': 'showalter_index'
+    },
+    'other': {
+        'Parcel Profile': 'parcel_profile'
+    }
+}
+
+# calculation backends of the params (see param_graph)
+BACKENDS = ['metpy', 'fast']
+
+# units of the values of the fast backend, attached when a value is read (the same units metpy.calc returns)
+_POINT = (units.hPa, units.K)
+FAST_UNITS = {
+    'lcl': _POINT,
+    'lfc': _POINT,
+    'el': _POINT,
+    'ccl': _POINT,
+    'cape': units.Unit('J/kg'),
+    'cin': units.Unit('J/kg'),
+    'equivalent_potential_temperature': units.K,
+    'wet_bulb_temperature': units.K,
+    'wet_bulb_potential_temperature': units.K,
+    'lifted_index': units.K,
+    'k_index': units.degC,
+    'total_totals_index': units.K,
+    'showalter_index': units.K,
+    'parcel_profile': units.K
+}
+
+# nodes calculated level by level (no level depends on another), split into chunks of levels by evaluate_parallel
+PER_LEVEL_NODES = ['equivalent_potential_temperature', 'wet_bulb_temperature', 'wet_bulb_potential_temperature']
+
+# fewest levels per chunk of a per-level node, shorter profiles are not split (the threads would cost more than they save)
+PARALLEL_CHUNK_LEVELS = 500
+
+# skew-t functionality flag of every plotted temperature profile
+TEMPERATURE_FLAGS = {'\u03B8e': 'show_equiv_pot_temp', 'Tw': 'show_wb_temp', '\u03B8w': 'show_wb_pot_temp'}
+
+
+def magnitude(quantity, unit):
+
+    '''
+    Returns the magnitude of a quantity in unit as float64 array, skipping the pint conversion if it is already in unit.
+    '''
+
+    values = quantity.m if quantity.units == unit else quantity.m_as(unit)
+    return np.asarray(values, dtype=np.float64)
+
+
+def wet_bulb_temperature(pres, temp, dew, method='metpy'):
+
+    '''
+    Function to calculate the wet-bulb temperature of every level, with MetPy ('metpy', one lcl and
+    moist adiabat solve per level) or thermo.py ('vectorized', all levels at once, within 1e-4 K of MetPy).
+
+    Raises
+    ------
+    ValueError : If the method is unknown.
+    '''
+
+    if method == 'vectorized':
+        wet_bulb = thermo.wet_bulb_temperature(pres.m_as('hPa'), temp.m_as('K'), dew.m_as('K'))
+        return units.Quantity(wet_bulb, 'K').to(temp.units)
+    if method == 'metpy':
+        return mpcalc.wet_bulb_temperature(pres, temp, dew)
+    raise ValueError(f"Unknown wet-bulb method '{method}', use 'metpy' or 'vectorized'.")
+
+
+def wet_bulb_potential_temperature(pres, temp, dew, theta_e=None, method='metpy'):
+
+    '''
+    Function to calculate the wet-bulb potential temperature of every level, the 'vectorized' method
+    reuses the equivalent potential temperature theta_e of the levels.
+
+    Raises
+    ------
+    ValueError : If the method is unknown.
+    '''
+
+    if method == 'vectorized':
+        return units.Quantity(thermo.wet_bulb_potential_temperature(theta_e.m_as('K')), 'K')
+    if method == 'metpy':
+        return mpcalc.wet_bulb_potential_temperature(pres, temp, dew)
+    raise ValueError(f"Unknown wet-bulb method '{method}', use 'metpy' or 'vectorized'.")
+
+
+def param_graph(wet_bulb='metpy', backend='metpy'):
+
+    '''
+    Function to build the dependency graph of the params: node -> (dependencies, function).
+    A function is called with pressure, temperature and dewpoint followed by the values of its dependencies,
+    e.g. the surface parcel is lifted once and shared by the points, CAPE/CIN and the lifted index.
+
+    Parameters
+    ----------
+    wet_bulb : str : Method for the wet-bulb temperatures, 'metpy' or 'vectorized'.
+    backend : str : 'metpy' (metpy.calc on pint quantities) or 'fast' (thermo.py and FastParcelAnalysis on
+        float arrays in hPa and K, units are attached when a value is read, see FAST_UNITS).
+        The fast backend always calculates the wet-bulb temperatures vectorized.
+
+    Returns
+    -------
+    dict : node name -> (tuple(str), callable)
+
+    Raises
+    ------
+    ValueError : If the wet-bulb method or the backend is unknown.
+    '''
+
+    if wet_bulb not in ('metpy', 'vectorized'):
+        raise ValueError(f"Unknown wet-bulb method '{wet_bulb}', use 'metpy' or 'vectorized'.")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown calculation backend '{backend}', use one of {BACKENDS}.")
+    if backend == 'fast':
+        return _fast_param_graph()
+
+    # the vectorized θw is calculated from θe, MetPy calculates θe again internally
+    theta_w_dependencies = ('equivalent_potential_temperature',) if wet_bulb == 'vectorized' else ()
+
+    return {
+        'parcel': ((), ParcelAnalysis),
+        'parcel_profile': (('parcel',), lambda pres, temp, dew, parcel: parcel.profile),
+        'lcl': (('parcel',), lambda pres, temp, dew, parcel: parcel.lcl),
+        'lfc': (('parcel',), lambda pres, temp, dew, parcel: parcel.lfc),
+        'el': (('parcel',), lambda pres, temp, dew, parcel: parcel.el),
+        'ccl': ((), lambda pres, temp, dew: mpcalc.ccl(pres, temp, dew)[:2]), # only pressure and temperature
+        'cape_cin': (('parcel',), lambda pres, temp, dew, parcel: parcel.cape_cin()),
+        'cape': (('cape_cin',), lambda pres, temp, dew, cape_cin: cape_cin[0]),
+        'cin': (('cape_cin',), lambda pres, temp, dew, cape_cin: cape_cin[1]),
+        'lifted_index': (('parcel',), lambda pres, temp, dew, parcel: parcel.lifted_index()),
+        'equivalent_potential_temperature': ((), mpcalc.equivalent_potential_temperature),
+        'wet_bulb_temperature': ((), lambda pres, temp, dew: wet_bulb_temperature(pres, temp, dew, wet_bulb)),
+        'wet_bulb_potential_temperature': (theta_w_dependencies, lambda pres, temp, dew, *theta_e:
+                                           wet_bulb_potential_temperature(pres, temp, dew, *theta_e, method=wet_bulb)),
+        'k_index': ((), mpcalc.k_index),
+        'total_totals_index': ((), mpcalc.total_totals_index),
+        'showalter_index': ((), mpcalc.showalter_index)
+    }
+
+
+def _fast_param_graph():
+    # nodes of param_graph on float arrays (pressure in hPa, temperature in K), the parcel is lifted without units
+    return {
+        'parcel': ((), FastParcelAnalysis),
+        'parcel_profile': (('parcel',), lambda pres, temp, dew, parcel: parcel.profile),
+        'lcl': (('parcel',), lambda pres, temp, dew, parcel: parcel.lcl),
+        'lfc': (('parcel',), lambda pres, temp, dew, parcel: parcel.lfc),
+        'el': (('parcel',), lambda pres, temp, dew, parcel: parcel.el),
+        'ccl': ((), thermo.ccl),
+        'cape_cin': (('parcel',), lambda pres, temp, dew, parcel: parcel.cape_cin()),
+        'cape': (('cape_cin',), lambda pres, temp, dew, cape_cin: cape_cin[0]),
+        'cin': (('cape_cin',), lambda pres, temp, dew, cape_cin: cape_cin[1]),
+        'lifted_index': (('parcel',), lambda pres, temp, dew, parcel: parcel.lifted_index()),
+        'equivalent_potential_temperature': ((), thermo.equivalent_potential_temperature),
+        'wet_bulb_temperature': ((), thermo.wet_bulb_temperature),
+        'wet_bulb_potential_temperature': (('equivalent_potential_temperature',),
+                                           lambda pres, temp, dew, theta_e: thermo.wet_bulb_potential_temperature(theta_e)),
+        'k_index': ((), thermo.k_index),
+        'total_totals_index': ((), thermo.total_totals_index),
+        'showalter_index': ((), thermo.showalter_index)
+    }
+
+
+def displayed_params(config):
+
+    '''
+    Function to list the params display_sounding (and SoundingFigureTemplate) shows with a config:
+    the parcel profile, the enabled temperature profiles and points of the skew-t and the parameter
+    categories of config['text_display'] that are not disabled with "enabled": false.
+
+    Returns
+    -------
+    list(tuple(str, str)) : (category, name) of the displayed params.
+    '''
+
+    functionalities = config['skewt']['functionalities']
+    names = [('other', 'Parcel Profile')]
+    names += [('temperatures', name) for name, flag in TEMPERATURE_FLAGS.items() if functionalities[flag]]
+    if functionalities['show_params']:
+        names += [('points', name) for name in PARAM_LAYOUT['points']]
+    for category in text_categories(config):
+        names += [(category, name) for name in PARAM_LAYOUT[category] if (category, name) not in names]
+    return names
+
+
+def text_categories(config):
+
+    '''
+    Returns the param categories shown as text blocks: all but 'other', unless the category in
+    config['text_display']['categories'] has "enabled": false.
+    '''
+
+    categories = config['text_display']['categories']
+    return [category for category in PARAM_LAYOUT
+            if category != 'other' and categories.get(category, {}).get('enabled', True)]
+
+
+def parallel_workers(workers=None):
+
+    '''
+    Returns the number of threads evaluate_parallel actually uses: workers (all cores if None), at most the
+    number of cores this process may run on, since more threads than cores only add overhead.
+    '''
+
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError: # not available on every platform
+        cores = os.cpu_count() or 1
+    return max(1, min(workers or cores, cores))
+
+
+def _timed_call(function, arguments):
+    # runs in a thread of evaluate_parallel: no instrumentation stages (they are not thread-safe), only the wall time
+    start = perf_counter()
+    return function(*arguments), perf_counter() - start
+
+
+def _concatenate(parts):
+    # stitches the chunks of a per-level node back together, in the unit of the first chunk for quantities
+    if hasattr(parts[0], 'units'):
+        return units.Quantity(np.concatenate([part.m_as(parts[0].units) for part in parts]), parts[0].units)
+    return np.concatenate(parts)
+
+
+class LazyParams(Mapping):
+
+    '''
+    Params of a sounding (category -> name -> value, as described in calc_params) calculated on first access.
+    Every value is a node of the dependency graph (see param_graph), nodes are calculated once with their
+    dependencies and memoized, e.g. params['cape_cin']['CAPE'] lifts the parcel, integrates CAPE/CIN and
+    nothing else. Each node calculation is recorded as instrumentation stage named after the node.
+
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    wet_bulb : str : Method for the wet-bulb temperatures, 'metpy' or 'vectorized'.
+    backend : str : 'metpy' or 'fast' (see param_graph). The fast backend converts the profiles to float arrays once
+        and calculates without units, pint quantities are only created for the values that are read.
+    values : dict, optional : Already known params (category -> name -> value, e.g. from the ParamsCache), used as is.
+    on_flush : callable, optional : Called with the LazyParams by flush if values were calculated since the last
+        flush (e.g. to store them once per sounding instead of once per value).
+    '''
+
+    def __init__(self, extracted_data, wet_bulb='metpy', backend='metpy', values=None, on_flush=None):
+
+        self.profiles = tuple(extracted_data.get(key, 1) for key in ['pressure', 'temp', 'dewpoint'])
+        if backend == 'fast':
+            self.profiles = tuple(magnitude(profile, unit) for profile, unit in zip(self.profiles, (units.hPa, units.K, units.K)))
+        self.wet_bulb = wet_bulb
+        self.backend = backend
+        self.on_flush = on_flush
+        self.dirty = False # values calculated since the last flush
+        self._graph = param_graph(wet_bulb, backend)
+        self._nodes = {}
+        self._values = {}
+        self._categories = {category: ParamCategory(self, category) for category in PARAM_LAYOUT}
+        if values:
+            self.update(values)
+
+    def __getitem__(self, category):
+        return self._categories[category]
+
+    def __iter__(self):
+        return iter(PARAM_LAYOUT)
+
+    def __len__(self):
+        return len(PARAM_LAYOUT)
+
+    def __getstate__(self):
+        # the graph holds lambdas and on_flush e.g. a cache, both stay in this process
+        state = self.__dict__.copy()
+        del state['_graph'], state['on_flush']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._graph = param_graph(self.wet_bulb, self.backend)
+        self.on_flush = None
+
+    def node(self, name):
+
+        '''
+        Returns the value of a node of the dependency graph, calculated (with its dependencies) on first access.
+        '''
+
+        if name not in self._nodes:
+            dependencies, function = self._graph[name]
+            arguments = [self.node(dependency) for dependency in dependencies]
+            with stage(name):
+                self._nodes[name] = function(*self.profiles, *arguments)
+        return self._nodes[name]
+
+    def value(self, category, name):
+
+        '''
+        Returns a param, e.g. value('indices', 'K Index').
+        '''
+
+        key = (category, name)
+        if key not in self._values:
+            node = PARAM_LAYOUT[category][name]
+            value = self.node(node)
+            if self.backend == 'fast': # units are attached at the boundary only
+                unit = FAST_UNITS[node]
+                value = tuple(units.Quantity(x, u) for x, u in zip(value, unit)) if isinstance(unit, tuple) else units.Quantity(value, unit)
+            self._values[key] = value
+            self.dirty = True
+        return self._values[key]
+
+    def is_computed(self, category, name):
+        return (category, name) in self._values
+
+    def update(self, values):
+
+        '''
+        Adds already known params (category -> name -> value), they are never calculated.
+        '''
+
+        for category, category_values in values.items():
+            for name, value in category_values.items():
+                self._values[(category, name)] = value
+
+    @timed('calc_params')
+    def evaluate(self, names=None):
+
+        '''
+        Calculates params in advance (e.g. in a background worker) and flushes them (see flush).
+
+        Parameters
+        ----------
+        names : list(tuple(str, str)), optional : (category, name) of the params, all params if None.
+
+        Returns
+        -------
+        LazyParams : self
+        '''
+
+        if names is None:
+            names = [(category, name) for category, layout in PARAM_LAYOUT.items() for name in layout]
+        self._values_of(names)
+        self.flush()
+        return self
+
+    def _values_of(self, names):
+        for category, name in names:
+            self.value(category, name)
+
+    def flush(self):
+
+        '''
+        Passes the params to on_flush (e.g. ParamsCache.put) if values were calculated since the last flush.
+        Callers reading params lazily flush once they are done with a sounding.
+        '''
+
+        if self.dirty and self.on_flush is not None:
+            self.on_flush(self)
+        self.dirty = False
+
+    @timed('calc_params_parallel')
+    def evaluate_parallel(self, names=None, workers=None, chunk_levels=PARALLEL_CHUNK_LEVELS):
+
+        '''
+        Calculates params in advance like evaluate, but independent nodes of the dependency graph (e.g. the parcel,
+        the CCL, θe, Tw and the indices) run at the same time in a thread pool. Only the NumPy operations on
+        large arrays release the GIL, so any gain needs several cores and long soundings. A node is submitted as soon as its dependencies are calculated. The per-level
+        profiles (PER_LEVEL_NODES) are split into chunks of levels, calculated in parallel and stitched back
+        together in level order. Every node is the same function on the same data as in evaluate, so the values
+        do not depend on the scheduling. With one worker or one core (see parallel_workers), or nothing to run
+        in parallel, evaluate is used.
+        The params are flushed (see flush) once at the end.
+
+        Parameters
+        ----------
+        names : list(tuple(str, str)), optional : (category, name) of the params, all params if None.
+        workers : int, optional : Number of threads, all cores if None, at most the number of cores.
+        chunk_levels : int : Fewest levels per chunk of a per-level profile.
+
+        Returns
+        -------
+        LazyParams : self
+        '''
+
+        if names is None:
+            names = [(category, name) for category, layout in PARAM_LAYOUT.items() for name in layout]
+        workers = parallel_workers(workers)
+
+        # nodes still to calculate -> their dependencies, dependencies first
+        required = {}
+
+        def require(node):
+            if node in self._nodes or node in required:
+                return
+            dependencies = self._graph[node][0]
+            for dependency in dependencies:
+                require(dependency)
+            required[node] = dependencies
+
+        for category, name in names:
+            if (category, name) not in self._values:
+                require(PARAM_LAYOUT[category][name])
+        if workers <= 1 or len(required) <= 1:
+            self._values_of(names) # serial fallback
+            self.flush()
+            return self
+
+        levels = len(self.profiles[0])
+        n_chunks = max(1, min(workers, levels // max(chunk_levels, 1)))
+        bounds = np.linspace(0, levels, n_chunks + 1).astype(int)
+        chunks = [slice(start, stop) for start, stop in zip(bounds[:-1], bounds[1:])]
+
+        node_times = {}
+        start_time = perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {} # future -> (node, chunk index or None)
+            parts = {} # per-level node -> results of its chunks
+
+            def submit_ready():
+                # in the order of required, so the submission order is the same on every run
+                for node, dependencies in list(required.items()):
+                    if not all(dependency in self._nodes for dependency in dependencies):
+                        continue
+                    del required[node]
+                    function = self._graph[node][1]
+                    arguments = [*self.profiles, *[self._nodes[dependency] for dependency in dependencies]]
+                    if node in PER_LEVEL_NODES and len(chunks) > 1:
+                        parts[node] = [None] * len(chunks)
+                        for index, chunk in enumerate(chunks):
+                            future = executor.submit(_timed_call, function, [argument[chunk] for argument in arguments])
+                            pending[future] = (node, index)
+                    else:
+                        pending[executor.submit(_timed_call, function, arguments)] = (node, None)
+
+            submit_ready()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, index = pending.pop(future)
+                    value, wall_time = future.result()
+                    node_times[node] = node_times.get(node, 0.0) + wall_time
+                    if index is None:
+                        self._nodes[node] = value
+                        continue
+                    parts[node][index] = value
+                    if all(part is not None for part in parts[node]):
+                        self._nodes[node] = _concatenate(parts.pop(node))
+                submit_ready()
+
+        event('evaluate_parallel', workers=workers, chunks=len(chunks), wall_s=perf_counter() - start_time,
+              node_s=node_times)
+        self._values_of(names) # units and the flush in this thread
+        self.flush()
+        return self
+
+    def computed(self):
+
+        '''
+        Returns the already calculated params as plain dict (category -> name -> value), e.g. to store them.
+        '''
+
+        params = {}
+        for (category, name), value in self._values.items():
+            params.setdefault(category, {})[name] = value
+        return params
+
+    def __repr__(self):
+        return f'LazyParams({len(self._values)} of {sum(map(len, PARAM_LAYOUT.values()))} params calculated)'
+
+
+class ParamCategory(Mapping):
+
+    '''
+    One category of LazyParams (e.g. params['indices']), values are calculated on access.
+    '''
+
+    def __init__(self, params, category):
+        self.params = params
+        self.category = category
+
+    def __getitem__(self, name):
+        if name not in PARAM_LAYOUT[self.category]:
+            raise KeyError(name)
+        return self.params.value(self.category, name)
+
+    def __iter__(self):
+        return iter(PARAM_LAYOUT[self.category])
+
+    def __len__(self):
+        return len(PARAM_LAYOUT[self.category])
+
+
+def compare_parallel(extracted_data, wet_bulb='metpy', backend='metpy', workers=None,
+                     chunk_levels=PARALLEL_CHUNK_LEVELS, names=None):
+
+    '''
+    Function to time the serial (evaluate) against the parallel evaluation (evaluate_parallel) of the params
+    of a sounding, each on new LazyParams, and to check that both calculate the same values.
+
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    wet_bulb : str : Method for the wet-bulb temperatures.
+    backend : str : Calculation backend (see param_graph).
+    workers : int, optional : Number of threads of the parallel evaluation, all cores if None.
+    chunk_levels : int : Fewest levels per chunk of a per-level profile.
+    names : list(tuple(str, str)), optional : (category, name) of the params, all params if None.
+
+    Returns
+    -------
+    dict : 'serial_s' and 'parallel_s' wall times, 'speedup', 'workers' (threads used, see parallel_workers)
+        and 'max_difference', the largest
+        absolute difference of any value between both (nan in the same places counts as equal).
+    '''
+
+    workers = parallel_workers(workers)
+    start = perf_counter()
+    serial = LazyParams(extracted_data, wet_bulb, backend).evaluate(names)
+    serial_time = perf_counter() - start
+    start = perf_counter()
+    parallel = LazyParams(extracted_data, wet_bulb, backend).evaluate_parallel(names, workers, chunk_levels)
+    parallel_time = perf_counter() - start
+
+    max_difference = 0.0
+    for (category, name), value in serial._values.items():
+        other = parallel.value(category, name)
+        for a, b in zip(*[x if isinstance(x, tuple) else (x,) for x in (value, other)]):
+            a, b = np.asarray(a.m, dtype=float), np.asarray(b.m_as(a.units), dtype=float)
+            difference = np.where(np.isnan(a) & np.isnan(b), 0.0, np.abs(a - b))
+            max_difference = max(max_difference, float(np.max(difference, initial=0.0)))
+    return {'serial_s': serial_time, 'parallel_s': parallel_time, 'speedup': serial_time / parallel_time,
+            'workers': workers, 'max_difference': max_difference}
@@ -0,0 +1,470 @@
+from .units import units
+import metpy.calc as mpcalc
+from metpy.interpolate import interpolate_1d
+import numpy as np
+from . import thermo
+
+# maximum relative deviation of ParcelAnalysis results from the independent MetPy calls.
+# Both follow the same numerical path (one lcl solve, dry_lapse, moist_lapse), so in practice
+# the results agree to floating point precision, the tolerance only absorbs ODE solver noise.
+PARCEL_RTOL = 1e-6
+
+# maximum absolute deviation of FastParcelAnalysis from MetPy in hPa, K and J/kg. The fixed-step RK4 ascent
+# differs from MetPy's adaptive ODE solver by ~1e-4 K, which moves LFC and EL by up to ~1e-3 hPa.
+FAST_PARCEL_ATOL = 5e-3
+
+# rk4 steps of the moist ascent of FastParcelAnalysis, every level is integrated from the lcl in one go
+PARCEL_STEPS = 16
+
+class ParcelAnalysis:
+
+    '''
+    Surface parcel lifted exactly once. The moist adiabat is integrated a single time and
+    the resulting profile is shared by LCL, LFC, EL, CAPE/CIN and Lifted Index, instead of
+    every MetPy function lifting the same parcel again internally.
+
+    Parameters
+    ----------
+    pressure : pint.Quantity : Pressure profile, from high to low pressure.
+    temperature : pint.Quantity : Temperature at the levels given by pressure.
+    dewpoint : pint.Quantity : Dewpoint at the levels given by pressure.
+
+    Attributes
+    ----------
+    lcl : tuple(pint.Quantity) : LCL pressure and temperature.
+    profile : pint.Quantity : Parcel temperature at the levels of pressure (as mpcalc.parcel_profile).
+    pressure_with_lcl, temperature_with_lcl, dewpoint_with_lcl, profile_with_lcl : pint.Quantity :
+        Profiles with the LCL inserted as additional level (as mpcalc.parcel_profile_with_lcl).
+    '''
+
+    def __init__(self, pressure, temperature, dewpoint):
+
+        self.pressure = pressure
+        self.temperature = temperature
+        self.dewpoint = dewpoint
+
+        self.lcl = mpcalc.lcl(pressure[0], temperature[0], dewpoint[0])
+        press_lcl, temp_lcl = self.lcl
+        press_lcl = press_lcl.to(pressure.units)
+
+        # dry adiabatic part up to and including the lcl
+        below = pressure >= press_lcl
+        press_lower = np.concatenate((pressure[below], press_lcl[np.newaxis]))
+        temp_lower = mpcalc.dry_lapse(press_lower, temperature[0])
+
+        # moist adiabatic part above the lcl, integrated once over unique levels (needed by solve_ivp)
+        press_upper = pressure[~below]
+        if len(press_upper):
+            unique, indices = np.unique(press_upper.m, return_inverse=True)
+            unique = np.concatenate(([press_lcl.m], unique[::-1])) * pressure.units
+            temp_upper = mpcalc.moist_lapse(unique, temp_lower[-1]).to(temp_lower.units)
+            temp_upper = temp_upper[1:][::-1][indices]
+        else:
+            temp_upper = units.Quantity(np.array([]), temp_lower.units)
+
+        self.profile = np.concatenate((temp_lower[:-1], temp_upper))
+
+        self.pressure_with_lcl = np.concatenate((pressure[below], press_lcl[np.newaxis], press_upper))
+        self.profile_with_lcl = np.concatenate((temp_lower[:-1], temp_lcl.to(temp_lower.units)[np.newaxis], temp_upper))
+        self.temperature_with_lcl = self._insert_lcl_level(temperature, press_lcl)
+        self.dewpoint_with_lcl = self._insert_lcl_level(dewpoint, press_lcl)
+
+        self._lfc = None
+        self._el = None
+
+    def _insert_lcl_level(self, values, press_lcl):
+        # interpolate an environmental profile to the lcl and insert it as level (as MetPy does)
+        value_lcl = interpolate_1d(press_lcl, self.pressure, values)
+        loc = self.pressure.size - self.pressure[::-1].searchsorted(press_lcl)
+        return units.Quantity(np.insert(values.m, loc, value_lcl.m), values.units)
+
+    @property
+    def lfc(self):
+        if self._lfc is None:
+            self._lfc = mpcalc.lfc(self.pressure_with_lcl, self.temperature_with_lcl, self.dewpoint_with_lcl,
+                                   parcel_temperature_profile=self.profile_with_lcl.to(self.temperature.units))
+        return self._lfc
+
+    @property
+    def el(self):
+        if self._el is None:
+            self._el = mpcalc.el(self.pressure_with_lcl, self.temperature_with_lcl, self.dewpoint_with_lcl,
+                                 parcel_temperature_profile=self.profile_with_lcl.to(self.temperature.units))
+        return self._el
+
+    def cape_cin(self):
+        return mpcalc.cape_cin(self.pressure, self.temperature, self.dewpoint, self.profile)
+
+    def lifted_index(self):
+        return mpcalc.lifted_index(self.pressure, self.temperature, self.profile)
+
+
+def _magnitudes(value):
+    # flatten a quantity or tuple of quantities to base unit magnitudes
+    values = value if isinstance(value, tuple) else (value,)
+    return np.concatenate([np.atleast_1d(x.to_base_units().m) for x in values])
+
+
+def compare_with_metpy(extracted_data, rtol=PARCEL_RTOL):
+
+    '''
+    Function to check ParcelAnalysis against the independent MetPy calls previously used in calc_params.
+
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    rtol : float : Maximum accepted relative deviation.
+
+    Returns
+    -------
+    dict : Maximum relative deviation per quantity.
+
+    Raises
+    ------
+    ValueError : If any quantity deviates more than rtol.
+    '''
+
+    pres, temp, dew = [extracted_data.get(key, 1) for key in ['pressure', 'temp', 'dewpoint']]
+    parcel = ParcelAnalysis(pres, temp, dew)
+    reference_profile = mpcalc.parcel_profile(pres, temp[0], dew[0])
+
+    pairs = {
+        'Parcel Profile': (parcel.profile, reference_profile),
+        'LCL': (parcel.lcl, mpcalc.lcl(pres[0], temp[0], dew[0])),
+        'LFC': (parcel.lfc, mpcalc.lfc(pres, temp, dew)),
+        'EL': (parcel.el, mpcalc.el(pres, temp, dew)),
+        'CAPE & CIN': (parcel.cape_cin(), mpcalc.cape_cin(pres, temp, dew, reference_profile)),
+        'Lifted Index': (parcel.lifted_index(), mpcalc.lifted_index(pres, temp, reference_profile)),
+    }
+
+    deviations = {}
+    for name, (result, reference) in pairs.items():
+        result, reference = _magnitudes(result), _magnitudes(reference)
+        if not np.array_equal(np.isnan(result), np.isnan(reference)):
+            raise ValueError(f'{name}: defined/undefined mismatch between ParcelAnalysis and MetPy.')
+        valid = ~np.isnan(reference)
+        scale = np.maximum(np.abs(reference[valid]), 1.0)
+        deviations[name] = float(np.max(np.abs(result[valid] - reference[valid]) / scale, initial=0.0))
+        if deviations[name] > rtol:
+            raise ValueError(f'{name}: relative deviation {deviations[name]:.2e} exceeds {rtol:.0e}.')
+
+    return deviations
+
+
+def compare_fast_with_metpy(extracted_data, atol=FAST_PARCEL_ATOL):
+
+    '''
+    Function to check FastParcelAnalysis against the MetPy calls, in hPa, K and J/kg.
+
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    atol : float : Maximum accepted absolute deviation.
+
+    Returns
+    -------
+    dict : Maximum absolute deviation per quantity.
+
+    Raises
+    ------
+    ValueError : If any quantity deviates more than atol.
+    '''
+
+    pres, temp, dew = [extracted_data.get(key, 1) for key in ['pressure', 'temp', 'dewpoint']]
+    parcel = FastParcelAnalysis(pres.m_as('hPa'), temp.m_as('K'), dew.m_as('K'))
+    reference_profile = mpcalc.parcel_profile(pres, temp[0], dew[0])
+
+    def point(value):
+        return (value[0].m_as('hPa'), value[1].m_as('K'))
+
+    pairs = {
+        'Parcel Profile': (parcel.profile, reference_profile.m_as('K')),
+        'LCL': (parcel.lcl, point(mpcalc.lcl(pres[0], temp[0], dew[0]))),
+        'LFC': (parcel.lfc, point(mpcalc.lfc(pres, temp, dew))),
+        'EL': (parcel.el, point(mpcalc.el(pres, temp, dew))),
+        'CAPE & CIN': (parcel.cape_cin(), [x.m_as('J/kg') for x in mpcalc.cape_cin(pres, temp, dew, reference_profile)]),
+        'Lifted Index': (parcel.lifted_index(), mpcalc.lifted_index(pres, temp, reference_profile).m_as('K')),
+    }
+
+    deviations = {}
+    for name, (result, reference) in pairs.items():
+        result, reference = np.ravel(np.asarray(result, dtype=float)), np.ravel(np.asarray(reference, dtype=float))
+        if not np.array_equal(np.isnan(result), np.isnan(reference)):
+            raise ValueError(f'{name}: defined/undefined mismatch between FastParcelAnalysis and MetPy.')
+        valid = ~np.isnan(reference)
+        deviations[name] = float(np.max(np.abs(result[valid] - reference[valid]), initial=0.0))
+        if deviations[name] > atol:
+            raise ValueError(f'{name}: deviation {deviations[name]:.2e} exceeds {atol:.0e}.')
+
+    return deviations
+
+
+def dry_ascent(start_pressure, start_temperature, start_dewpoint, pressure):
+
+    '''
+    Function to calculate the dry adiabat and the mixing ratio line of a parcel below its LCL.
+
+    Parameters
+    ----------
+    start_pressure : float : Start pressure of the parcel in hPa.
+    start_temperature : float : Start temperature in K.
+    start_dewpoint : float : Start dewpoint in K.
+    pressure : np.ndarray : Pressure levels in hPa.
+
+    Returns
+    -------
+    tuple(np.ndarray) : Parcel temperature and dewpoint in K at the pressure levels.
+    '''
+
+    mixing_ratio = thermo.mixing_ratio(thermo.saturation_vapor_pressure(start_dewpoint), start_pressure)
+    temperature = start_temperature * (pressure / start_pressure) ** thermo.KAPPA
+    return temperature, thermo.dewpoint_from_vapor_pressure(pressure * mixing_ratio / (thermo.EPSILON + mixing_ratio))
+
+
+class MoistAdiabatTable:
+
+    '''
+    Precomputed pseudo-adiabats T(θe, p), integrated once with mpcalc.moist_lapse on a grid of
+    saturated 1000 hPa temperatures. A moist ascent is afterwards a bilinear interpolation in
+    (adiabat, log pressure) instead of an ODE solve, fast enough to follow the mouse cursor.
+    All values are unit-free floats (pressure in hPa, temperature in K).
+
+    Parameters
+    ----------
+    pressure_range : tuple(float) : Highest and lowest pressure of the table in hPa.
+    levels : int : Number of logarithmically spaced pressure levels.
+    temperature_range : tuple(float) : Lowest and highest 1000 hPa temperature of the adiabats in degC.
+    step : float : Spacing of the adiabats at 1000 hPa in K.
+    '''
+
+    def __init__(self, pressure_range=(1050, 100), levels=191, temperature_range=(-45, 45), step=0.5):
+
+        pressure = np.geomspace(*pressure_range, levels)
+        start = np.arange(temperature_range[0], temperature_range[1] + step / 2, step)
+        temperature = mpcalc.moist_lapse(pressure * units.hPa, start * units.degC, 1000 * units.hPa)
+
+        # ascending log pressure for np.interp
+        self.log_pressure = np.log(pressure[::-1])
+        self.temperature = temperature.m_as('K')[:, ::-1]
+        start = start * units.degC
+        self.theta_e = mpcalc.equivalent_potential_temperature(1000 * units.hPa, start, start).m_as('K')
+        self._rows = np.arange(len(start), dtype=float)
+
+    def adiabat(self, pressure, temperature):
+
+        '''
+        Returns the fractional row of the adiabat through a saturated point (pressure in hPa, temperature in K).
+        '''
+
+        log_p = np.log(pressure)
+        j = np.clip(np.searchsorted(self.log_pressure, log_p) - 1, 0, len(self.log_pressure) - 2)
+        weight = (log_p - self.log_pressure[j]) / (self.log_pressure[j + 1] - self.log_pressure[j])
+        column = self.temperature[:, j] * (1 - weight) + self.temperature[:, j + 1] * weight
+        return np.interp(temperature, column, self._rows)
+
+    def lift(self, row, pressure):
+
+        '''
+        Returns the temperature in K of the adiabat at a fractional row at the given pressures in hPa.
+        '''
+
+        i = min(int(row), len(self._rows) - 2)
+        fraction = row - i
+        adiabat = self.temperature[i] * (1 - fraction) + self.temperature[i + 1] * fraction
+        return np.interp(np.log(pressure), self.log_pressure, adiabat)
+
+    def equivalent_potential_temperature(self, row):
+        return float(np.interp(row, self._rows, self.theta_e))
+
+
+def _lfc_el(log_p, diff, log_lcl):
+    # sign changes of the parcel excess (interpolated in log pressure), bottom lfc and top el
+    idx = np.flatnonzero(np.sign(diff[:-1]) * np.sign(diff[1:]) < 0)
+    fraction = diff[idx] / (diff[idx] - diff[idx + 1])
+    crossings = log_p[idx] + fraction * (log_p[idx + 1] - log_p[idx])
+    rising = diff[idx + 1] > 0 # negative to positive: lfc candidates, positive to negative: el candidates
+
+    log_lfc = log_el = np.nan
+    candidates = crossings[rising & (crossings < log_lcl)]
+    if len(candidates):
+        log_lfc = candidates[0]
+    elif np.any(diff[log_p < log_lcl] > 0): # positive above the lcl without crossing: lfc = lcl
+        log_lfc = log_lcl
+    if not np.isnan(log_lfc):
+        candidates = crossings[~rising & (crossings < log_lfc)]
+        if len(candidates):
+            log_el = candidates[-1]
+    return log_lfc, log_el, idx, crossings
+
+
+def _virtual_excess(pressure, temperature, dewpoint, profile, below_lcl):
+    # virtual temperature of the parcel (dewpoint mixing ratio below the lcl, saturated above) minus the environment's
+    env_virtual = thermo.virtual_temperature(temperature, thermo.mixing_ratio(thermo.saturation_vapor_pressure(dewpoint), pressure))
+    parcel_mixing_ratio = thermo.mixing_ratio(thermo.saturation_vapor_pressure(np.where(below_lcl, dewpoint, temperature)), pressure)
+    return thermo.virtual_temperature(profile, parcel_mixing_ratio) - env_virtual
+
+
+def _lfc_el_points(log_p, profile, temperature, press_lcl, temp_lcl):
+    # lfc and el (as mpcalc.lfc/el) with the lcl inserted as level, environment linear in pressure,
+    # as (pressure, parcel temperature) tuples, nan if undefined
+    log_lcl = np.log(press_lcl)
+    loc = np.searchsorted(-log_p, -log_lcl)
+    log_p_with_lcl = np.insert(log_p, loc, log_lcl)
+    profile_with_lcl = np.insert(profile, loc, temp_lcl)
+    env_lcl = np.interp(press_lcl, np.exp(log_p[::-1]), temperature[::-1])
+    log_lfc, log_el, _, _ = _lfc_el(log_p_with_lcl, profile_with_lcl - np.insert(temperature, loc, env_lcl), log_lcl)
+
+    def point(log_press):
+        if np.isnan(log_press):
+            return np.nan, np.nan
+        return float(np.exp(log_press)), float(np.interp(log_press, log_p_with_lcl[::-1], profile_with_lcl[::-1]))
+    return point(log_lfc), point(log_el)
+
+
+def _cape_cin(log_p, virtual_diff, log_lcl):
+    # cape and cin in J/kg from the virtual temperature excess with the integration limits of mpcalc.cape_cin
+    # (lfc and el of the virtual temperatures, zero crossings inserted as levels)
+    log_lfc, log_el, idx, crossings = _lfc_el(log_p, virtual_diff, log_lcl)
+    if np.isnan(log_lfc):
+        return 0., 0.
+    log_x = np.insert(log_p, idx + 1, crossings)
+    y = np.insert(virtual_diff, idx + 1, 0.)
+    top = log_x[-1] if np.isnan(log_el) else log_el
+    mask = (log_x <= log_lfc + 1e-9) & (log_x >= top - 1e-9)
+    cape = thermo.RD * -np.trapezoid(y[mask], log_x[mask])
+    mask = log_x >= log_lfc - 1e-9
+    cin = min(thermo.RD * -np.trapezoid(y[mask], log_x[mask]), 0.) + 0. # + 0.: no -0.0 (as mpcalc)
+    return float(cape), float(cin)
+
+
+class FastParcelAnalysis:
+
+    '''
+    Unit-free counterpart of ParcelAnalysis on float arrays (pressure in hPa, temperature in K): the surface
+    parcel is lifted once with thermo.py (every level above the LCL integrated from the LCL with RK4 in log pressure)
+    and LCL, LFC, EL, CAPE/CIN and Lifted Index follow the definitions of metpy.calc without pint.
+
+    Parameters
+    ----------
+    pressure : np.ndarray : Pressure profile in hPa, from high to low pressure.
+    temperature : np.ndarray : Temperature in K at the levels given by pressure.
+    dewpoint : np.ndarray : Dewpoint in K at the levels given by pressure.
+    steps : int : Number of RK4 steps of the moist ascent.
+
+    Attributes
+    ----------
+    lcl : tuple(float) : LCL pressure in hPa and temperature in K.
+    profile : np.ndarray : Parcel temperature in K at the levels given by pressure (as mpcalc.parcel_profile).
+    '''
+
+    def __init__(self, pressure, temperature, dewpoint, steps=PARCEL_STEPS):
+
+        self.pressure = pressure
+        self.temperature = temperature
+        self.dewpoint = dewpoint
+
+        press_lcl, temp_lcl = thermo.lcl(pressure[0], temperature[0], dewpoint[0])
+        self.lcl = (float(press_lcl), float(temp_lcl))
+
+        # dry adiabatic below the lcl, moist adiabatic from the dry adiabat at the lcl (as mpcalc.parcel_profile)
+        below = pressure >= press_lcl
+        dry_lcl = temperature[0] * (press_lcl / pressure[0]) ** thermo.KAPPA
+        upper = pressure[~below]
+        self.profile = np.concatenate((temperature[0] * (pressure[below] / pressure[0]) ** thermo.KAPPA,
+                                       thermo.moist_lapse(upper, np.full(len(upper), press_lcl),
+                                                          np.full(len(upper), dry_lcl), steps)))
+        self._below = below
+        self._lfc_el = None
+
+    def _points(self):
+        if self._lfc_el is None:
+            self._lfc_el = _lfc_el_points(np.log(self.pressure), self.profile, self.temperature, *self.lcl)
+        return self._lfc_el
+
+    @property
+    def lfc(self):
+        return self._points()[0]
+
+    @property
+    def el(self):
+        return self._points()[1]
+
+    def cape_cin(self):
+
+        '''
+        Returns CAPE and CIN in J/kg from the virtual temperature excess of the parcel, with the integration limits
+        (LFC and EL of the virtual temperatures, zero crossings as levels) of mpcalc.cape_cin.
+        '''
+
+        pressure, temperature, dewpoint = self.pressure, self.temperature, self.dewpoint
+        virtual_diff = _virtual_excess(pressure, temperature, dewpoint, self.profile, self._below)
+
+        # mpcalc.lfc compares with the lcl of the virtual start temperature (slightly above the lcl)
+        parcel_mixing_ratio = thermo.mixing_ratio(thermo.saturation_vapor_pressure(dewpoint[0]), pressure[0])
+        start_virtual = thermo.virtual_temperature(self.profile[0], parcel_mixing_ratio)
+        press_lcl_v, _ = thermo.lcl(pressure[0], start_virtual, dewpoint[0])
+        return _cape_cin(np.log(pressure), virtual_diff, np.log(press_lcl_v))
+
+    def lifted_index(self):
+        # environment minus parcel temperature at 500 hPa (linear in pressure, as mpcalc.lifted_index)
+        pressure = self.pressure[::-1]
+        return np.array([np.interp(500., pressure, self.temperature[::-1], left=np.nan, right=np.nan)
+                         - np.interp(500., pressure, self.profile[::-1], left=np.nan, right=np.nan)])
+
+
+def fast_parcel(pressure, temperature, dewpoint, start_pressure, start_temperature, start_dewpoint, table):
+
+    '''
+    Function to lift a parcel from any point of a sounding with the precomputed moist adiabats,
+    calculating LCL, LFC, EL, CAPE and CIN like MetPy (virtual temperature correction, bottom LFC,
+    top EL) without units and without solving ODEs. Used by the interactive parcel tool.
+
+    Parameters
+    ----------
+    pressure : np.ndarray : Environment pressure in hPa, from high to low pressure.
+    temperature : np.ndarray : Environment temperature in K.
+    dewpoint : np.ndarray : Environment dewpoint in K.
+    start_pressure : float : Pressure in hPa the parcel is lifted from.
+    start_temperature : float : Start temperature in K.
+    start_dewpoint : float : Start dewpoint in K, limited to start_temperature.
+    table : MoistAdiabatTable : Precomputed moist adiabats.
+
+    Returns
+    -------
+    dict : 'pressure', 'profile' and 'temperature' (parcel levels in hPa, parcel and environment temperature in K,
+        starting at the start point), 'lcl', 'lfc', 'el' as (pressure, temperature) tuples (nan if undefined),
+        'cape' and 'cin' in J/kg, 'adiabat' (row of the moist adiabat in table) and its 'theta_e' in K.
+    '''
+
+    start_dewpoint = min(start_dewpoint, start_temperature)
+    press_lcl, temp_lcl = thermo.lcl(start_pressure, start_temperature, start_dewpoint)
+    row = table.adiabat(press_lcl, temp_lcl)
+
+    # environment above the start point, with the start point inserted as first level
+    above = pressure < start_pressure
+    log_p = np.log(np.concatenate(([start_pressure], pressure[above])))
+    log_env = np.log(pressure[::-1])
+    env_temp = np.concatenate(([np.interp(log_p[0], log_env, temperature[::-1])], temperature[above]))
+    env_dew = np.concatenate(([np.interp(log_p[0], log_env, dewpoint[::-1])], dewpoint[above]))
+    press = np.exp(log_p)
+
+    below_lcl = press > press_lcl
+    profile = np.where(below_lcl, start_temperature * (press / start_pressure) ** thermo.KAPPA, table.lift(row, press))
+
+    # lfc and el from the parcel excess as mpcalc.lfc/el, cape and cin from the virtual
+    # temperature excess with its own integration limits, as mpcalc.cape_cin
+    lfc, el = _lfc_el_points(log_p, profile, env_temp, press_lcl, temp_lcl)
+    cape, cin = _cape_cin(log_p, _virtual_excess(press, env_temp, env_dew, profile, below_lcl), np.log(press_lcl))
+
+    return {
+        'pressure': press,
+        'profile': profile,
+        'temperature': env_temp,
+        'lcl': (float(press_lcl), float(temp_lcl)),
+        'lfc': lfc,
+        'el': el,
+        'cape': cape,
+        'cin': cin,
+        'adiabat': row,
+        'theta_e': table.equivalent_potential_temperature(row)
+    }
@@ -0,0 +1,183 @@
+import numpy as np
+from .parcel import MoistAdiabatTable
+from .parcel import fast_parcel
+from .parcel import dry_ascent
+from .thermo import ZERO_DEGC
+from .display import category_layout
+from .template import fill_betweenx_polygons
+
+
+class ParcelTool:
+
+    '''
+    Click/drag parcel on a skew-t: the parcel is lifted from the cursor position (cursor temperature,
+    environmental dewpoint at the cursor pressure) along the dry adiabat and the mixing ratio line
+    to its LCL and along the moist adiabat above. Moist ascents are interpolated in a precomputed
+    MoistAdiabatTable and only the parcel artists are redrawn (blitting), so the tool follows the
+    cursor also on dense soundings. Live LCL, LFC, EL, CAPE and CIN are shown in the parameter panel.
+
+    Left click/drag lifts a parcel, escape hides it.
+
+    Parameters
+    ----------
+    skew : metpy.plots.SkewT : Skew-t to attach the tool to (e.g. returned by display_sounding).
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    config : dict : Configuration dictionary, tool settings are taken from config['parcel_tool'],
+        the panel layout from config['text_display']['categories']['live_parcel'].
+    table : MoistAdiabatTable, optional : Precomputed moist adiabats, built if not given.
+    '''
+
+    keys = ['Start', 'LCL', 'LFC', 'EL', 'CAPE', 'CIN', 'θe']
+
+    def __init__(self, skew, extracted_data, config, table=None):
+
+        self.ax = skew.ax
+        self.fig = self.ax.figure
+        self.canvas = self.fig.canvas
+        self.table = table or MoistAdiabatTable()
+
+        # unit-free environment (hPa, K) for the fast parcel calculation
+        self.pressure = extracted_data['pressure'].m_as('hPa')
+        self.temperature = extracted_data['temp'].m_as('K')
+        self.dewpoint = extracted_data['dewpoint'].m_as('K')
+        self.top = min(self.ax.get_ylim())
+
+        color = config.get('parcel_tool', {}).get('color', 'darkorange')
+        self.dry_line = self.ax.plot([], [], c=color, lw=1.5)[0]
+        self.moist_line = self.ax.plot([], [], c=color, lw=1.5, linestyle='--')[0]
+        self.mixing_line = self.ax.plot([], [], c=color, lw=1, linestyle='dotted')[0]
+        empty = np.array([])
+        self.cape_area = self.ax.fill_betweenx(empty, empty, empty, facecolor=color, alpha=0.3, interpolate=True)
+        self.markers = self.ax.plot([], [], marker='o', c=color, markersize=5, linestyle='none', zorder=6)[0] # much faster to draw than a scatter
+
+        # static headline and keys. Keys and values are multi-line texts with the same line spacing (converted
+        # from figure fraction to multiples of the font size), so every event lays out one text instead of one per value
+        cat_x, cat_y, headline_elevation, indent, line_spacing, self.unit, headline, key_val_spacing, \
+            text_fontsize, hl_fontsize = category_layout(config, 'live_parcel')
+        linespacing = line_spacing * self.fig.get_figheight() * 72 / text_fontsize
+        self.fig.text(cat_x, cat_y + headline_elevation, headline, fontsize=hl_fontsize, ha='left', va='top')
+        self.fig.text(cat_x + indent, cat_y - line_spacing, '\n'.join(f'{key}:' for key in self.keys),
+                      fontsize=text_fontsize, ha='left', va='top', linespacing=linespacing)
+        self.value_text = self.fig.text(cat_x + indent + key_val_spacing, cat_y - line_spacing, '\n'.join('-' * len(self.keys)),
+                                        fontsize=text_fontsize, ha='left', va='top', linespacing=linespacing)
+
+        self.artists = [self.cape_area, self.dry_line, self.moist_line, self.mixing_line, self.markers, self.value_text]
+        for artist in self.artists:
+            artist.set_animated(True) # only drawn by the tool, never part of the cached background
+
+        self._background = None
+        self._dragging = False
+        self.canvas.mpl_connect('button_press_event', self._on_press)
+        self.canvas.mpl_connect('motion_notify_event', self._on_move)
+        self.canvas.mpl_connect('button_release_event', self._on_release)
+        self.canvas.mpl_connect('key_press_event', self._on_key)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _format_point(self, point):
+        press, temp = point
+        if np.isnan(press):
+            return '-'
+        return f'{temp - ZERO_DEGC:.1f}{self.unit[0]} | {press:.1f}{self.unit[1]}'
+
+    def lift(self, start_pressure, start_temperature):
+
+        '''
+        Lifts a parcel from a point of the skew-t and updates the parcel artists (without drawing).
+
+        Parameters
+        ----------
+        start_pressure : float : Start pressure in hPa.
+        start_temperature : float : Start temperature in degC.
+
+        Returns
+        -------
+        dict : Result of fast_parcel.
+        '''
+
+        start_temperature = start_temperature + ZERO_DEGC
+        log_env = np.log(self.pressure[::-1])
+        start_dewpoint = np.interp(np.log(start_pressure), log_env, self.dewpoint[::-1])
+        result = fast_parcel(self.pressure, self.temperature, self.dewpoint,
+                             start_pressure, start_temperature, start_dewpoint, self.table)
+        press_lcl, temp_lcl = result['lcl']
+
+        # lines on their own pressure grids, independent of the sounding's resolution
+        dry_pressure = np.geomspace(start_pressure, press_lcl, 20)
+        dry_temp, dry_dew = dry_ascent(start_pressure, start_temperature, min(start_dewpoint, start_temperature), dry_pressure)
+        moist_pressure = np.geomspace(press_lcl, self.top, 50)
+        moist_temp = self.table.lift(result['adiabat'], moist_pressure)
+        self.dry_line.set_data(dry_temp - ZERO_DEGC, dry_pressure)
+        self.mixing_line.set_data(dry_dew - ZERO_DEGC, dry_pressure)
+        self.moist_line.set_data(moist_temp - ZERO_DEGC, moist_pressure)
+
+        profile, environment = result['profile'] - ZERO_DEGC, result['temperature'] - ZERO_DEGC
+        self.cape_area.set_verts(fill_betweenx_polygons(result['pressure'], profile, environment, profile > environment))
+
+        points = np.array([result['lcl'], result['lfc'], result['el']])
+        points = points[~np.isnan(points[:, 0])]
+        self.markers.set_data(points[:, 1] - ZERO_DEGC, points[:, 0])
+
+        values = {
+            'Start': self._format_point((start_pressure, start_temperature)),
+            'LCL': self._format_point(result['lcl']),
+            'LFC': self._format_point(result['lfc']),
+            'EL': self._format_point(result['el']),
+            'CAPE': f'{round(result["cape"], 1) + 0:.1f}{self.unit[2]}',
+            'CIN': f'{round(result["cin"], 1) + 0:.1f}{self.unit[2]}',
+            'θe': f'{result["theta_e"]:.1f}{self.unit[3]}'
+        }
+        self.value_text.set_text('\n'.join(values[key] for key in self.keys))
+        return result
+
+    def draw(self):
+
+        '''
+        Redraws only the parcel artists on top of the cached background.
+        '''
+
+        if self._background is None:
+            self.canvas.draw() # caches the background and draws the artists (_on_draw)
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+        self.canvas.blit(self.fig.bbox)
+
+    def _draw_artists(self):
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+
+    def _on_draw(self, event):
+        # a full draw (resize, zoom, other redraws) invalidates the background
+        if event is not None and event.canvas is not self.canvas:
+            return
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_artists()
+
+    def _update(self, event):
+        if event.inaxes is not self.ax or event.xdata is None:
+            return
+        if not self.pressure[-1] < event.ydata <= self.pressure[0]: # only within the sounding
+            return
+        for artist in self.artists:
+            artist.set_visible(True)
+        self.lift(event.ydata, event.xdata)
+        self.draw()
+
+    def _on_press(self, event):
+        if event.button != 1 or self.canvas.widgetlock.locked(): # zoom/pan of the toolbar is active
+            return
+        self._dragging = True
+        self._update(event)
+
+    def _on_move(self, event):
+        if self._dragging:
+            self._update(event)
+
+    def _on_release(self, event):
+        self._dragging = False
+
+    def _on_key(self, event):
+        if event.key == 'escape':
+            for artist in self.artists:
+                artist.set_visible(False)
+            self.draw()
@@ -0,0 +1,139 @@
+from io import BytesIO
+from time import perf_counter
+import hashlib
+import json
+import matplotlib
+from .template import SoundingFigureTemplate
+from .instrumentation import timed
+
+# settings of a render profile which are not given in config['render']['profiles']
+PROFILE_DEFAULTS = {
+    'dpi': 100,
+    'figsize': None, # config['figsize']
+    'antialiased': True,
+    'legend': None, # config['skewt']['legend']
+    'simplify_threshold': 1 / 9, # matplotlib default
+    'png_compression': 6, # zlib level of the PNG encoder, 1 is fastest
+    'parameters': True,
+    'adiabats': True
+}
+
+# per process figure templates, one per config, profile and resolution
+_templates = {}
+
+
+def render_profile(config, profile=None):
+
+    '''
+    Function to get the settings of a render profile (config['render']['profiles']) merged over PROFILE_DEFAULTS.
+
+    Parameters
+    ----------
+    config : dict : Configuration dictionary.
+    profile : str, optional : Name of the profile, config['render']['profile'] if None.
+
+    Returns
+    -------
+    dict : Settings of the profile, with its name as 'name'.
+
+    Raises
+    ------
+    ValueError : If the profile is not defined.
+    '''
+
+    render_config = config.get('render', {})
+    profile = profile or render_config.get('profile', 'default')
+    profiles = render_config.get('profiles', {})
+    if profile not in profiles and profile != 'default':
+        raise ValueError(f"Unknown render profile '{profile}', available: {list(dict.fromkeys(['default', *profiles]))}.")
+    settings = dict(PROFILE_DEFAULTS, figsize=config['figsize'], legend=config['skewt']['legend'])
+    settings.update(profiles.get(profile, {}))
+    settings['name'] = profile
+    return settings
+
+
+def rc_params(settings):
+
+    '''
+    Returns the matplotlib rcParams of a render profile: antialiasing of lines, patches, collections and text,
+    and path simplification (vertices closer than simplify_threshold pixels to the line are dropped).
+    '''
+
+    antialiased = settings['antialiased']
+    return {
+        'lines.antialiased': antialiased,
+        'patch.antialiased': antialiased,
+        'text.antialiased': antialiased,
+        'path.simplify': True,
+        'path.simplify_threshold': settings['simplify_threshold']
+    }
+
+
+def get_template(config, profile=None, dpi=None):
+
+    '''
+    Function to get the figure template of a render profile, built on first use in every process.
+
+    Parameters
+    ----------
+    config : dict : Configuration dictionary.
+    profile : str, optional : Name of the render profile (see render_profile).
+    dpi : int, optional : Resolution overriding the one of the profile.
+
+    Returns
+    -------
+    tuple(SoundingFigureTemplate, dict) : The template and the settings of the profile.
+    '''
+
+    settings = render_profile(config, profile)
+    if dpi:
+        settings['dpi'] = dpi
+    key = (hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest(),
+           settings['name'], settings['dpi'])
+    if key not in _templates:
+        profile_config = dict(config, figsize=settings['figsize'],
+                              skewt=dict(config['skewt'], legend=settings['legend']))
+        # antialiasing is taken from the rcParams when the artists are created
+        with matplotlib.rc_context(rc_params(settings)):
+            _templates[key] = SoundingFigureTemplate(profile_config, settings['dpi'], adiabats=settings['adiabats'],
+                                                     parameters=settings['parameters'])
+    return _templates[key], settings
+
+
+@timed()
+def render_bytes(extracted_data, params, config, fmt='png', profile=None, dpi=None, sounding_properties=None,
+                 title='', wind_data=None):
+
+    '''
+    Function to render a sounding into image bytes in memory (no pyplot window, no temporary files) with the
+    figure template of a render profile. Profiles are defined in config['render']['profiles'], e.g. 'fast'
+    (lower dpi, no antialiasing, no legend, coarser path simplification, fast PNG compression) and 'thumbnail'
+    for gallery views (additionally without parameter texts, adiabats and mixing lines).
+
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    params : dict : Parameters calculated by calc_params.
+    config : dict : Configuration dictionary.
+    fmt : str : Image format, 'png' or 'svg'.
+    profile : str, optional : Name of the render profile, config['render']['profile'] if None.
+    dpi : int, optional : Resolution overriding the one of the profile.
+    sounding_properties : dict, optional : Properties of the sounding (e.g. lat, lon, station_id).
+    title : str : Figure title.
+    wind_data : dict, optional : Result of extract_relevant_wind_data, calculated if not given.
+
+    Returns
+    -------
+    dict : 'data' (encoded image bytes), 'format', 'profile', 'width' and 'height' in pixels and 'render_s',
+        the render time in seconds (including building the template for the first image of a profile).
+    '''
+
+    start_time = perf_counter()
+    template, settings = get_template(config, profile, dpi)
+    buffer = BytesIO()
+    with matplotlib.rc_context(rc_params(settings)):
+        template.savefig(buffer, extracted_data, params, sounding_properties, title, fmt, wind_data,
+                         pil_kwargs={'compress_level': settings['png_compression']})
+    width, height = template.canvas.get_width_height()
+    return {'data': buffer.getvalue(), 'format': fmt, 'profile': settings['name'], 'width': width, 'height': height,
+            'render_s': perf_counter() - start_time}
@@ -0,0 +1,199 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib import animation
+from .data_processing import load_json_data
+from .data_processing import sounding_time
+from .data_processing import process_sounding
+from .data_processing import extract_relevant_wind_data
+from .data_processing import collect_sounding_files
+from .cache import ParamsCache
+from .params import displayed_params
+from .template import SoundingFigureTemplate
+
+
+def _file_time(filepath):
+    # valid time of a sounding file, read in the workers so the parent never holds the parsed soundings
+    return sounding_time(load_json_data(filepath))
+
+
+def load_sequence(inputs, executor=None):
+
+    '''
+    Function to find the soundings of a forecast series and sort them by time.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories, glob patterns or file paths (see collect_sounding_files).
+    executor : concurrent.futures.Executor, optional : Pool the files are read in, read here if None.
+
+    Returns
+    -------
+    list(tuple) : (time, filepath) sorted by time.
+    '''
+
+    files = collect_sounding_files(inputs)
+    times = executor.map(_file_time, files) if executor is not None else map(_file_time, files)
+    return sorted(zip(times, files))
+
+
+def prepare_sounding(filepath, config):
+
+    '''
+    Function to load a sounding file and calculate everything a frame of the sequence needs, runs in the
+    background workers (only the file path is sent to them).
+
+    Returns
+    -------
+    tuple : (extracted_data, params, wind_data, properties)
+    '''
+
+    windy_sounding = load_json_data(filepath)
+    extracted_data, params = process_sounding(windy_sounding, config, ParamsCache.from_config(config))
+    params.evaluate(displayed_params(config)) # calculated here in the pool, not when the frame is shown
+    return extracted_data, params, extract_relevant_wind_data(extracted_data, config), windy_sounding.get('properties')
+
+
+class SequenceViewer:
+
+    '''
+    Steps or animates through a forecast series of soundings for one location. The figure is built once
+    (SoundingFigureTemplate), every frame only updates lines, CAPE/CIN polygons, barbs, hodograph segments
+    and parameter texts in place. Parameters of all soundings are calculated in a background process pool
+    as soon as the viewer is created, so stepping only waits for hours that are not finished yet.
+
+    Keys: right/left (or n/p) next/previous hour, home/end first/last hour, space play/pause.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories, glob patterns or file paths of the soundings.
+    config : dict : Configuration dictionary, playback settings are taken from config['sequence'].
+    workers : int, optional : Number of worker processes, all cores if None.
+
+    Raises
+    ------
+    ValueError : If no sounding file was found.
+    '''
+
+    def __init__(self, inputs, config, workers=None):
+
+        self.config = config
+        sequence_config = config.get('sequence', {})
+        self.interval = sequence_config.get('interval_ms', 500)
+        self.loop = sequence_config.get('loop', True)
+
+        files = collect_sounding_files(inputs)
+        if not files:
+            raise ValueError(f'No soundings found in {inputs}.')
+
+        # the files are read and sorted by time in the workers, then all hours are precomputed in order,
+        # the first frame is usually ready first
+        workers = workers or sequence_config.get('workers') or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=min(workers, len(files)))
+        self.sequence = load_sequence(files, self.executor)
+        self.futures = [self.executor.submit(prepare_sounding, filepath, config) for _, filepath in self.sequence]
+
+        self.fig = plt.figure(figsize=tuple(config['figsize']))
+        self.template = SoundingFigureTemplate(config, fig=self.fig)
+        self.index = None
+        self.playing = False
+        self.timer = self.fig.canvas.new_timer(interval=self.interval)
+        self.timer.add_callback(self._advance)
+
+        self.fig.canvas.mpl_connect('key_press_event', self._on_key)
+        self.fig.canvas.mpl_connect('close_event', lambda event: self.close())
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def frame_title(self, index):
+        time, filepath = self.sequence[index]
+        valid_time = datetime.fromtimestamp(time, timezone.utc).strftime('%Y-%m-%d %H:%M UTC') if np.isfinite(time) else 'unknown time'
+        return f'{valid_time} ({index + 1}/{len(self)}) - Source: {filepath}'
+
+    def update(self, index):
+
+        '''
+        Updates the figure artists to the sounding at index (waits if its parameters are still being calculated).
+        '''
+
+        extracted_data, params, wind_data, properties = self.futures[index].result()
+        self.template.update(extracted_data, params, properties, self.frame_title(index), wind_data)
+        self.index = index
+
+    def show(self, index):
+
+        '''
+        Shows the sounding at index, only the data artists are redrawn (blitting).
+        '''
+
+        index = index % len(self) if self.loop else min(max(index, 0), len(self) - 1)
+        if index == self.index:
+            return
+        self.update(index)
+        self.template.draw()
+
+    def step(self, offset):
+        self.show((self.index or 0) + offset)
+
+    def toggle(self):
+        self.playing = not self.playing
+        if self.playing:
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def _advance(self):
+        if not self.loop and self.index == len(self) - 1:
+            self.toggle()
+            return
+        self.step(1)
+
+    def _on_key(self, event):
+        actions = {
+            'right': lambda: self.step(1), 'n': lambda: self.step(1),
+            'left': lambda: self.step(-1), 'p': lambda: self.step(-1),
+            'home': lambda: self.show(0), 'end': lambda: self.show(len(self) - 1),
+            ' ': self.toggle
+        }
+        if event.key in actions:
+            actions[event.key]()
+
+    def close(self):
+        self.timer.stop()
+        self.executor.shutdown(cancel_futures=True)
+
+    def run(self):
+
+        '''
+        Shows the first hour and opens the interactive window (blocks until it is closed).
+        '''
+
+        self.show(0)
+        plt.show()
+        self.close()
+
+    def save(self, filepath, fps=None):
+
+        '''
+        Saves the whole sequence as an animation (e.g. .gif with Pillow, .mp4 with ffmpeg) using matplotlib.animation.
+
+        Parameters
+        ----------
+        filepath : str : Output file, .gif is written with Pillow, other formats with matplotlib's default writer.
+        fps : float, optional : Frames per second, derived from config['sequence']['interval_ms'] if None.
+        '''
+
+        # frames are grabbed with full draws, which must include the data artists
+        self.template.blit = False
+        for artist in self.template._dynamic_artists():
+            artist.set_animated(False)
+        try:
+            anim = animation.FuncAnimation(self.fig, self.update, frames=len(self), cache_frame_data=False, repeat=False)
+            writer = 'pillow' if filepath.lower().endswith('.gif') else None # None: rcParams['animation.writer']
+            anim.save(filepath, writer=writer, fps=fps or 1000 / self.interval)
+        finally:
+            self.template.blit = True
+            self.template._background = None
@@ -0,0 +1,373 @@
+from collections import OrderedDict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from urllib.parse import urlsplit
+from urllib.parse import parse_qs
+import asyncio
+import hashlib
+import ipaddress
+import json
+import os
+import socket
+import sys
+import time
+import numpy as np
+
+CONTENT_TYPES = {'png': 'image/png', 'svg': 'image/svg+xml', 'json': 'application/json'}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error'}
+# number of requests per endpoint the latency percentiles are calculated from
+LATENCY_WINDOW = 1000
+
+# per worker process state, set up once by _init_worker
+_worker = {}
+
+
+class RequestError(Exception):
+
+    '''
+    Error answered with an HTTP status code and the message as JSON body.
+    '''
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _init_worker(config):
+    # imports matplotlib, metpy.plots, the display code and builds the figure template before the first
+    # request, so a request only pays for processing and drawing the sounding
+    import matplotlib
+    matplotlib.use('Agg')
+    from .cache import ParamsCache
+    from .render import get_template
+    server_config = config.get('server', {})
+    _worker['config'] = config
+    _worker['cache'] = ParamsCache.from_config(config)
+    for profile in dict.fromkeys(['default', *config.get('render', {}).get('profiles', {})]):
+        get_template(config, profile)
+    _worker['archive'] = None
+    if server_config.get('archive'):
+        from .archive import SoundingArchive
+        _worker['archive'] = SoundingArchive(server_config['archive'])
+
+
+def _ping():
+    # submitted once per worker at startup, so every worker process is started and initialized
+    return os.getpid()
+
+
+def _load(source):
+    # extracted data, params, properties and title of a ('json', body) or ('key', archive key) source
+    from .data_processing import process_sounding
+    kind, value = source
+    if kind == 'key':
+        archive = _worker['archive']
+        extracted_data, params = archive.process(value, _worker['config'], _worker['cache'])
+        return extracted_data, params, archive.properties(value), f'Source: {archive.path}:{value}'
+    windy_sounding = json.loads(value)
+    if not isinstance(windy_sounding, dict) or 'features' not in windy_sounding:
+        raise ValueError('Body is no windy.com sounding (JSON object with features).')
+    extracted_data, params = process_sounding(windy_sounding, _worker['config'], _worker['cache'])
+    properties = windy_sounding.get('properties') or {}
+    return extracted_data, params, properties, f'Source: {properties.get("path_source", "request")}'
+
+
+def render_source(source, fmt='png', profile=None, dpi=None):
+
+    '''
+    Worker function to render a sounding into image bytes with the warm figure templates of the process.
+
+    Parameters
+    ----------
+    source : tuple(str, bytes or str) : ('json', windy.com sounding as JSON bytes) or ('key', archive key).
+    fmt : str : Image format, 'png' or 'svg'.
+    profile : str, optional : Render profile (see render_bytes).
+    dpi : int, optional : Resolution overriding the one of the profile, a template is built once per resolution.
+
+    Returns
+    -------
+    bytes : The encoded image.
+    '''
+
+    from .render import render_bytes
+    extracted_data, params, properties, title = _load(source)
+    image = render_bytes(extracted_data, params, _worker['config'], fmt, profile, dpi, properties, title)
+    params.flush()
+    return image['data']
+
+
+def params_source(source):
+
+    '''
+    Worker function to calculate the params of a sounding as JSON bytes (see serialize_params).
+    '''
+
+    from .data_processing import serialize_params
+    _, params, _, _ = _load(source)
+    return json.dumps(serialize_params(params.evaluate()), ensure_ascii=False).encode()
+
+
+async def _result(future):
+    # result of a pool job, shielded so a closed connection does not cancel it for the requests sharing it
+    try:
+        return await asyncio.shield(future)
+    except (ValueError, KeyError, TypeError) as e: # the sounding could not be processed
+        raise RequestError(400, f'{type(e).__name__}: {e}')
+
+
+class RenderServer:
+
+    '''
+    Local HTTP service rendering soundings without a Python start per request. Requests are handled by an
+    asyncio server bound to a loopback address, rendering runs in a pool of worker processes which import
+    matplotlib/MetPy and build the figure template at startup. Rendered output is kept in an LRU cache keyed on
+    the hash of the sounding (JSON body or archive key), the config, the format, the profile and the resolution;
+    identical requests arriving while one is rendered wait for the same result.
+
+    Endpoints:
+        POST /render?format=png|svg&profile=P&dpi=N  windy.com sounding JSON as body -> image
+        GET  /render?key=KEY&format=...               sounding of the configured archive -> image
+        POST /params, GET /params?key=KEY             -> params as JSON (see serialize_params)
+        GET  /metrics                                 -> request counts, latency percentiles, queue depth, cache stats
+
+    Parameters
+    ----------
+    config : dict : Configuration dictionary, the settings below are taken from config['server'].
+    host : str, optional : Loopback address to bind to.
+    port : int, optional : Port to listen on, 0 for a free port.
+    workers : int, optional : Number of worker processes.
+    archive : str, optional : Archive directory (see build_archive) for requests by key.
+
+    Raises
+    ------
+    ValueError : If host is no loopback address.
+    '''
+
+    def __init__(self, config, host=None, port=None, workers=None, archive=None):
+
+        server_config = config.setdefault('server', {})
+        if archive is not None:
+            server_config['archive'] = archive
+        self.host = host or server_config.get('host', '127.0.0.1')
+        self.port = server_config.get('port', 8765) if port is None else port
+        self.workers = workers or server_config.get('workers') or os.cpu_count()
+        self.profiles = list(dict.fromkeys(['default', *config.get('render', {}).get('profiles', {})]))
+        self.cache_entries = server_config.get('cache_entries', 256)
+        self.max_body = int(server_config.get('max_body_mb', 20) * 1024 * 1024)
+        self.config = config
+
+        addresses = {info[4][0] for info in socket.getaddrinfo(self.host, self.port, proto=socket.IPPROTO_TCP)}
+        if not all(ipaddress.ip_address(address.split('%')[0]).is_loopback for address in addresses):
+            raise ValueError(f'The render server only binds to loopback addresses, got {self.host}.')
+
+        self.archive = None
+        if server_config.get('archive'):
+            from .archive import SoundingArchive
+            self.archive = SoundingArchive(server_config['archive'])
+
+        # the rendered output only depends on the sounding, the config and the request options
+        self.config_hash = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._executor = None
+        self._server = None
+
+        self.started = time.time()
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.requests = {}
+        self.statuses = {}
+        self.latencies = {}
+
+    async def start(self):
+
+        '''
+        Starts and warms up the worker processes and opens the listening socket.
+        '''
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(self.config,))
+        loop = asyncio.get_running_loop()
+        # every worker is started and initialized before the first request is accepted
+        start_time = perf_counter()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ping) for _ in range(self.workers)))
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f'Serving on http://{self.host}:{self.port} with {self.workers} warm workers '
+              f'(started in {perf_counter() - start_time:.2f} s)', file=sys.stderr)
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queue_depth(self):
+        # jobs submitted to the pool which wait for a free worker
+        return max(0, self.in_flight - self.workers)
+
+    async def _handle(self, reader, writer):
+        start_time = perf_counter()
+        endpoint = None
+        try:
+            try:
+                method, target, _ = (await reader.readline()).decode('latin-1').split()
+            except ValueError:
+                raise RequestError(400, 'Malformed request line.')
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                raise RequestError(400, f"Invalid Content-Length '{headers['content-length']}'.")
+            if length < 0:
+                raise RequestError(400, f'Invalid Content-Length {length}.')
+            if length > self.max_body:
+                raise RequestError(413, f'Body larger than {self.max_body} bytes.')
+            body = await reader.readexactly(length) if length else b''
+
+            url = urlsplit(target)
+            endpoint = url.path.rstrip('/') or '/'
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            status, content_type, payload = 200, *await self._dispatch(method, endpoint, query, body)
+        except RequestError as e:
+            status, content_type, payload = e.status, CONTENT_TYPES['json'], json.dumps({'error': str(e)}).encode()
+        except Exception as e:
+            status, content_type = 500, CONTENT_TYPES['json']
+            payload = json.dumps({'error': f'{type(e).__name__}: {e}'}).encode()
+
+        header = (f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\nContent-Type: {content_type}\r\n'
+                  f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n')
+        try:
+            writer.write(header.encode('latin-1') + payload)
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+        endpoint = endpoint if endpoint in ('/render', '/params', '/metrics') else 'other'
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.latencies.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(perf_counter() - start_time)
+
+    async def _dispatch(self, method, endpoint, query, body):
+        # (content type, payload) of a request
+        if endpoint == '/metrics':
+            if method != 'GET':
+                raise RequestError(405, 'Use GET for /metrics.')
+            return CONTENT_TYPES['json'], json.dumps(self.metrics(), indent=4).encode()
+        if endpoint not in ('/render', '/params'):
+            raise RequestError(404, f'Unknown endpoint {endpoint}, use /render, /params or /metrics.')
+        if method not in ('GET', 'POST'):
+            raise RequestError(405, f'Use GET or POST for {endpoint}.')
+
+        if 'key' in query:
+            if self.archive is None:
+                raise RequestError(400, 'Requests by key need an archive (server.archive or --archive).')
+            if query['key'] not in self.archive:
+                raise RequestError(404, f"No sounding '{query['key']}' in archive {self.archive.path}.")
+            source = ('key', query['key'])
+            source_hash = hashlib.sha256(f'{os.path.abspath(self.archive.path)}:{query["key"]}'.encode()).hexdigest()
+        elif body:
+            source = ('json', body)
+            source_hash = hashlib.sha256(body).hexdigest()
+        else:
+            raise RequestError(400, 'Send a windy.com sounding as JSON body or an archive key (?key=).')
+
+        if endpoint == '/params':
+            return CONTENT_TYPES['json'], await self._cached((source_hash, 'params'), params_source, source)
+
+        fmt = query.get('format', 'png')
+        if fmt not in ('png', 'svg'):
+            raise RequestError(400, f"Unsupported format '{fmt}', use png or svg.")
+        profile = query.get('profile', self.config.get('render', {}).get('profile', 'default'))
+        if profile not in self.profiles:
+            raise RequestError(400, f"Unknown profile '{profile}', use one of {self.profiles}.")
+        try:
+            dpi = int(query['dpi']) if 'dpi' in query else None
+        except ValueError:
+            raise RequestError(400, f"Invalid dpi '{query['dpi']}'.")
+        if dpi is not None and not 10 <= dpi <= 600:
+            raise RequestError(400, 'dpi must be between 10 and 600.')
+        return CONTENT_TYPES[fmt], await self._cached((source_hash, fmt, profile, dpi), render_source,
+                                                      source, fmt, profile, dpi)
+
+    async def _cached(self, options, func, *args):
+        # result of func(*args) in a worker, from the LRU cache or shared with an identical running request
+        key = (self.config_hash, *options)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._cache[key]
+        self.cache_misses += 1
+        if key in self._pending:
+            return await _result(self._pending[key])
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        self._pending[key] = future
+        self.in_flight += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            result = await _result(future)
+        finally:
+            self.in_flight -= 1
+            self._pending.pop(key, None)
+
+        self._cache[key] = result
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+        return result
+
+    def metrics(self):
+
+        '''
+        Returns request counts, latency percentiles (ms, last LATENCY_WINDOW requests per endpoint),
+        current and maximum queue depth, jobs in flight and cache statistics.
+        '''
+
+        latency = {
+            endpoint: {name: round(float(np.percentile(values, q)) * 1000, 3)
+                       for name, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))}
+            for endpoint, values in self.latencies.items()
+        }
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'workers': self.workers,
+            'requests': self.requests,
+            'statuses': {str(status): count for status, count in sorted(self.statuses.items())},
+            'latency_ms': latency,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'cache': {'hits': self.cache_hits, 'misses': self.cache_misses, 'entries': len(self._cache),
+                      'max_entries': self.cache_entries, 'bytes': sum(len(value) for value in self._cache.values())}
+        }
+
+
+def serve(config, host=None, port=None, workers=None, archive=None):
+
+    '''
+    Function to run the render server (see RenderServer) until interrupted.
+    '''
+
+    server = RenderServer(config, host, port, workers, archive)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print('Render server stopped.', file=sys.stderr)
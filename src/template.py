@@ -0,0 +1,328 @@
+from .units import units
+from .units import enable_matplotlib_units
+from metpy.plots import SkewT
+from metpy.plots import Hodograph
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib import gridspec
+from matplotlib.collections import LineCollection
+import matplotlib.image as mpimg
+import numpy as np
+from .data_processing import extract_relevant_wind_data
+from .display import category_layout
+from .display import format_param_value
+from .params import text_categories
+from .params import magnitude
+
+enable_matplotlib_units()
+
+
+def _crossing(y, x1, x2, i, j):
+    # point between the adjacent levels i and j where x1 and x2 intersect (linear in data coordinates)
+    d_i, d_j = x1[i] - x2[i], x1[j] - x2[j]
+    frac = d_i / (d_i - d_j) if d_i != d_j else 0.
+    return y[i] + frac * (y[j] - y[i]), x1[i] + frac * (x1[j] - x1[i])
+
+
+def fill_betweenx_polygons(y, x1, x2, where):
+
+    '''
+    Function to calculate the polygons of ax.fill_betweenx(y, x1, x2, where=where, interpolate=True)
+    without creating an artist, so an existing PolyCollection can be updated with set_verts.
+
+    Parameters
+    ----------
+    y : np.ndarray : Vertical coordinates (e.g. pressure in hPa).
+    x1, x2 : np.ndarray : Horizontal coordinates of both curves (e.g. temperatures in degC).
+    where : np.ndarray(bool) : Levels to fill, contiguous runs form one polygon each.
+
+    Returns
+    -------
+    list(np.ndarray) : (x, y) vertices of every polygon.
+    '''
+
+    polygons = []
+    indices = np.flatnonzero(where)
+    if indices.size == 0:
+        return polygons
+    for run in np.split(indices, np.flatnonzero(np.diff(indices) > 1) + 1):
+        start, stop = run[0], run[-1] + 1
+        ys, left, right = y[start:stop], x1[start:stop], x2[start:stop]
+        # close the polygon at the intersections with the neighbouring levels outside the run
+        if start > 0:
+            y_c, x_c = _crossing(y, x1, x2, start - 1, start)
+            ys, left, right = np.r_[y_c, ys], np.r_[x_c, left], np.r_[x_c, right]
+        if stop < len(y):
+            y_c, x_c = _crossing(y, x1, x2, stop - 1, stop)
+            ys, left, right = np.r_[ys, y_c], np.r_[left, x_c], np.r_[right, x_c]
+        polygons.append(np.column_stack([np.r_[left, right[::-1]], np.r_[ys, ys[::-1]]]))
+    return polygons
+
+
+class SoundingFigureTemplate:
+
+    '''
+    Reusable skew-t/hodograph/parameter figure for rendering many soundings with the same config.
+    SkewT, Hodograph, dry/moist adiabats, mixing lines, grids, labels and parameter headlines are built once.
+    For every sounding only the data artists (temperature, dewpoint, parcel and optional temperature lines,
+    CAPE/CIN shading, points, barbs, hodograph trace, parameter values) are updated in place. With blitting, the
+    rasterized background is restored from a cached copy instead of being redrawn.
+
+    Parameters
+    ----------
+    config : dict : Configuration dictionary containing plot settings and functionalities.
+    dpi : int : Resolution of the Agg canvas.
+    blit : bool : If True, render() restores the cached background and only draws the data artists.
+    fig : matplotlib.figure.Figure, optional : Existing (e.g. pyplot) figure to build the template on,
+        a headless Agg figure is created if not given.
+    adiabats : bool : If False, the dry/moist adiabats and mixing lines are left out (e.g. thumbnails).
+    parameters : bool : If False, the parameter texts are left out (e.g. thumbnails).
+    '''
+
+    def __init__(self, config, dpi=100, blit=True, fig=None, adiabats=True, parameters=True):
+
+        self.config = config
+        self.blit = blit
+        self.parameters = parameters
+        if fig is None:
+            fig = Figure(figsize=tuple(config['figsize']), dpi=dpi)
+            FigureCanvasAgg(fig)
+        self.fig = fig
+        self.canvas = fig.canvas
+        self._background = None
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+        skewt_config = config['skewt']
+        functionalities = skewt_config['functionalities']
+        gs = gridspec.GridSpec(10, 15, figure=self.fig)
+
+        # static skew-t background, same styling as display_skewt_plot
+        self.skew = SkewT(self.fig, rotation=45, subplot=gs[:, 0:10])
+        ax = self.skew.ax
+        if adiabats:
+            self.skew.plot_dry_adiabats(lw=1, linestyle='solid', colors='darkgreen', alpha=0.4)
+            self.skew.plot_moist_adiabats(lw=1, linestyle='dashed', colors='darkgreen', alpha=0.4)
+            self.skew.plot_mixing_lines(lw=1, linestyle='dashed', colors='darkblue', alpha=0.4)
+        ax.set_xlabel(f'temperature ({units.degC})')
+        ax.set_ylabel(f'pressure ({units.hPa})')
+        ax.set_xlim(skewt_config['xlim'])
+        ax.set_ylim(skewt_config['ylim'])
+        ax.grid(skewt_config['grid'])
+        ax.set_title(skewt_config['title'])
+
+        # data lines, updated with set_data (x in degC, y in hPa)
+        line_styles = {
+            'temp': dict(color='red', label='Temperature'),
+            'dewpoint': dict(color='blue', label='Dewpoint'),
+            'parcel': dict(color='k', linestyle='--', label='Parcel Trace'),
+        }
+        if functionalities['show_equiv_pot_temp']:
+            line_styles['θe'] = dict(c='pink', lw=2, linestyle='solid', label='Equivalent Potential Temperature')
+        if functionalities['show_wb_temp']:
+            line_styles['Tw'] = dict(c='lightblue', lw=2, linestyle='solid', label='Wet-Bulb Temperature')
+        if functionalities['show_wb_pot_temp']:
+            line_styles['θw'] = dict(c='lightblue', lw=2, linestyle='dotted', label='Wet-Bulb Potential Temperature')
+        self.lines = {key: ax.plot([], [], **style)[0] for key, style in line_styles.items()}
+
+        self.points = ax.scatter([], [], marker='x', c='purple', s=50, zorder=5)
+        self.point_labels = {}
+        self.legend = ax.legend() if skewt_config['legend'] else None
+
+        # static hodograph background
+        hodograph_config = config['hodograph']
+        ax_hodograph = self.fig.add_subplot(gs[0:5, 10:15])
+        self.hodo = Hodograph(ax_hodograph, component_range=hodograph_config['component_range'])
+        self.hodo.add_grid(increment=hodograph_config['grid_increment'])
+
+        # cape/cin shading and hodograph trace, updated with set_verts/set_segments
+        self.shading = []
+        if functionalities['show_cape_cin']:
+            empty = np.array([])
+            self.shading = [ax.fill_betweenx(empty, empty, empty, facecolor=color, alpha=0.4, interpolate=True)
+                            for color in ('tab:red', 'tab:blue')]
+        self.hodo_trace = LineCollection([], linewidth=3)
+        self.hodo.ax.add_collection(self.hodo_trace)
+        # barbs can't change their number of elements, they are only recreated if the number of levels changes
+        self.barbs = None
+
+        # parameter texts: headline per category and (key, value) artists per (category, row), the keys of a
+        # category (e.g. sounding properties) can differ between soundings, unused rows are hidden
+        self.headlines = {}
+        self.param_rows = {}
+        self.title = self.fig.suptitle('')
+
+    def _dynamic_artists(self):
+        artists = list(self.lines.values()) + [self.points] + list(self.point_labels.values())
+        artists += self.shading + [self.hodo_trace] + ([self.barbs] if self.barbs is not None else [])
+        artists += list(self.headlines.values()) + [text for row in self.param_rows.values() for text in row]
+        artists += [self.title]
+        if self.legend is not None:
+            artists.append(self.legend) # drawn last so it stays on top of the data lines
+        return sorted(artists, key=lambda artist: artist.get_zorder()) # same order as in a full draw
+
+    def _param_row(self, category_name, index):
+        # create the headline of a category and the key and value text of a row once, return key and value text
+        if (category_name, index) not in self.param_rows:
+            cat_x, cat_y, headline_elevation, indent, line_spacing, _, headline, key_val_spacing, \
+                text_fontsize, hl_fontsize = category_layout(self.config, category_name)
+            if category_name not in self.headlines:
+                self.headlines[category_name] = self.fig.text(cat_x, cat_y + headline_elevation, headline,
+                                                              fontsize=hl_fontsize, ha='left', va='top')
+            y = cat_y - index*line_spacing
+            self.param_rows[(category_name, index)] = (
+                self.fig.text(cat_x + indent, y, '', fontsize=text_fontsize, ha='left', va='top'),
+                self.fig.text(cat_x + indent + key_val_spacing, y, '', fontsize=text_fontsize, ha='left', va='top'))
+        return self.param_rows[(category_name, index)]
+
+    def update(self, extracted_data, params, sounding_properties=None, title='', wind_data=None):
+
+        '''
+        Updates all data artists of the template to a sounding.
+
+        Parameters
+        ----------
+        extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+        params : dict : Parameters calculated by calc_params (not modified).
+        sounding_properties : dict, optional : Properties of the sounding (e.g. lat, lon, station_id).
+        title : str : Figure title.
+        wind_data : dict, optional : Result of extract_relevant_wind_data, calculated if not given.
+
+        Returns
+        -------
+        None
+        '''
+
+        functionalities = self.config['skewt']['functionalities']
+        pres, temp, dew = [extracted_data.get(key, 1) for key in ['pressure', 'temp', 'dewpoint']]
+        pres_hpa = magnitude(pres, units.hPa)
+        temp_c, parcel_c = magnitude(temp, units.degC), magnitude(params['other']['Parcel Profile'], units.degC)
+
+        profiles = {'temp': temp_c, 'dewpoint': magnitude(dew, units.degC), 'parcel': parcel_c}
+        for key, line in self.lines.items():
+            # only the enabled temperature profiles are calculated
+            line.set_data(profiles[key] if key in profiles else magnitude(params['temperatures'][key], units.degC), pres_hpa)
+
+        if self.shading:
+            # same areas as SkewT.shade_cape / shade_cin
+            cape, cin = self.shading
+            cape.set_verts(fill_betweenx_polygons(pres_hpa, parcel_c, temp_c, parcel_c > temp_c))
+            cin.set_verts(fill_betweenx_polygons(pres_hpa, parcel_c, temp_c, parcel_c < temp_c))
+
+        if functionalities['show_params']:
+            offsets = []
+            for label, (point_pres, point_temp) in params['points'].items():
+                x, y = float(magnitude(point_temp, units.degC)), float(magnitude(point_pres, units.hPa))
+                offsets.append((x, y))
+                if label not in self.point_labels:
+                    self.point_labels[label] = self.skew.ax.text(0, 0, label, c='purple', fontsize=8, zorder=5)
+                self.point_labels[label].set_position((x + 1, y))
+                self.point_labels[label].set_visible(bool(np.isfinite(x) and np.isfinite(y)))
+            self.points.set_offsets(offsets)
+
+        if wind_data is None:
+            wind_data = extract_relevant_wind_data(extracted_data, self.config)
+        barb_pres, barb_wind_u, barb_wind_v = [wind_data.get(key, 1) for key in ['pressure', 'wind_u', 'wind_v']]
+        barb_pres_hpa = magnitude(barb_pres, units.hPa)
+        if self.barbs is not None and len(self.barbs.get_offsets()) == len(barb_pres_hpa):
+            offsets = self.barbs.get_offsets()
+            self.barbs.set_offsets(np.column_stack([offsets[:, 0], barb_pres_hpa]))
+            self.barbs.set_UVC(barb_wind_u.m, barb_wind_v.m)
+        else:
+            if self.barbs is not None:
+                self.barbs.remove()
+            self.barbs = self.skew.plot_barbs(barb_pres, barb_wind_u, barb_wind_v)
+
+        # same segments and colors as Hodograph.plot_colormapped
+        u, v, c = barb_wind_u.m, barb_wind_v.m, barb_pres.m
+        valid = ~(np.isnan(u) | np.isnan(v) | np.isnan(c))
+        points = np.column_stack([u[valid], v[valid]])
+        self.hodo_trace.set_segments(np.stack([points[:-1], points[1:]], axis=1))
+        self.hodo_trace.set_array(c[valid])
+        self.hodo_trace.norm.autoscale(c[valid])
+
+        categories = {name: params[name] for name in text_categories(self.config)} if self.parameters else {}
+        if sounding_properties and self.parameters:
+            categories['sounding_properties'] = sounding_properties
+        shown = set()
+        for category_name, category_params in categories.items():
+            unit = category_layout(self.config, category_name)[5]
+            for i, (key, val) in enumerate(category_params.items(), start=1):
+                val_text = format_param_value(category_name, val, unit)
+                if category_name == 'sounding_properties' and len(val_text) >= 20:
+                    val_text = val_text[0:15] + '...' # no hover in rendered images
+                key_text, value_text = self._param_row(category_name, i)
+                key_text.set_text(f'{key}:')
+                value_text.set_text(val_text)
+                shown.add((category_name, i))
+        # rows and headlines of an earlier sounding which this one does not have
+        for row, texts in self.param_rows.items():
+            for text in texts:
+                text.set_visible(row in shown)
+        for category_name, headline in self.headlines.items():
+            headline.set_visible(category_name in categories)
+
+        self.title.set_text(title)
+
+    def render(self, extracted_data, params, sounding_properties=None, title='', wind_data=None):
+
+        '''
+        Updates the template to a sounding and draws it on the Agg canvas.
+
+        Returns
+        -------
+        np.ndarray : RGBA image of the figure, shape (height, width, 4)
+        '''
+
+        self.update(extracted_data, params, sounding_properties, title, wind_data)
+        self.draw()
+        return np.asarray(self.canvas.buffer_rgba())
+
+    def draw(self):
+
+        '''
+        Draws the current state of the template. With blitting only the data artists are drawn on top of
+        the cached background, interactive canvases are refreshed with canvas.blit.
+        '''
+
+        if not self.blit:
+            self.canvas.draw()
+            return
+
+        dynamic_artists = self._dynamic_artists()
+        for artist in dynamic_artists:
+            artist.set_animated(True) # excluded from full draws, i.e. from the cached background
+        if self._background is None:
+            self.canvas.draw() # background is cached and data artists are drawn by _on_draw
+        else:
+            self.canvas.restore_region(self._background)
+            for artist in dynamic_artists:
+                self.fig.draw_artist(artist)
+        self.canvas.blit(self.fig.bbox) # no-op on the headless Agg canvas
+
+    def _on_draw(self, event):
+        # every full draw (first render, window resize) excludes the animated data artists:
+        # cache it as the new background and draw the data artists on top
+        if not self.blit or event.canvas is not self.canvas: # e.g. savefig to a vector format
+            return
+        self._background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self._dynamic_artists():
+            self.fig.draw_artist(artist)
+
+    def savefig(self, filepath, extracted_data, params, sounding_properties=None, title='', fmt='png', wind_data=None,
+                pil_kwargs=None):
+
+        '''
+        Renders a sounding into an image file or file-like object. Raster formats use the (blitted) canvas buffer,
+        vector formats draw the updated figure completely. pil_kwargs are passed to the PNG encoder
+        (e.g. {'compress_level': 1}).
+        '''
+
+        if fmt == 'png':
+            image = self.render(extracted_data, params, sounding_properties, title, wind_data)
+            mpimg.imsave(filepath, image, format=fmt, dpi=self.fig.dpi, pil_kwargs=pil_kwargs)
+            return
+
+        self.update(extracted_data, params, sounding_properties, title, wind_data)
+        for artist in self._dynamic_artists():
+            artist.set_animated(False)
+        self.fig.savefig(filepath, format=fmt, dpi=self.fig.dpi)
@@ -0,0 +1,258 @@
+import metpy.calc as mpcalc
+import metpy.constants as mpconsts
+import numpy as np
+
+# unit-free thermodynamics on float arrays (pressure in hPa, temperature in K, mixing ratio in kg/kg),
+# following the formulas of metpy.calc, but vectorized over all levels and without pint overhead
+RD = mpconsts.Rd.m_as('J/(kg*K)')
+CP_D = mpconsts.Cp_d.m_as('J/(kg*K)')
+LV = mpconsts.Lv.m_as('J/kg')
+KAPPA = mpconsts.kappa.m_as('')
+EPSILON = mpconsts.epsilon.m_as('')
+SAT_PRESSURE_0C = mpconsts.sat_pressure_0c.m_as('hPa')
+ZERO_DEGC = 273.15
+LCL_ITERATIONS = 10
+WET_BULB_STEPS = 8
+
+# maximum absolute deviation (K) of the vectorized wet-bulb temperatures from MetPy. With 8 RK4 steps
+# the deviation is ~1e-5 K, i.e. at the tolerance of the ODE solver used by mpcalc.moist_lapse.
+WET_BULB_ATOL = 1e-4
+
+
+def saturation_vapor_pressure(temperature):
+    # Bolton (1980) as mpcalc.saturation_vapor_pressure, temperature in K, result in hPa
+    celsius = temperature - ZERO_DEGC
+    return SAT_PRESSURE_0C * np.exp(17.67 * celsius / (celsius + 243.5))
+
+
+def dewpoint_from_vapor_pressure(vapor_pressure):
+    # inverse of saturation_vapor_pressure, as mpcalc.dewpoint
+    val = np.log(vapor_pressure / SAT_PRESSURE_0C)
+    return ZERO_DEGC + 243.5 * val / (17.67 - val)
+
+
+def mixing_ratio(vapor_pressure, pressure):
+    return EPSILON * vapor_pressure / (pressure - vapor_pressure)
+
+
+def virtual_temperature(temperature, mixing_ratio):
+    return temperature * (mixing_ratio + EPSILON) / (EPSILON * (1 + mixing_ratio))
+
+
+def lcl(pressure, temperature, dewpoint):
+
+    '''
+    Function to calculate the LCL of every level at once with the fixed point iteration of mpcalc.lcl.
+
+    Parameters
+    ----------
+    pressure : float or np.ndarray : Start pressure of the parcels in hPa.
+    temperature : float or np.ndarray : Start temperature in K.
+    dewpoint : float or np.ndarray : Start dewpoint in K.
+
+    Returns
+    -------
+    tuple : LCL pressure in hPa and temperature in K, same shape as the input.
+    '''
+
+    parcel_mixing_ratio = mixing_ratio(saturation_vapor_pressure(dewpoint), pressure)
+    press_lcl, temp_lcl = pressure, dewpoint
+    for _ in range(LCL_ITERATIONS):
+        temp_lcl = dewpoint_from_vapor_pressure(press_lcl * parcel_mixing_ratio / (EPSILON + parcel_mixing_ratio))
+        press_lcl = np.minimum(pressure * (temp_lcl / temperature) ** (1 / KAPPA), pressure)
+    return press_lcl, temp_lcl
+
+
+def moist_lapse_rate(pressure, temperature):
+
+    '''
+    Function to calculate dT/dln(p) of saturated parcels along the pseudo-adiabat (the ODE of mpcalc.moist_lapse).
+    '''
+
+    saturation_mixing_ratio = mixing_ratio(saturation_vapor_pressure(temperature), pressure)
+    return ((RD * temperature + LV * saturation_mixing_ratio)
+            / (CP_D + (LV * LV * saturation_mixing_ratio * EPSILON / (RD * temperature ** 2))))
+
+
+def moist_lapse(pressure, start_pressure, start_temperature, steps=WET_BULB_STEPS):
+
+    '''
+    Function to follow the pseudo-adiabat of every parcel from its own start pressure to its own end pressure,
+    integrated with a fixed number of Runge-Kutta (RK4) steps in log pressure for all parcels at once.
+
+    Parameters
+    ----------
+    pressure : np.ndarray : End pressure of each parcel in hPa.
+    start_pressure : np.ndarray : Start pressure of each parcel in hPa.
+    start_temperature : np.ndarray : Saturated start temperature of each parcel in K.
+    steps : int : Number of RK4 steps, the error decreases with steps ** 4.
+
+    Returns
+    -------
+    np.ndarray : Temperature of each parcel at its end pressure in K.
+    '''
+
+    log_p = np.log(start_pressure)
+    step = (np.log(pressure) - log_p) / steps
+    temperature = np.array(start_temperature, dtype=float)
+    for _ in range(steps):
+        k1 = moist_lapse_rate(np.exp(log_p), temperature)
+        k2 = moist_lapse_rate(np.exp(log_p + step / 2), temperature + step / 2 * k1)
+        k3 = moist_lapse_rate(np.exp(log_p + step / 2), temperature + step / 2 * k2)
+        k4 = moist_lapse_rate(np.exp(log_p + step), temperature + step * k3)
+        temperature = temperature + step / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        log_p = log_p + step
+    return temperature
+
+
+def wet_bulb_temperature(pressure, temperature, dewpoint, steps=WET_BULB_STEPS):
+
+    '''
+    Function to calculate the wet-bulb temperature of all levels at once: every level is lifted dry to its LCL
+    and brought back moist adiabatically to its pressure, as in mpcalc.wet_bulb_temperature, but without
+    one LCL solve and one ODE solve per level.
+
+    Parameters
+    ----------
+    pressure : np.ndarray : Pressure in hPa.
+    temperature : np.ndarray : Temperature in K.
+    dewpoint : np.ndarray : Dewpoint in K.
+    steps : int : Number of RK4 steps of the moist descent.
+
+    Returns
+    -------
+    np.ndarray : Wet-bulb temperature in K.
+    '''
+
+    press_lcl, temp_lcl = lcl(pressure, temperature, dewpoint)
+    return moist_lapse(pressure, press_lcl, temp_lcl, steps)
+
+
+def wet_bulb_potential_temperature(theta_e):
+
+    '''
+    Function to calculate the wet-bulb potential temperature from the equivalent potential temperature in K
+    with the closed-form approximation of Davies-Jones (2008), as mpcalc.wet_bulb_potential_temperature,
+    reusing an already calculated θe instead of calculating it again.
+    '''
+
+    x = theta_e / 273.15
+    x2 = x * x
+    x3 = x2 * x
+    x4 = x2 * x2
+    a = 7.101574 - 20.68208 * x + 16.11182 * x2 + 2.574631 * x3 - 5.205688 * x4
+    b = 1 - 3.552497 * x + 3.781782 * x2 - 0.6899655 * x3 - 0.5929340 * x4
+    return np.where(theta_e <= 173.15, theta_e, theta_e - np.exp(a / b))
+
+
+def potential_temperature(pressure, temperature):
+    # as mpcalc.potential_temperature, reference pressure 1000 hPa
+    return temperature * (1000.0 / pressure) ** KAPPA
+
+
+def equivalent_potential_temperature(pressure, temperature, dewpoint):
+
+    '''
+    Function to calculate the equivalent potential temperature in K with the formula of Bolton (1980),
+    as mpcalc.equivalent_potential_temperature.
+    '''
+
+    vapor_pressure = saturation_vapor_pressure(dewpoint)
+    r = mixing_ratio(vapor_pressure, pressure)
+    t_l = 56 + 1. / (1. / (dewpoint - 56) + np.log(temperature / dewpoint) / 800.)
+    th_l = potential_temperature(pressure - vapor_pressure, temperature) * (temperature / t_l) ** (0.28 * r)
+    return th_l * np.exp(r * (1 + 0.448 * r) * (3036. / t_l - 1.78))
+
+
+def ccl(pressure, temperature, dewpoint):
+
+    '''
+    Function to calculate the (bottom) convective condensation level as mpcalc.ccl: the first level where the
+    line of constant mixing ratio of the surface dewpoint crosses the temperature profile from below
+    (intersection linear in log pressure).
+
+    Returns
+    -------
+    tuple(float) : CCL pressure in hPa and temperature in K, nan if the lines do not cross.
+    '''
+
+    r_start = mixing_ratio(saturation_vapor_pressure(dewpoint[0]), pressure[0])
+    rt_profile = dewpoint_from_vapor_pressure(pressure * r_start / (EPSILON + r_start))
+    diff = rt_profile - temperature
+    idx = np.flatnonzero(np.diff(np.sign(diff)))
+    idx = idx[np.sign(diff[idx + 1]) > 0] # increasing
+    if not len(idx):
+        return np.nan, np.nan
+    i = idx[0]
+    log_p = np.log(pressure)
+    x = (diff[i + 1] * log_p[i] - diff[i] * log_p[i + 1]) / (diff[i + 1] - diff[i])
+    y = (x - log_p[i]) / (log_p[i + 1] - log_p[i]) * (rt_profile[i + 1] - rt_profile[i]) + rt_profile[i]
+    return float(np.exp(x)), float(y)
+
+
+def interpolate_pressure(level, pressure, values):
+    # values at a pressure level in hPa, linear in pressure as metpy.interpolate.interpolate_1d, nan outside the sounding
+    return float(np.interp(level, pressure[::-1], values[::-1], left=np.nan, right=np.nan))
+
+
+def k_index(pressure, temperature, dewpoint):
+    # as mpcalc.k_index, result in degC
+    t850, t700, t500 = (interpolate_pressure(level, pressure, temperature) for level in (850, 700, 500))
+    td850, td700 = (interpolate_pressure(level, pressure, dewpoint) for level in (850, 700))
+    return (t850 - t500) + td850 - (t700 - td700) - ZERO_DEGC
+
+
+def total_totals_index(pressure, temperature, dewpoint):
+    # as mpcalc.total_totals_index, result in K
+    t850, t500 = (interpolate_pressure(level, pressure, temperature) for level in (850, 500))
+    return t850 + interpolate_pressure(850, pressure, dewpoint) - 2 * t500
+
+
+def showalter_parcel(t850, td850, steps=WET_BULB_STEPS):
+    # temperature in K at 500 hPa of 850 hPa parcels (floats or arrays of many soundings): dry adiabatic to the lcl,
+    # then moist adiabatic from the dry adiabat temperature at the lcl, as mpcalc.showalter_index
+    press_lcl, _ = lcl(850., t850, td850)
+    dry_lcl = t850 * (press_lcl / 850.) ** KAPPA
+    return np.where(press_lcl > 500, moist_lapse(500., press_lcl, dry_lcl, steps), t850 * (500. / 850.) ** KAPPA)
+
+
+def showalter_index(pressure, temperature, dewpoint, steps=WET_BULB_STEPS):
+    # as mpcalc.showalter_index: environment minus 850 hPa parcel at 500 hPa, result in K
+    t850, td850 = interpolate_pressure(850, pressure, temperature), interpolate_pressure(850, pressure, dewpoint)
+    return interpolate_pressure(500, pressure, temperature) - float(showalter_parcel(t850, td850, steps))
+
+
+def compare_wet_bulb_with_metpy(extracted_data, atol=WET_BULB_ATOL):
+
+    '''
+    Function to check the vectorized wet-bulb and wet-bulb potential temperatures against MetPy.
+
+    Parameters
+    ----------
+    extracted_data :  dict(pint.Quantity) :  Dict with pint.Quantity values from sounding
+    atol : float : Maximum accepted absolute deviation in K.
+
+    Returns
+    -------
+    dict : Maximum absolute deviation in K per quantity.
+
+    Raises
+    ------
+    ValueError : If any quantity deviates more than atol.
+    '''
+
+    pres, temp, dew = [extracted_data.get(key, 1) for key in ['pressure', 'temp', 'dewpoint']]
+    theta_e = mpcalc.equivalent_potential_temperature(pres, temp, dew).m_as('K')
+    pairs = {
+        'Tw': (wet_bulb_temperature(pres.m_as('hPa'), temp.m_as('K'), dew.m_as('K')),
+               mpcalc.wet_bulb_temperature(pres, temp, dew).m_as('K')),
+        '\u03B8w': (wet_bulb_potential_temperature(theta_e),
+                    mpcalc.wet_bulb_potential_temperature(pres, temp, dew).m_as('K'))
+    }
+
+    deviations = {}
+    for name, (result, reference) in pairs.items():
+        deviations[name] = float(np.nanmax(np.abs(result - reference), initial=0.0))
+        if deviations[name] > atol:
+            raise ValueError(f'{name}: deviation {deviations[name]:.2e} K exceeds {atol:.0e} K.')
+    return deviations
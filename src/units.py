@@ -0,0 +1,21 @@
+import pint
+
+# MetPy enables pint's matplotlib support while importing metpy.units, which imports matplotlib
+# even if nothing is ever plotted. The hook is skipped here and enabled by enable_matplotlib_units
+# once a display module is loaded, so compute-only use never imports matplotlib.
+_setup_matplotlib = pint.UnitRegistry.setup_matplotlib
+pint.UnitRegistry.setup_matplotlib = lambda self, enable=True: None
+try:
+    from metpy.units import units
+finally:
+    pint.UnitRegistry.setup_matplotlib = _setup_matplotlib
+
+
+def enable_matplotlib_units():
+
+    '''
+    Function to register pint's matplotlib unit converters (deferred from the metpy.units import).
+    Needs to be called before plotting pint.Quantity values, calling it repeatedly is harmless.
+    '''
+
+    units.setup_matplotlib()
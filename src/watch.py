@@ -0,0 +1,296 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+from datetime import datetime
+from datetime import timezone
+from time import perf_counter
+import hashlib
+import json
+import os
+import signal
+import time
+from .data_processing import load_json_data
+from .data_processing import collect_sounding_files
+from .data_processing import process_sounding
+from .data_processing import serialize_params
+from .cache import ParamsCache
+
+MANIFEST_FILE = 'manifest.json'
+# bump when the layout of the manifest changes, older manifests are rebuilt from scratch
+MANIFEST_VERSION = 1
+
+
+def file_hash(filepath, chunk_size=1 << 20):
+
+    '''
+    Returns the sha256 hex digest of a file's content, read in chunks.
+    '''
+
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_json_atomic(filepath, data):
+
+    '''
+    Writes JSON to a temporary file and moves it into place, so readers and restarts never see a partial file.
+    '''
+
+    tmp_file = f'{filepath}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_file, filepath)
+
+
+def _init_worker():
+    # worker processes never open windows, ctrl+c only stops the watcher, which lets running jobs finish
+    import matplotlib
+    matplotlib.use('Agg')
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def process_watched_file(filepath, config, output_dir, fmt='png', profile=None, render=True):
+
+    '''
+    Worker function of the watch mode: runs a sounding file through extract -> clean -> calc_params -> render
+    and writes the params as <name>.params.json and the image as <name>.<fmt> to the output directory.
+
+    Parameters
+    ----------
+    filepath : str : Path of the windy.com JSON sounding.
+    config : dict : Configuration dictionary.
+    output_dir : str : Directory of the results.
+    fmt : str : Image format, 'png' or 'svg'.
+    profile : str, optional : Render profile (see render_bytes).
+    render : bool : If False, only the params are written.
+
+    Returns
+    -------
+    dict : 'file', 'params' and 'image' (written files or None), 'error' (None on success), 'render_s' and
+        'duration' in seconds.
+    '''
+
+    start_time = perf_counter()
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    result = {'file': filepath, 'params': None, 'image': None, 'error': None, 'render_s': None}
+
+    # every file is isolated, a broken sounding must not stop the watcher
+    try:
+        windy_sounding = load_json_data(filepath)
+        extracted_data, params = process_sounding(windy_sounding, config, ParamsCache.from_config(config))
+        params_file = os.path.join(output_dir, f'{name}.params.json')
+        write_json_atomic(params_file, serialize_params(params))
+        result['params'] = params_file
+
+        if render:
+            from .render import render_bytes
+            image = render_bytes(extracted_data, params, config, fmt, profile,
+                                 sounding_properties=windy_sounding.get('properties'), title=f'Source: {filepath}')
+            image_file = os.path.join(output_dir, f'{name}.{fmt}')
+            with open(f'{image_file}.tmp', 'wb') as f:
+                f.write(image['data'])
+            os.replace(f'{image_file}.tmp', image_file)
+            result['image'], result['render_s'] = image_file, image['render_s']
+        params.flush()
+
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+
+    result['duration'] = perf_counter() - start_time
+    return result
+
+
+class FolderWatcher:
+
+    '''
+    Watch mode for drop directories: polls directories or glob patterns for new and changed soundings and runs
+    only those through the pipeline in a process pool (see process_watched_file). A file counts as changed if
+    its mtime or size differ from the manifest and its sha256 differs too (touched but identical files are
+    not reprocessed); files modified within the last settle_s seconds are left for the next poll, as they may
+    still be written. At most queue_size files are in the pool, further files wait on disk until a slot is
+    free (backpressure). Results and the manifest (one entry per processed file with mtime, size, hash,
+    outputs and error) are written to the output directory. The manifest is also the state of the watcher,
+    so after a restart only files which changed meanwhile are processed. Failed files are not retried until
+    they change.
+
+    Parameters
+    ----------
+    inputs : list(str) : Directories, glob patterns or file paths to watch (see collect_sounding_files).
+    config : dict : Configuration dictionary, defaults for the arguments below are taken from config['watch'].
+    output_dir : str, optional : Directory of the results and the manifest, created if missing.
+    workers : int, optional : Number of worker processes.
+    fmt : str, optional : Image format.
+    profile : str, optional : Render profile.
+    '''
+
+    def __init__(self, inputs, config, output_dir=None, workers=None, fmt=None, profile=None):
+
+        watch_config = config.get('watch', {})
+        self.inputs = inputs
+        self.config = config
+        self.output_dir = output_dir or watch_config.get('output_dir', 'output/watch')
+        self.workers = workers or watch_config.get('workers') or os.cpu_count()
+        self.fmt = fmt or watch_config.get('format', 'png')
+        self.profile = profile or watch_config.get('profile')
+        self.render = watch_config.get('render', True)
+        self.interval = watch_config.get('interval_s', 10)
+        self.settle = watch_config.get('settle_s', 2)
+        self.queue_size = watch_config.get('queue_size', 2 * self.workers)
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.manifest_file = os.path.join(self.output_dir, MANIFEST_FILE)
+        self.entries = self._load_manifest()
+        self.pending = {} # future -> (filepath, state at submission)
+        self.deferred = 0 # changed files left for a later poll (queue full or not settled)
+        self.processed = 0
+        self.failed = 0
+
+    def _load_manifest(self):
+        if not os.path.isfile(self.manifest_file):
+            return {}
+        try:
+            manifest = load_json_data(self.manifest_file)
+        except ValueError:
+            return {} # unreadable manifest: everything is processed again
+        if manifest.get('version') != MANIFEST_VERSION:
+            return {}
+        return manifest.get('files', {})
+
+    def save_manifest(self):
+
+        '''
+        Writes the manifest (atomically) to the output directory.
+        '''
+
+        write_json_atomic(self.manifest_file, {'version': MANIFEST_VERSION, 'files': self.entries})
+
+    def _is_output(self, filepath):
+        # the output directory may be inside a watched directory
+        return os.path.dirname(os.path.abspath(filepath)) == os.path.abspath(self.output_dir)
+
+    def scan(self, limit=None):
+
+        '''
+        Function to find new and changed soundings, cheap for unchanged files (one stat per file).
+        Files which are only touched get their new mtime in the manifest.
+
+        Parameters
+        ----------
+        limit : int, optional : Maximum number of files to return, the remaining changed files are counted
+            in self.deferred.
+
+        Returns
+        -------
+        list(tuple(str, dict)) : Changed files and their state (mtime, size, sha256).
+        '''
+
+        changed, self.deferred = [], 0
+        queued = {filepath for filepath, _ in self.pending.values()}
+        now = time.time()
+        for filepath in collect_sounding_files(self.inputs):
+            if filepath in queued or self._is_output(filepath):
+                continue
+            try:
+                stat = os.stat(filepath)
+            except OSError: # removed meanwhile or a pattern without matches
+                continue
+            entry = self.entries.get(filepath)
+            if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+                continue
+            if now - stat.st_mtime < self.settle:
+                self.deferred += 1
+                continue
+            if limit is not None and len(changed) >= limit:
+                self.deferred += 1
+                continue
+            state = {'mtime': stat.st_mtime, 'size': stat.st_size, 'sha256': file_hash(filepath)}
+            if entry is not None and entry['sha256'] == state['sha256']:
+                entry.update(mtime=state['mtime'], size=state['size'])
+                continue
+            changed.append((filepath, state))
+        return changed
+
+    def _collect(self, futures):
+        # store the results of finished jobs in the manifest
+        for future in futures:
+            filepath, state = self.pending.pop(future)
+            result = future.result()
+            self.entries[filepath] = dict(state, params=result['params'], image=result['image'], error=result['error'],
+                                          duration=round(result['duration'], 3),
+                                          processed=datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            if result['error'] is None:
+                self.processed += 1
+                render = f', render {result["render_s"] * 1000:.0f} ms' if result['render_s'] is not None else ''
+                print(f'{filepath} -> {result["image"] or result["params"]} [{result["duration"]:.2f} s{render}]')
+            else:
+                self.failed += 1
+                print(f'{filepath} -> FAILED ({result["error"]})')
+
+    def poll(self, executor):
+
+        '''
+        One poll: collects finished jobs, scans for changes and submits changed files while the queue has room.
+
+        Returns
+        -------
+        int : Number of submitted files.
+        '''
+
+        done = [future for future in self.pending if future.done()]
+        self._collect(done)
+        changed = self.scan(limit=self.queue_size - len(self.pending))
+        for filepath, state in changed:
+            future = executor.submit(process_watched_file, filepath, self.config, self.output_dir, self.fmt,
+                                     self.profile, self.render)
+            self.pending[future] = (filepath, state)
+        if done or changed:
+            self.save_manifest()
+        return len(changed)
+
+    def run(self, once=False):
+
+        '''
+        Function to watch the inputs until interrupted (KeyboardInterrupt), running jobs are finished and
+        the manifest is saved before returning.
+
+        Parameters
+        ----------
+        once : bool : If True, return as soon as all new and changed files are processed.
+
+        Returns
+        -------
+        dict : Numbers of processed and failed files.
+        '''
+
+        print(f'Watching {", ".join(self.inputs)} every {self.interval} s, results in {self.output_dir} '
+              f'({len(self.entries)} files in the manifest)')
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as executor:
+            try:
+                while True:
+                    self.poll(executor)
+                    if once and not self.pending and not self.deferred:
+                        break
+                    if self.pending:
+                        # wake up as soon as a slot is free, but poll at least every interval
+                        wait(list(self.pending), timeout=self.interval, return_when=FIRST_COMPLETED)
+                    else:
+                        time.sleep(min(self.interval, self.settle) if self.deferred else self.interval)
+            except KeyboardInterrupt:
+                print(f'Stopping, finishing {len(self.pending)} running jobs...')
+            self._collect(list(wait(list(self.pending)).done))
+            self.save_manifest()
+
+        print(f'Processed {self.processed} files, {self.failed} failed')
+        return {'processed': self.processed, 'failed': self.failed}
+
+
+def watch_folder(inputs, config, output_dir=None, workers=None, fmt=None, profile=None, once=False):
+
+    '''
+    Function to run the watch mode (see FolderWatcher).
+    '''
+
+    return FolderWatcher(inputs, config, output_dir, workers, fmt, profile).run(once)
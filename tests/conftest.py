@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import matplotlib
+matplotlib.use('Agg')
+
+
+def pytest_configure(config):
+    # newer numpy raises TypeError for float() of 1-element arrays, fail on the deprecation with older versions too
+    config.addinivalue_line('filterwarnings', 'error:Conversion of an array with ndim > 0 to a scalar:DeprecationWarning')
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # the config and the example sounding are loaded relative to the repository root
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture
+def config():
+    from src import load_json_data
+    config = load_json_data()
+    config['cache']['enabled'] = False
+    return config
+
+
+@pytest.fixture
+def windy_sounding(config):
+    from src import load_json_data
+    return load_json_data(config['sounding_file'])
+
+
+@pytest.fixture
+def extracted_data(windy_sounding, config):
+    from src import extract_sounding
+    return extract_sounding(windy_sounding, config)
+
+
+@pytest.fixture
+def dense_data(extracted_data):
+    # the benchmarks' high resolution sounding
+    from suite import densify
+    return densify(extracted_data, 300)
+
+
+@pytest.fixture
+def no_lfc_data(extracted_data):
+    # the example sounding dried out, the surface parcel never becomes warmer than the environment
+    from src.units import units
+    return dict(extracted_data, dewpoint=extracted_data['temp'] - 25 * units.delta_degC)
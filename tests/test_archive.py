@@ -0,0 +1,16 @@
+import json
+import numpy as np
+from src.archive import build_archive, SoundingArchive
+
+
+def test_null_coordinates(windy_sounding, tmp_path):
+    # null properties are unknown (nan) and do not abort the build
+    unknown = dict(windy_sounding, properties=dict(windy_sounding['properties'], lat=None, lon=None))
+    for key, sounding in [('known', windy_sounding), ('unknown', unknown)]:
+        with open(tmp_path / f'{key}.json', 'w') as f:
+            json.dump(sounding, f)
+    build_archive([str(tmp_path / '*.json')], str(tmp_path / 'archive'))
+    archive = SoundingArchive(str(tmp_path / 'archive'))
+    assert sorted(archive.keys()) == ['known', 'unknown']
+    assert np.isnan(archive.index['lat'][archive.row('unknown')]) and np.isnan(archive.index['lon'][archive.row('unknown')])
+    assert archive.index['lat'][archive.row('known')] == windy_sounding['properties']['lat']
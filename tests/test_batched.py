@@ -0,0 +1,13 @@
+import numpy as np
+import pytest
+
+from src import batch_calc_params, calc_params
+
+
+# the batch resamples the soundings onto its pressure grid, which moves the dense one slightly
+@pytest.mark.parametrize('sounding, atol', [('extracted_data', 1e-9), ('dense_data', 1e-3)])
+def test_batch_showalter_matches_single_sounding(sounding, atol, config, request):
+    data = request.getfixturevalue(sounding)
+    table = batch_calc_params([data], config)
+    expected = np.ravel(calc_params(data, 'vectorized', 'fast')['indices']['Showalter Index'].m_as('K'))[0]
+    assert table['Showalter Index'][0] == pytest.approx(expected, abs=atol)
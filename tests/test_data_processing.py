@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from src import load_json_data, detect_outliers, decreasing_levels
+
+
+@pytest.fixture
+def config(config):
+    # both detectors are optional and off by default
+    config['cleaning'].update(non_monotonic_pressure=True, dewpoint_above_temp=True)
+    return config
+
+
+def columns(pressure):
+    pressure = np.array(pressure, dtype=float)
+    return {'pressure': pressure, 'temp': np.linspace(293, 233, len(pressure)),
+            'dewpoint': np.linspace(283, 223, len(pressure))}
+
+
+def test_single_low_pressure_glitch_only_removes_its_row(config):
+    keep, report = detect_outliers(columns([1000, 950, 300, 900, 850, 800, 700, 600]), config)
+    assert keep.tolist() == [True, True, False, True, True, True, True, True]
+    assert report['non_monotonic_pressure'].tolist() == [2]
+
+
+def test_single_high_pressure_glitch_only_removes_its_row(config):
+    keep, _ = detect_outliers(columns([1000, 950, 900, 990, 850, 800]), config)
+    assert keep.tolist() == [True, True, True, False, True, True]
+
+
+def test_repeated_pressure_keeps_one_row():
+    assert np.count_nonzero(decreasing_levels(np.array([1000, 900, 900, 800]))) == 3
+
+
+def test_rejected_rows_do_not_affect_pressure_order(config):
+    data = columns([1000, 950, 900, 850, 800])
+    data['temp'][1], data['pressure'][1] = 500.0, 1.0 # temperature out of range, pressure out of order
+    keep, report = detect_outliers(data, config)
+    assert keep.tolist() == [True, False, True, True, True]
+    assert 'non_monotonic_pressure' not in report
+
+
+def test_dewpoint_above_temp_tolerance(config):
+    data = columns([1000, 950, 900])
+    data['dewpoint'] = data['temp'] + [0.05, 0.5, 0.0] # saturated level rounded up, real error, saturated
+    keep, report = detect_outliers(data, config)
+    assert keep.tolist() == [True, False, True]
+    assert report['dewpoint_above_temp'].tolist() == [1]
+
+
+def test_detectors_off_by_default():
+    config = load_json_data()
+    data = columns([1000, 950, 300, 900])
+    data['dewpoint'] = data['temp'] + 0.5
+    keep, report = detect_outliers(data, config)
+    assert keep.all() and report == {}
@@ -0,0 +1,28 @@
+from src.instrumentation import Instrumentation
+
+
+def test_merge_nests_worker_stages():
+    worker = Instrumentation(enabled=True)
+    with worker.stage('render_sounding_file'):
+        with worker.stage('calc_params'):
+            worker.event('clean_extracted_data', rejected=1)
+
+    parent = Instrumentation(enabled=True)
+    with parent.stage('batch'):
+        parent.merge(worker.export())
+        parent.merge(worker.export())
+
+    summary = parent.summary()
+    assert [entry['stage'] for entry in summary] == ['batch', 'batch/render_sounding_file',
+                                                     'batch/render_sounding_file/calc_params']
+    assert [entry['calls'] for entry in summary] == [1, 2, 2]
+    assert [event['stage'] for event in parent.events] == ['batch/render_sounding_file/calc_params'] * 2
+
+
+def test_merge_disabled():
+    worker = Instrumentation(enabled=True)
+    with worker.stage('render_sounding_file'):
+        pass
+    parent = Instrumentation()
+    parent.merge(worker.export())
+    assert parent.records == [] and parent.summary() == []
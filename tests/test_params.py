@@ -0,0 +1,17 @@
+import os
+
+from src import parallel_workers, compare_parallel
+
+
+def test_parallel_workers_capped_by_cores(monkeypatch):
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: {0}, raising=False)
+    assert parallel_workers(8) == 1
+    assert parallel_workers() == 1
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: {0, 1, 2, 3}, raising=False)
+    assert parallel_workers(2) == 2
+    assert parallel_workers() == 4
+
+
+def test_parallel_matches_serial(dense_data):
+    comparison = compare_parallel(dense_data, 'vectorized', 'fast', workers=2, chunk_levels=100)
+    assert comparison['max_difference'] == 0.0
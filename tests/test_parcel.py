@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from src import compare_with_metpy, compare_fast_with_metpy, FastParcelAnalysis
+from src.parcel import PARCEL_RTOL, FAST_PARCEL_ATOL
+
+
+@pytest.mark.parametrize('sounding', ['extracted_data', 'dense_data', 'no_lfc_data'])
+def test_parcel_analysis_matches_metpy(sounding, request):
+    deviations = compare_with_metpy(request.getfixturevalue(sounding))
+    assert max(deviations.values()) <= PARCEL_RTOL
+
+
+@pytest.mark.parametrize('sounding', ['extracted_data', 'dense_data', 'no_lfc_data'])
+def test_fast_parcel_analysis_matches_metpy(sounding, request):
+    deviations = compare_fast_with_metpy(request.getfixturevalue(sounding))
+    assert max(deviations.values()) <= FAST_PARCEL_ATOL
+
+
+def test_no_lfc_sounding_has_no_lfc_el_and_cape(no_lfc_data):
+    parcel = FastParcelAnalysis(*[no_lfc_data[key].m_as(unit) for key, unit in
+                                  [('pressure', 'hPa'), ('temp', 'K'), ('dewpoint', 'K')]])
+    assert np.isnan(parcel.lfc).all() and np.isnan(parcel.el).all()
+    assert parcel.cape_cin() == (0.0, 0.0)
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.server import RenderServer, RequestError
+
+
+def unprocessable(source):
+    time.sleep(0.2) # long enough for the second request to share the job
+    raise KeyError('data')
+
+
+async def request(port, head):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(head.encode('latin-1'))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status = int(response.split(b' ', 2)[1])
+    return status, json.loads(response.partition(b'\r\n\r\n')[2])
+
+
+@pytest.mark.parametrize('length', ['abc', '-3'])
+def test_invalid_content_length(config, length):
+    server = RenderServer(config, port=0, workers=1)
+
+    async def run():
+        listener = await asyncio.start_server(server._handle, server.host, 0)
+        async with listener:
+            return await request(listener.sockets[0].getsockname()[1],
+                                 f'POST /params HTTP/1.1\r\nContent-Length: {length}\r\n\r\n')
+
+    status, body = asyncio.run(run())
+    assert status == 400
+    assert 'Content-Length' in body['error']
+
+
+def test_shared_job_error(config):
+    # every request waiting for the same failing job is answered with 400, not only the first
+    server = RenderServer(config, port=0, workers=1)
+    server._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def run():
+        return await asyncio.gather(*(server._cached(('hash', 'params'), unprocessable, None) for _ in range(2)),
+                                    return_exceptions=True)
+
+    try:
+        errors = asyncio.run(run())
+    finally:
+        server.close()
+    assert server.cache_misses == 2 and not server._pending
+    assert all(isinstance(error, RequestError) and error.status == 400 for error in errors)
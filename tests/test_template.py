@@ -0,0 +1,34 @@
+import numpy as np
+
+from src import process_sounding, SoundingFigureTemplate
+
+
+def visible_texts(template):
+    return {text.get_text() for text in template.fig.texts if text.get_visible() and text.get_text()}
+
+
+def test_reused_template_shows_only_current_properties(windy_sounding, config):
+    extracted_data, params = process_sounding(windy_sounding, config)
+    first = dict(windy_sounding['properties'], extra_key_one='AAAA', extra_key_two='BBBB')
+    second = {'station_id': 'X'}
+
+    reused = SoundingFigureTemplate(config)
+    reused.render(extracted_data, params, first)
+    assert 'extra_key_one:' in visible_texts(reused)
+    image = reused.render(extracted_data, params, second)
+
+    texts = visible_texts(reused)
+    assert 'extra_key_one:' not in texts and 'AAAA' not in texts
+    assert {'station_id:', 'X'} <= texts
+    # same image as a template which never showed the first sounding
+    fresh = SoundingFigureTemplate(config)
+    assert np.array_equal(image, fresh.render(extracted_data, params, second))
+
+
+def test_reused_template_hides_properties_headline(windy_sounding, config):
+    extracted_data, params = process_sounding(windy_sounding, config)
+    reused = SoundingFigureTemplate(config)
+    reused.render(extracted_data, params, windy_sounding['properties'])
+    image = reused.render(extracted_data, params, None)
+    fresh = SoundingFigureTemplate(config)
+    assert np.array_equal(image, fresh.render(extracted_data, params, None))
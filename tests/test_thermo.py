@@ -0,0 +1,11 @@
+import pytest
+
+from src import compare_wet_bulb_with_metpy
+from src.thermo import WET_BULB_ATOL
+
+
+@pytest.mark.parametrize('sounding', ['extracted_data', 'dense_data', 'no_lfc_data'])
+def test_vectorized_wet_bulb_matches_metpy(sounding, request):
+    deviations = compare_wet_bulb_with_metpy(request.getfixturevalue(sounding))
+    assert set(deviations) == {'Tw', 'θw'}
+    assert max(deviations.values()) <= WET_BULB_ATOL